@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+自适应超时
+各脚本原来写死超时：web_search 90 秒、Messages 60 秒、Chat 30 秒、端点探测 10 秒。
+慢的中转上 30 秒经常不够，而失败的请求要等满 90 秒。
+
+这里根据 usage_log.jsonl 中最近的请求延迟，按 (端点, 模型, 工具) 建立对数分桶的延迟直方图，
+读超时取 p99 × 1.5（限制在 10-300 秒之间）；样本不足时依次退回到 (端点, 工具) 的统计和脚本原来的默认值。
+超时的请求也按当时的读超时计入样本（usage_tracker 记录，error="timeout"），
+否则直方图只含比当前超时快的请求，超时会停在真实的长尾之下、慢请求永远失败；
+计入后慢请求较多时 p99 落在超时值上，下一轮超时增大 1.5 倍，直到覆盖真实延迟。
+连接超时单独设置（NEWS_CONNECT_TIMEOUT，默认 10 秒）。
+流式请求 (stream=True) 的读超时是相邻两次读取之间的最长间隔（NEWS_IDLE_STREAM_TIMEOUT，默认 30 秒），
+长时间没有新数据才判定为超时，不限制总时长。
+
+    from adaptive_timeout import request_timeout
+
+    timeout = request_timeout("/v1/messages", data, default=90)    # (连接超时, 读超时)
+    get_session().post(url, headers=headers, json=data, timeout=timeout)
+
+用法：
+    python adaptive_timeout.py        # 查看各类请求的延迟分位数和超时
+"""
+
+import argparse
+import bisect
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_IDLE_STREAM_TIMEOUT = 30.0
+
+# 读超时 = 延迟分位数 × 系数，限制在上下限之间
+TIMEOUT_PERCENTILE = 99
+TIMEOUT_FACTOR = 1.5
+MIN_READ_TIMEOUT = 10.0
+MAX_READ_TIMEOUT = 300.0
+# 至少有这么多样本才使用统计值
+MIN_SAMPLES = 20
+# 每类请求只看最近的样本
+RECENT_SAMPLES = 500
+# 重新读取用量日志的间隔（秒）
+RELOAD_INTERVAL = 60
+
+# 直方图分桶：从 10 毫秒开始，每个桶比上一个大 10%
+BUCKET_START = 0.01
+BUCKET_RATIO = 1.1
+BUCKET_COUNT = 120
+
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图，分位数取所在桶的上界（偏保守）"""
+
+    edges = [BUCKET_START * BUCKET_RATIO ** i for i in range(BUCKET_COUNT)]
+
+    def __init__(self):
+        self.counts = [0] * (BUCKET_COUNT + 1)
+        self.total = 0
+
+    def add(self, latency):
+        self.counts[bisect.bisect_left(self.edges, latency)] += 1
+        self.total += 1
+
+    def quantile(self, percentile):
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(percentile / 100 * self.total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.edges[min(index, BUCKET_COUNT - 1)]
+        return self.edges[-1]
+
+
+def _payload_key(payload):
+    payload = payload or {}
+    tools = tuple(sorted(tool.get("type") or tool.get("name") or "" for tool in payload.get("tools", [])))
+    return payload.get("model"), tools
+
+
+class TimeoutPolicy:
+    """按端点 / 模型 / 工具统计延迟并给出超时"""
+
+    def __init__(self, entries=None):
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._histograms = {}
+        if entries is not None:
+            self._build(entries)
+            self._loaded_at = math.inf
+
+    def _build(self, entries):
+        samples = defaultdict(list)
+        for entry in entries:
+            # 续写请求只生成结尾，延迟比完整请求短，不计入
+            if entry.get("latency") is None or entry.get("continuation"):
+                continue
+            tools = tuple(sorted(entry.get("tools") or []))
+            samples[(entry.get("endpoint"), entry.get("model"), tools)].append(entry["latency"])
+            samples[(entry.get("endpoint"), None, tools)].append(entry["latency"])
+
+        histograms = {}
+        for key, latencies in samples.items():
+            histogram = LatencyHistogram()
+            for latency in latencies[-RECENT_SAMPLES:]:
+                histogram.add(latency)
+            histograms[key] = histogram
+        self._histograms = histograms
+
+    def _reload(self):
+        if time.time() - self._loaded_at < RELOAD_INTERVAL:
+            return
+        with self._lock:
+            if time.time() - self._loaded_at < RELOAD_INTERVAL:
+                return
+            from usage_tracker import load_usage
+
+            self._build(load_usage())
+            self._loaded_at = time.time()
+
+    def histogram(self, endpoint, model=None, tools=()):
+        """返回样本足够的直方图：先看 (端点, 模型, 工具)，再看 (端点, 工具)"""
+        self._reload()
+        for key in ((endpoint, model, tools), (endpoint, None, tools)):
+            histogram = self._histograms.get(key)
+            if histogram is not None and histogram.total >= MIN_SAMPLES:
+                return key, histogram
+        return None, None
+
+    def read_timeout(self, endpoint, payload=None, default=60):
+        model, tools = _payload_key(payload)
+        _, histogram = self.histogram(endpoint, model, tools)
+        if histogram is None:
+            return float(default)
+        timeout = histogram.quantile(TIMEOUT_PERCENTILE) * TIMEOUT_FACTOR
+        return round(max(MIN_READ_TIMEOUT, min(timeout, MAX_READ_TIMEOUT)), 1)
+
+    def timeout(self, endpoint, payload=None, default=60, stream=False):
+        """返回 requests 使用的 (连接超时, 读超时)"""
+        connect = float(os.environ.get("NEWS_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT))
+        if stream:
+            return connect, float(os.environ.get("NEWS_IDLE_STREAM_TIMEOUT", DEFAULT_IDLE_STREAM_TIMEOUT))
+        return connect, self.read_timeout(endpoint, payload, default)
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_timeout_policy():
+    """进程内共享的超时策略"""
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = TimeoutPolicy()
+    return _policy
+
+
+def request_timeout(endpoint, payload=None, default=60, stream=False):
+    """
+    按历史延迟为请求选择超时，返回 (连接超时, 读超时)
+    endpoint 为 "/v1/messages" 等路径，payload 为请求体（读取 model 和 tools），
+    样本不足时读超时使用 default；设置 NEWS_ADAPTIVE_TIMEOUT=0 时总是使用 default
+    """
+    if os.environ.get("NEWS_ADAPTIVE_TIMEOUT", "1") == "0":
+        connect = float(os.environ.get("NEWS_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT))
+        return connect, float(DEFAULT_IDLE_STREAM_TIMEOUT if stream else default)
+    return get_timeout_policy().timeout(endpoint, payload, default, stream)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看各类请求的延迟分位数和自适应超时")
+    parser.parse_args()
+
+    policy = get_timeout_policy()
+    policy._reload()
+    if not policy._histograms:
+        print("暂无延迟记录（usage_log.jsonl），使用各脚本的默认超时")
+        return
+
+    connect, idle = policy.timeout("/v1/messages", stream=True)
+    print(f"连接超时 {connect:g}s  流式空闲超时 {idle:g}s  "
+          f"读超时 = p{TIMEOUT_PERCENTILE} × {TIMEOUT_FACTOR}（{MIN_READ_TIMEOUT:g}-{MAX_READ_TIMEOUT:g}s，"
+          f"至少 {MIN_SAMPLES} 个样本）")
+    print("-" * 80)
+    print(f"{'端点':<22} {'模型':<30} {'工具':<20} {'样本':>5} {'p50':>7} {'p99':>7} {'读超时':>7}")
+    for (endpoint, model, tools), histogram in sorted(policy._histograms.items(), key=lambda item: str(item[0])):
+        if model is None:
+            continue
+        p50 = histogram.quantile(50)
+        p99 = histogram.quantile(TIMEOUT_PERCENTILE)
+        payload = {"model": model, "tools": [{"type": tool} for tool in tools]}
+        timeout = policy.read_timeout(endpoint, payload, default=0)
+        timeout_text = f"{timeout:.0f}s" if timeout else "默认"
+        print(f"{endpoint or '-':<22} {model or '-':<30} {','.join(tools) or '-':<20} {histogram.total:>5} "
+              f"{p50:>6.1f}s {p99:>6.1f}s {timeout_text:>7}")
+
+
+if __name__ == "__main__":
+    main()
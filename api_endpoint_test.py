@@ -3,13 +3,68 @@
 测试 API 支持的不同端点
 """
 
-import requests
+import argparse
 import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import requests
+from adaptive_timeout import request_timeout
 from config import API_KEY, API_BASE_URL
 API_BASE = API_BASE_URL
 
-def test_endpoints():
-    """测试不同的 API 端点"""
+CAPABILITIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "api_capabilities.json")
+
+# 需要测试 POST 的端点及其最小请求体
+POST_REQUESTS = {
+    "/v1/chat/completions": {
+        "model": "claude-sonnet-4-5-20250929",
+        "messages": [{"role": "user", "content": "Hello"}],
+        "max_tokens": 50
+    },
+    "/v1/completions": {
+        "model": "claude-sonnet-4-5-20250929",
+        "prompt": "Hello",
+        "max_tokens": 50
+    },
+    "/v1/messages": {
+        "model": "claude-sonnet-4-5-20250929",
+        "max_tokens": 50,
+        "messages": [{"role": "user", "content": "Hello"}]
+    }
+}
+
+def _probe(session, endpoint, method, auth, headers, timeout):
+    """发送单个探测请求，返回 (状态码, 延迟, 附加信息)"""
+    url = f"{API_BASE}{endpoint}"
+    started = time.monotonic()
+
+    if method == "GET":
+        response = session.get(url, headers=headers, timeout=timeout)
+    else:
+        response = session.post(url, headers=headers, json=POST_REQUESTS[endpoint], timeout=timeout)
+
+    latency = time.monotonic() - started
+    detail = ""
+    if response.status_code == 200 and method == "GET":
+        try:
+            data = response.json()
+            if "data" in data and data["data"]:
+                detail = f"数据条数: {len(data['data'])}"
+            else:
+                detail = f"响应: {json.dumps(data, ensure_ascii=False)[:100]}"
+        except ValueError:
+            detail = "非 JSON 响应"
+    elif response.status_code != 200:
+        detail = response.text[:200]
+
+    return response.status_code, latency, detail
+
+def test_endpoints(deadline=30, output_file=CAPABILITIES_FILE):
+    """并发测试不同的 API 端点，在总时限内汇总为能力矩阵"""
 
     # 要测试的端点
     endpoints = [
@@ -33,70 +88,100 @@ def test_endpoints():
         "content-type": "application/json"
     }
 
+    auth_styles = [("OpenAI", headers_base), ("Anthropic", headers_anthropic)]
+
+    probes = []
+    for endpoint in endpoints:
+        for auth, headers in auth_styles:
+            probes.append((endpoint, "GET", auth, headers, request_timeout(endpoint, default=10)))
+            # POST 测试 - 仅对某些端点
+            if endpoint in POST_REQUESTS:
+                probes.append((endpoint, "POST", auth, headers,
+                               request_timeout(endpoint, POST_REQUESTS[endpoint], default=30)))
+
     print("测试各种 API 端点...")
     print(f"API Base: {API_BASE}")
+    print(f"并发探测 {len(probes)} 项，总时限 {deadline} 秒")
     print("=" * 80)
 
-    for endpoint in endpoints:
-        url = f"{API_BASE}{endpoint}"
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=len(probes))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
 
-        print(f"\n测试 GET 请求: {endpoint}")
-        try:
-            response = requests.get(url, headers=headers_base, timeout=10)
-            print(f"  GET 状态码: {response.status_code}")
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    if "data" in data and data["data"]:
-                        print(f"  GET 支持: ✅")
-                        print(f"  数据条数: {len(data['data'])}")
-                    else:
-                        print(f"  GET 支持: ✅")
-                        print(f"  响应: {json.dumps(data, ensure_ascii=False)[:100]}")
-                except:
-                    print(f"  GET 支持: ✅ (非 JSON 响应)")
-            else:
-                print(f"  GET 不支持: ❌")
+    started = time.monotonic()
+    results = queue.Queue()
 
+    def run_probe(key, endpoint, method, auth, headers, timeout):
+        try:
+            results.put((key, _probe(session, endpoint, method, auth, headers, timeout), None))
         except Exception as e:
-            print(f"  GET 错误: {type(e).__name__}: {str(e)}")
-
-        # POST 测试 - 仅对某些端点
-        if endpoint in ["/v1/chat/completions", "/v1/completions", "/v1/messages"]:
-            for header_type, headers in [("OpenAI", headers_base), ("Anthropic", headers_anthropic)]:
-                print(f"\n  测试 {header_type} POST: {endpoint}")
-
-                test_request = None
-                if endpoint == "/v1/chat/completions":
-                    test_request = {
-                        "model": "claude-sonnet-4-5-20250929",
-                        "messages": [{"role": "user", "content": "Hello"}],
-                        "max_tokens": 50
-                    }
-                elif endpoint == "/v1/completions":
-                    test_request = {
-                        "model": "claude-sonnet-4-5-20250929",
-                        "prompt": "Hello",
-                        "max_tokens": 50
-                    }
-                elif endpoint == "/v1/messages":
-                    test_request = {
-                        "model": "claude-sonnet-4-5-20250929",
-                        "max_tokens": 50,
-                        "messages": [{"role": "user", "content": "Hello"}]
-                    }
-
-                if test_request:
-                    try:
-                        response = requests.post(url, headers=headers, json=test_request, timeout=30)
-                        print(f"    POST {header_type} 状态码: {response.status_code}")
-                        if response.status_code == 200:
-                            print(f"    POST {header_type} 支持: ✅")
-                        else:
-                            print(f"    POST {header_type} 失败: {response.status_code}")
-                            print(f"    错误信息: {response.text[:200]}")
-                    except Exception as e:
-                        print(f"    POST {header_type} 错误: {type(e).__name__}: {str(e)}")
+            results.put((key, None, e))
+
+    # 使用守护线程：总时限到达后不再等待未完成的探测
+    for endpoint, method, auth, headers, timeout in probes:
+        # 单个请求的超时不超过总时限
+        threading.Thread(
+            target=run_probe,
+            args=((endpoint, method, auth), endpoint, method, auth, headers,
+                  tuple(min(part, deadline) for part in timeout)),
+            daemon=True
+        ).start()
+
+    finished = {}
+    while len(finished) < len(probes):
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        try:
+            key, result, error = results.get(timeout=remaining)
+        except queue.Empty:
+            break
+        finished[key] = (result, error)
+
+    matrix = {}
+    for endpoint, method, auth, _, _ in probes:
+        entry = {"status": None, "latency": None, "supported": False}
+        result, error = finished.get((endpoint, method, auth), (None, None))
+        if result is None and error is None:
+            entry["error"] = "DeadlineExceeded"
+        elif error is not None:
+            entry["error"] = f"{type(error).__name__}: {str(error)[:200]}"
+        else:
+            status, latency, detail = result
+            entry.update(status=status, latency=round(latency, 3), supported=status == 200)
+            if detail:
+                entry["detail"] = detail
+        matrix.setdefault(endpoint, {}).setdefault(method, {})[auth] = entry
+
+    for endpoint in endpoints:
+        print(f"\n{endpoint}")
+        for method, by_auth in sorted(matrix[endpoint].items()):
+            for auth, entry in sorted(by_auth.items()):
+                if entry["status"] is None:
+                    print(f"  {method:<5}{auth:<10} 错误: {entry['error']}")
+                    continue
+                mark = "✅" if entry["supported"] else "❌"
+                print(f"  {method:<5}{auth:<10} {mark} 状态码: {entry['status']}  延迟: {entry['latency']:.2f}s")
+                if entry.get("detail"):
+                    print(f"       {entry['detail'][:100]}")
+
+    elapsed = time.monotonic() - started
+    capabilities = {
+        "api_base": API_BASE,
+        "tested_at": datetime.now().isoformat(),
+        "deadline": deadline,
+        "elapsed": round(elapsed, 3),
+        "matrix": matrix
+    }
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(capabilities, f, indent=2, ensure_ascii=False)
+
+    print(f"\n完成 {len(finished)}/{len(probes)} 项探测，用时 {elapsed:.1f} 秒")
+    print(f"✓ 能力矩阵已保存到 {output_file}")
+
+    return capabilities
 
 def examine_supported_models(openai_only=True):
     """检查支持的模型和格式"""
@@ -124,7 +209,12 @@ def examine_supported_models(openai_only=True):
         print(f"获取模型列表失败: {e}")
 
 if __name__ == "__main__":
-    test_endpoints()
+    parser = argparse.ArgumentParser(description="测试 API 支持的不同端点")
+    parser.add_argument("--deadline", type=float, default=30, help="全部探测的总时限（秒）")
+    parser.add_argument("--output", default=CAPABILITIES_FILE, help="能力矩阵保存路径")
+    args = parser.parse_args()
+
+    test_endpoints(deadline=args.deadline, output_file=args.output)
     examine_supported_models()
 
     print("\n" + "="*80)
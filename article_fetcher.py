@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+新闻来源文章抓取
+并发抓取 web_search_tool_result 中的来源页面并提取正文：
+- 按主机限制并发数，同一主机的相邻请求之间保持礼貌间隔
+- 使用 ETag / Last-Modified 条件请求重新验证，未修改的页面返回 304，不重复下载
+- 页面按内容哈希存放在磁盘缓存中（article_cache/），相同内容只保存一份
+- 轻量正文提取：去掉脚本、导航、页眉页脚等，保留标题和正文段落
+
+请求调度使用 asyncio，HTTP 请求仍使用 requests，在线程池中执行；
+正文提取等 CPU 密集的后处理交给进程池 (postprocess.py)，--workers 0 时在线程中提取。
+
+用法：
+    python article_fetcher.py URL [URL ...]
+    python article_fetcher.py --from-archive --hours 24    # 抓取最近归档中的来源链接
+    python article_fetcher.py --mock                       # 使用本地模拟服务测试（运行两轮，第二轮全部 304）
+"""
+
+import argparse
+import asyncio
+import codecs
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ARTICLE_CACHE_DIR = "article_cache"
+INDEX_FILE = "index.json"
+
+# 每个主机的并发连接数和相邻请求的最小间隔（秒）
+PER_HOST_LIMIT = 2
+POLITENESS_DELAY = 1.0
+# 全局并发数（线程池大小）
+MAX_CONCURRENCY = 32
+# 单个页面最多读取的字节数
+MAX_BYTES = 2 * 1024 * 1024
+
+USER_AGENT = "Mozilla/5.0 (compatible; international-news-fetcher/1.0)"
+
+# 正文提取时整体跳过的标签
+SKIP_TAGS = {"script", "style", "noscript", "template", "nav", "header", "footer", "aside", "form", "iframe", "svg", "button"}
+# 作为一个段落收集文本的标签
+BLOCK_TAGS = {"p", "h1", "h2", "h3", "li", "blockquote", "pre"}
+# 少于该字数的段落（导航、按钮文字等）不计入正文
+MIN_PARAGRAPH_CHARS = 12
+
+CHARSET_PATTERN = re.compile(r"charset=[\"']?([\w-]+)", re.IGNORECASE)
+
+
+class _TextExtractor(HTMLParser):
+    """收集页面标题和正文段落"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.og_title = ""
+        self.paragraphs = []
+        self.article_paragraphs = []
+        self._skip_depth = 0
+        self._article_depth = 0
+        self._in_title = False
+        self._block = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "article":
+            self._article_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attrs = dict(attrs)
+            if attrs.get("property") == "og:title" and attrs.get("content"):
+                self.og_title = attrs["content"].strip()
+        elif tag in BLOCK_TAGS and not self._skip_depth:
+            self._flush()
+            self._block = []
+        elif tag == "br" and self._block is not None:
+            self._block.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "article":
+            self._flush()
+            self._article_depth = max(0, self._article_depth - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif self._block is not None and not self._skip_depth:
+            self._block.append(data)
+
+    def _flush(self):
+        if self._block is None:
+            return
+        text = " ".join("".join(self._block).split())
+        self._block = None
+        if len(text) >= MIN_PARAGRAPH_CHARS:
+            self.paragraphs.append(text)
+            if self._article_depth:
+                self.article_paragraphs.append(text)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _detect_charset(body, content_type):
+    """先看 Content-Type，再看页面开头的 <meta charset>，默认 utf-8"""
+    match = CHARSET_PATTERN.search(content_type) or CHARSET_PATTERN.search(body[:2048].decode("ascii", errors="ignore"))
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+def extract_main_text(html):
+    """提取页面标题和正文，返回 {"title", "text"}；有 <article> 时只取其中的段落"""
+    parser = _TextExtractor()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass
+
+    paragraphs = parser.article_paragraphs or parser.paragraphs
+    return {
+        "title": parser.og_title or " ".join(parser.title.split()),
+        "text": "\n\n".join(dict.fromkeys(paragraphs))
+    }
+
+
+class ArticleCache:
+    """
+    按内容哈希存放的页面缓存
+    index.json 记录每个 URL 的 ETag、Last-Modified、内容哈希和检查时间；
+    原始页面存放在 objects/，提取后的正文存放在 texts/，文件名为内容的 sha256
+    """
+
+    def __init__(self, cache_dir=None):
+        from state_dir import state_path
+
+        cache_dir = cache_dir or state_path(ARTICLE_CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, INDEX_FILE)
+        self.lock = threading.Lock()
+        self.index = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self.index = json.load(f)
+            except (OSError, ValueError):
+                self.index = {}
+
+    def get(self, url):
+        with self.lock:
+            return dict(self.index[url]) if url in self.index else None
+
+    def validators(self, url):
+        """条件请求头"""
+        meta = self.get(url) or {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def _object_path(self, folder, content_hash, suffix):
+        return os.path.join(self.cache_dir, folder, content_hash[:2], content_hash + suffix)
+
+    def store(self, url, body, headers, extracted):
+        """保存新下载的页面，返回索引记录"""
+        content_hash = hashlib.sha256(body).hexdigest()
+        body_path = self._object_path("objects", content_hash, ".html")
+        text_path = self._object_path("texts", content_hash, ".json")
+
+        # 内容相同的页面（包括不同 URL 指向的同一页面）只写一次
+        if not os.path.exists(body_path):
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            with open(body_path, "wb") as f:
+                f.write(body)
+        if not os.path.exists(text_path):
+            os.makedirs(os.path.dirname(text_path), exist_ok=True)
+            with open(text_path, "w", encoding="utf-8") as f:
+                json.dump(extracted, f, ensure_ascii=False)
+
+        meta = {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "content_hash": content_hash,
+            "title": extracted["title"],
+            "fetched_at": time.time(),
+            "checked_at": time.time()
+        }
+        with self.lock:
+            self.index[url] = meta
+        return dict(meta)
+
+    def touch(self, url, headers=None):
+        """页面未修改（304），更新检查时间和新的验证头"""
+        with self.lock:
+            meta = self.index[url]
+            meta["checked_at"] = time.time()
+            if headers and headers.get("ETag"):
+                meta["etag"] = headers["ETag"]
+            return dict(meta)
+
+    def load_text(self, meta):
+        try:
+            with open(self._object_path("texts", meta["content_hash"], ".json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError, KeyError):
+            return {"title": meta.get("title", ""), "text": ""}
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self.lock:
+            data = json.dumps(self.index, indent=2, ensure_ascii=False)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.index_path)
+
+
+class ArticleFetcher:
+    """按主机限流的并发文章抓取"""
+
+    def __init__(self, cache=None, per_host=PER_HOST_LIMIT, delay=POLITENESS_DELAY,
+                 concurrency=MAX_CONCURRENCY, max_age=0, timeout=15, postprocessor=None):
+        self.cache = cache or ArticleCache()
+        self.postprocessor = postprocessor
+        self.per_host = per_host
+        self.delay = delay
+        self.concurrency = concurrency
+        self.max_age = max_age
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=max(per_host, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.5",
+            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8"
+        })
+
+        self._executor = None
+        self._host_slots = {}
+        self._host_locks = {}
+        self._next_allowed = {}
+
+    def _fetch_sync(self, url):
+        """在线程池中执行的单个请求"""
+        started = time.monotonic()
+        result = {"url": url, "status": "error", "title": "", "text": "", "content_hash": None, "bytes": 0}
+
+        try:
+            response = self.session.get(url, headers=self.cache.validators(url), timeout=self.timeout, stream=True)
+            with response:
+                if response.status_code == 304 and self.cache.get(url):
+                    meta = self.cache.touch(url, response.headers)
+                    result.update(self.cache.load_text(meta), status="not_modified",
+                                  content_hash=meta["content_hash"])
+                elif response.status_code == 200:
+                    chunks = []
+                    size = 0
+                    for chunk in response.iter_content(64 * 1024):
+                        chunks.append(chunk)
+                        size += len(chunk)
+                        if size >= MAX_BYTES:
+                            break
+                    body = b"".join(chunks)[:MAX_BYTES]
+                    result["bytes"] = len(body)
+
+                    content_type = response.headers.get("Content-Type", "")
+                    if self.postprocessor is not None:
+                        processed = self.postprocessor.submit(body, content_type).result()
+                        extracted = {key: processed[key] for key in ("title", "text", "entities")}
+                    elif "html" in content_type or not content_type:
+                        extracted = extract_main_text(body.decode(_detect_charset(body, content_type), errors="replace"))
+                    else:
+                        extracted = {"title": "", "text": ""}
+
+                    meta = self.cache.store(url, body, response.headers, extracted)
+                    result.update(extracted, status="fetched", content_hash=meta["content_hash"])
+                else:
+                    result["error"] = f"HTTP {response.status_code}"
+        except requests.exceptions.RequestException as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+
+        result["elapsed"] = time.monotonic() - started
+        return result
+
+    async def _wait_politely(self, host):
+        """同一主机相邻请求之间至少间隔 delay 秒"""
+        loop = asyncio.get_running_loop()
+        async with self._host_locks.setdefault(host, asyncio.Lock()):
+            wait = self._next_allowed.get(host, 0) - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_allowed[host] = loop.time() + self.delay
+
+    async def fetch(self, url):
+        meta = self.cache.get(url)
+        if meta and self.max_age and time.time() - meta["checked_at"] < self.max_age:
+            # 最近检查过，直接使用缓存，不发请求
+            return dict(self.cache.load_text(meta), url=url, status="cached",
+                        content_hash=meta["content_hash"], bytes=0, elapsed=0.0)
+
+        host = urlsplit(url).netloc.lower()
+        slots = self._host_slots.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with slots:
+            await self._wait_politely(host)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._fetch_sync, url)
+
+    async def fetch_all(self, urls):
+        """并发抓取所有 URL（自动去重），返回结果列表"""
+        urls = [url for url in dict.fromkeys(urls) if urlsplit(url).scheme in ("http", "https")]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            self._executor = executor
+            results = await asyncio.gather(*(self.fetch(url) for url in urls))
+        self.cache.save()
+        return results
+
+
+def fetch_articles(urls, workers=0, **options):
+    """同步调用入口，workers > 0 时使用多进程后处理，其他参数同 ArticleFetcher"""
+    if workers <= 0:
+        return asyncio.run(ArticleFetcher(**options).fetch_all(urls))
+
+    from postprocess import PostProcessPool
+
+    with PostProcessPool(workers=workers, signatures=False) as pool:
+        return asyncio.run(ArticleFetcher(postprocessor=pool, **options).fetch_all(urls))
+
+
+def collect_archive_urls(hours=24):
+    """收集最近 N 小时归档中的来源链接"""
+    from news_archive import iter_digests
+
+    urls = []
+    for digest in iter_digests(since=datetime.now() - timedelta(hours=hours)):
+        urls.extend(result.get("url") for result in digest.get("search_results", []) if result.get("url"))
+        for record in digest.get("records", []):
+            urls.extend(record.get("source_urls", []))
+    return list(dict.fromkeys(urls))
+
+
+def print_summary(results, elapsed):
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    downloaded = sum(result.get("bytes", 0) for result in results)
+
+    print(f"页面 {len(results)} 个，耗时 {elapsed:.1f}s：下载 {counts.get('fetched', 0)}  "
+          f"未修改 {counts.get('not_modified', 0)}  使用缓存 {counts.get('cached', 0)}  "
+          f"失败 {counts.get('error', 0)}  （下载 {downloaded / 1024:.1f} KB）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="新闻来源文章抓取")
+    parser.add_argument("urls", nargs="*", help="要抓取的 URL")
+    parser.add_argument("--from-archive", action="store_true", help="抓取最近归档中的来源链接")
+    parser.add_argument("--hours", type=float, default=24, help="与 --from-archive 一起使用，最近 N 小时")
+    parser.add_argument("--per-host", type=int, default=PER_HOST_LIMIT, help="每个主机的并发连接数")
+    parser.add_argument("--delay", type=float, default=POLITENESS_DELAY, help="同一主机相邻请求的间隔（秒）")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY, help="全局并发数")
+    parser.add_argument("--max-age", type=float, default=0, help="N 秒内检查过的页面直接使用缓存")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="后处理子进程数，0 表示在线程中提取正文")
+    parser.add_argument("--show", type=int, default=0, help="显示前 N 篇文章的正文摘要")
+    parser.add_argument("--mock", action="store_true", help="抓取本地模拟服务的文章页面")
+    args = parser.parse_args()
+
+    urls = list(args.urls)
+    if args.from_archive:
+        urls.extend(collect_archive_urls(args.hours))
+
+    rounds = 1
+    if args.mock:
+        from mock_server import start_mock_server, MOCK_NEWS
+
+        _, base_url = start_mock_server(latency=0.05)
+        urls.extend(f"{base_url}/articles/{url.rsplit('/', 1)[-1]}" for _, _, url in MOCK_NEWS)
+        rounds = 2
+
+    if not urls:
+        parser.error("没有要抓取的 URL")
+
+    for round_number in range(1, rounds + 1):
+        if rounds > 1:
+            print(f"\n第 {round_number} 轮")
+        started = time.monotonic()
+        results = fetch_articles(urls, per_host=args.per_host, delay=args.delay,
+                                 concurrency=args.concurrency, max_age=args.max_age, workers=args.workers)
+        print_summary(results, time.monotonic() - started)
+
+    for result in results:
+        if result["status"] == "error":
+            print(f"  ❌ {result['url']}  {result['error']}")
+
+    for result in [r for r in results if r["text"]][:args.show]:
+        print("\n" + "-" * 80)
+        print(f"{result['title']}\n{result['url']}")
+        if result.get("entities"):
+            print(f"涉及: {'、'.join(result['entities'])}")
+        print()
+        print(result["text"][:500])
+
+
+if __name__ == "__main__":
+    main()
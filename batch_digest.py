@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Message Batches 批量获取新闻
+适合夜间的地区新闻汇总：不要求实时返回，但需要高吞吐和低费用。
+把多个 /v1/messages 请求（get_news_with_web_search 的 web_search 请求、get_news_messages 的知识库请求）
+打包为一个 Message Batch 提交，按指数退避轮询处理状态，
+结束后流式下载结果文件，每解析出一条结果就立即写入归档。
+
+用法：
+    python batch_digest.py                          # 使用默认的地区查询
+    python batch_digest.py --queries-file q.txt     # 每行一个查询
+    python batch_digest.py --knowledge              # 额外加入一个知识库请求
+    python batch_digest.py --resume msgbatch_xxx    # 继续轮询已提交的批次
+    python batch_digest.py --mock                   # 使用本地模拟服务
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import requests
+
+BATCH_STATE_FILE = "batch_state.json"
+
+DEFAULT_QUERIES = [
+    "最新5条亚洲重要新闻",
+    "最新5条欧洲重要新闻",
+    "最新5条美洲重要新闻",
+    "最新5条中东重要新闻",
+    "最新5条非洲重要新闻",
+    "最新5条国际经济重要新闻",
+    "最新5条国际科技重要新闻"
+]
+
+# 轮询间隔：从 5 秒开始，每次乘以 1.5，最长 60 秒
+POLL_INITIAL = 5.0
+POLL_FACTOR = 1.5
+POLL_MAX = 60.0
+
+# 下载结果时每归档这么多条或间隔这么久（秒）保存一次已归档的 custom_id
+STATE_SAVE_EVERY = 20
+STATE_SAVE_INTERVAL = 5.0
+
+
+def anthropic_headers():
+    from config import API_KEY
+
+    return {
+        "x-api-key": API_KEY,
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json"
+    }
+
+
+def load_state():
+    from state_dir import state_path
+
+    path = state_path(BATCH_STATE_FILE)
+    if not os.path.exists(path):
+        return {"batches": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state):
+    from state_dir import state_path
+
+    path = state_path(BATCH_STATE_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def build_batch_requests(queries, include_knowledge=False):
+    """把查询打包为 Message Batch 请求，返回 (请求列表, custom_id -> 查询信息)"""
+    from get_news_with_websearch_final import build_web_search_payload
+
+    batch_requests = []
+    mapping = {}
+
+    for i, query in enumerate(queries, 1):
+        custom_id = f"websearch-{i:04d}"
+        batch_requests.append({"custom_id": custom_id, "params": build_web_search_payload(query)})
+        mapping[custom_id] = {"query": query, "kind": "websearch"}
+
+    if include_knowledge:
+        from get_news_final import build_messages_payload
+
+        batch_requests.append({"custom_id": "knowledge-0001", "params": build_messages_payload()})
+        mapping["knowledge-0001"] = {"query": "知识库国际新闻", "kind": "knowledge"}
+
+    return batch_requests, mapping
+
+
+def create_batch(batch_requests):
+    """提交 Message Batch，返回批次信息"""
+    from adaptive_timeout import request_timeout
+    from config import API_BASE_URL
+    from http_client import get_session
+
+    response = get_session().post(
+        f"{API_BASE_URL}/v1/messages/batches",
+        headers=anthropic_headers(),
+        json={"requests": batch_requests},
+        timeout=request_timeout("/v1/messages/batches", default=60)
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"提交批次失败: {response.status_code} {response.text[:300]}")
+    return response.json()
+
+
+def poll_batch(batch_id, max_wait=24 * 3600):
+    """按指数退避轮询批次状态，直到处理结束，返回最终的批次信息"""
+    from adaptive_timeout import request_timeout
+    from config import API_BASE_URL
+    from http_client import get_session
+
+    url = f"{API_BASE_URL}/v1/messages/batches/{batch_id}"
+    started = time.monotonic()
+    interval = POLL_INITIAL
+    last_counts = None
+
+    while True:
+        try:
+            response = get_session().get(url, headers=anthropic_headers(),
+                                         timeout=request_timeout("/v1/messages/batches", default=30))
+            if response.status_code == 200:
+                batch = response.json()
+                counts = batch.get("request_counts", {})
+                if counts != last_counts:
+                    print(f"  [{datetime.now().strftime('%H:%M:%S')}] {batch.get('processing_status')}  "
+                          f"处理中 {counts.get('processing', 0)}  成功 {counts.get('succeeded', 0)}  "
+                          f"失败 {counts.get('errored', 0)}  过期 {counts.get('expired', 0)}")
+                    last_counts = counts
+                    # 有进展时缩短间隔，尽快发现结束
+                    interval = POLL_INITIAL
+
+                if batch.get("processing_status") == "ended":
+                    return batch
+            elif response.status_code in (429, 500, 502, 503, 504, 529):
+                print(f"  ⚠️  轮询返回 {response.status_code}，稍后重试")
+            else:
+                raise RuntimeError(f"查询批次失败: {response.status_code} {response.text[:300]}")
+        except requests.exceptions.RequestException as e:
+            print(f"  ⚠️  轮询出错，稍后重试: {type(e).__name__}: {e}")
+
+        if time.monotonic() - started > max_wait:
+            raise TimeoutError(f"批次 {batch_id} 在 {max_wait} 秒内没有完成")
+
+        # 加入随机抖动，避免多个任务同时轮询
+        time.sleep(interval * random.uniform(0.8, 1.2))
+        interval = min(interval * POLL_FACTOR, POLL_MAX)
+
+
+def stream_results(batch, mapping, state=None):
+    """流式下载批次结果，每解析出一行就写入归档，返回各类结果的数量
+
+    已归档的 custom_id 记录在 state 的批次条目里，每归档 STATE_SAVE_EVERY 条或间隔 STATE_SAVE_INTERVAL 秒落盘一次，
+    下载结束或出错时也会落盘；--resume 或重新下载时跳过这些结果。
+    进程被强制终止时最多有最近一次落盘之后的几条结果会被重复归档。
+    """
+    from adaptive_timeout import request_timeout
+    from config import API_BASE_URL
+    from http_client import get_session
+    from news_archive import save_digest
+
+    url = batch.get("results_url") or f"{API_BASE_URL}/v1/messages/batches/{batch['id']}/results"
+    counts = {"succeeded": 0, "errored": 0, "canceled": 0, "expired": 0, "skipped": 0}
+    entry_state = state["batches"].setdefault(batch["id"], {"mapping": mapping, "archived": False}) \
+        if state is not None else {}
+    archived_ids = set(entry_state.get("archived_ids", []))
+
+    # 结果文件可能很大，只限制两次读取之间的空闲时间，不限制下载总时长
+    response = get_session().get(url, headers=anthropic_headers(), stream=True,
+                                 timeout=request_timeout("/v1/messages/batches", stream=True))
+    if response.status_code != 200:
+        raise RuntimeError(f"下载结果失败: {response.status_code} {response.text[:300]}")
+
+    unsaved = 0
+    last_saved = time.monotonic()
+
+    def save_archived():
+        nonlocal unsaved, last_saved
+        if state is not None and unsaved:
+            entry_state["archived_ids"] = sorted(archived_ids)
+            save_state(state)
+        unsaved = 0
+        last_saved = time.monotonic()
+
+    try:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            item = json.loads(line)
+            if item["custom_id"] in archived_ids:
+                counts["skipped"] += 1
+                continue
+            result = item.get("result", {})
+            result_type = result.get("type", "errored")
+            counts[result_type] = counts.get(result_type, 0) + 1
+
+            info = mapping.get(item["custom_id"], {"query": item["custom_id"], "kind": "unknown"})
+            if result_type == "succeeded":
+                entry = save_digest(info["query"], result["message"], source=f"batch-{info['kind']}",
+                                    batch_id=batch["id"], custom_id=item["custom_id"])
+                print(f"  ✓ {item['custom_id']}  {info['query']}  ->  归档 {entry['id']}")
+                archived_ids.add(item["custom_id"])
+                unsaved += 1
+                if unsaved >= STATE_SAVE_EVERY or time.monotonic() - last_saved >= STATE_SAVE_INTERVAL:
+                    save_archived()
+            else:
+                error = result.get("error", {})
+                print(f"  ❌ {item['custom_id']}  {info['query']}  {result_type}: "
+                      f"{json.dumps(error, ensure_ascii=False)[:200]}")
+    finally:
+        save_archived()
+
+    return counts
+
+
+def run_batch(queries=None, include_knowledge=False, resume=None, max_wait=24 * 3600):
+    """提交（或继续）一个批次，等待完成并归档结果"""
+    state = load_state()
+
+    if resume:
+        if resume not in state["batches"]:
+            print(f"⚠️  本地没有批次 {resume} 的记录，结果将按 custom_id 归档")
+        batch_id = resume
+        mapping = state["batches"].get(resume, {}).get("mapping", {})
+    else:
+        batch_requests, mapping = build_batch_requests(queries or DEFAULT_QUERIES, include_knowledge)
+        print(f"提交批次: {len(batch_requests)} 个请求")
+        batch = create_batch(batch_requests)
+        batch_id = batch["id"]
+
+        state["batches"][batch_id] = {
+            "created_at": datetime.now().isoformat(),
+            "mapping": mapping,
+            "archived": False
+        }
+        save_state(state)
+        print(f"✓ 批次已提交: {batch_id}")
+        print(f"  中断后可以继续: python batch_digest.py --resume {batch_id}")
+
+    print("\n等待批次处理...")
+    batch = poll_batch(batch_id, max_wait=max_wait)
+
+    print("\n下载结果并归档...")
+    counts = stream_results(batch, mapping, state)
+
+    state["batches"][batch_id]["archived"] = True
+    state["batches"][batch_id]["counts"] = counts
+    save_state(state)
+
+    print("\n" + "=" * 80)
+    print(f"批次 {batch_id} 完成: 成功 {counts['succeeded']}  失败 {counts['errored']}  "
+          f"取消 {counts['canceled']}  过期 {counts['expired']}")
+    if counts["skipped"]:
+        print(f"  跳过之前已归档的 {counts['skipped']} 条结果")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Message Batches 批量获取新闻")
+    parser.add_argument("--queries-file", help="查询文件，每行一个查询")
+    parser.add_argument("--knowledge", action="store_true", help="额外加入一个知识库请求 (get_news_messages)")
+    parser.add_argument("--resume", metavar="BATCH_ID", help="继续轮询已提交的批次")
+    parser.add_argument("--max-wait", type=float, default=24 * 3600, help="最长等待时间（秒）")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟服务")
+    args = parser.parse_args()
+
+    if args.mock:
+        from mock_server import start_mock_server
+
+        _, base_url = start_mock_server(batch_latency=8)
+        os.environ["API_BASE_URL"] = base_url
+        os.environ.setdefault("API_KEY", "mock-key")
+        global POLL_INITIAL
+        POLL_INITIAL = 1.0
+
+    queries = None
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    print("=" * 80)
+    print("Message Batches 批量获取新闻")
+    print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 80 + "\n")
+
+    from scheduler import request_priority
+
+    try:
+        # 批量任务不需要实时返回，不与交互式请求争抢名额
+        with request_priority("background", tenant="batch"):
+            run_batch(queries, include_knowledge=args.knowledge, resume=args.resume, max_wait=args.max_wait)
+    except (RuntimeError, TimeoutError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+可续跑的批量查询
+从 JSONL 文件读取查询，通过共享会话（调度器、合并相同请求、多密钥轮换）并发执行，
+每完成一个就追加一行到输出 JSONL；进度定期原子地写入检查点。
+崩溃或 Ctrl-C 后用同样的命令重新运行，已完成的查询不会再次请求。
+
+输入每行一个 JSON 对象（或 JSON 字符串，等同于 {"query": ...}）：
+    {"id": "asia-1", "query": "最新5条亚洲重要新闻"}
+    {"query": "日本最新新闻", "mode": "knowledge"}
+    id 省略时使用行号；mode 为 websearch（默认）或 knowledge，其余字段原样写入输出
+
+输出每行一个结果：
+    {"id", "query", "status": "ok" | "error", "attempt", "text", "search_results", "model", "usage", "latency", "source", ...}
+    失败的查询在下次运行时重试（--max-attempts 次后不再重试）；同一 id 出现多次时以最后一行为准
+
+检查点 (<输出>.checkpoint.json) 记录输入文件的指纹、已写入输出的字节数和每个 id 的状态；
+恢复时从该位置往后扫描输出文件，补上检查点之后写入的结果，并截掉崩溃时写了一半的行；
+输出文件比检查点记录的短时说明检查点已损坏，需要 --restart。
+
+用法：
+    python batch_runner.py queries.jsonl                       # 结果写入 queries.results.jsonl
+    python batch_runner.py queries.jsonl -o out.jsonl --workers 16
+    python batch_runner.py queries.jsonl --restart             # 丢弃检查点和输出，从头开始
+    python batch_runner.py queries.jsonl --mock
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+
+DEFAULT_WORKERS = 8
+MODES = ("websearch", "knowledge")
+# 每完成这么多个查询或间隔这么久（秒）写一次检查点
+CHECKPOINT_EVERY = 50
+CHECKPOINT_INTERVAL = 5.0
+# 同一查询（跨多次运行）最多请求的次数
+DEFAULT_MAX_ATTEMPTS = 3
+# 知识库模式每个请求的截止时间（秒）
+KNOWLEDGE_DEADLINE = 60
+
+
+def file_fingerprint(path):
+    """输入文件的指纹，检测续跑时输入是否被修改"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def read_jobs(path):
+    """读取输入 JSONL，返回 [job]；每个 job 至少有 id、query、mode"""
+    jobs = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path} 第 {line_number} 行不是合法的 JSON: {e}")
+            if isinstance(job, str):
+                job = {"query": job}
+            if not isinstance(job, dict) or not str(job.get("query", "")).strip():
+                raise ValueError(f"{path} 第 {line_number} 行缺少 query")
+            job["id"] = str(job.get("id", line_number))
+            job.setdefault("mode", "websearch")
+            if job["mode"] not in MODES:
+                raise ValueError(f"{path} 第 {line_number} 行: 未知的 mode {job['mode']}（可选 {', '.join(MODES)}）")
+            if job["id"] in seen:
+                raise ValueError(f"{path} 第 {line_number} 行: id {job['id']} 重复")
+            seen.add(job["id"])
+            jobs.append(job)
+    return jobs
+
+
+class Checkpoint:
+    """
+    批量任务的进度
+    jobs: {id: {"status": "ok" | "error", "attempts": n}}；offset 为检查点写入时输出文件中已确认的字节数
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.input_fingerprint = None
+        self.offset = 0
+        self.jobs = {}
+        self.started_at = time.time()
+
+    @classmethod
+    def load(cls, path):
+        checkpoint = cls(path)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            checkpoint.input_fingerprint = data.get("input_fingerprint")
+            checkpoint.offset = data.get("offset", 0)
+            checkpoint.jobs = data.get("jobs", {})
+            checkpoint.started_at = data.get("started_at", checkpoint.started_at)
+        return checkpoint
+
+    def attempts(self, job_id):
+        return self.jobs.get(job_id, {}).get("attempts", 0)
+
+    def record(self, job_id, status, attempt):
+        """记录第 attempt 次请求的结果；同一次请求重复记录（恢复时重新扫描）不会重复计数"""
+        state = self.jobs.setdefault(job_id, {"status": status, "attempts": 0})
+        if attempt >= state["attempts"]:
+            state["status"] = status
+            state["attempts"] = attempt
+
+    def is_done(self, job_id, max_attempts):
+        state = self.jobs.get(job_id)
+        if state is None:
+            return False
+        return state["status"] == "ok" or state["attempts"] >= max_attempts
+
+    def save(self):
+        data = {
+            "input_fingerprint": self.input_fingerprint,
+            "offset": self.offset,
+            "started_at": self.started_at,
+            "updated_at": time.time(),
+            "jobs": self.jobs
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def recover_output(output_path, checkpoint):
+    """
+    扫描输出文件中检查点之后写入的结果并计入检查点，截掉末尾写了一半的行
+    返回补上的结果数
+    """
+    size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+    if checkpoint.offset > size:
+        # 输出文件比检查点记录的短（被替换、截断或删除过），检查点中的状态已无法对应到输出
+        raise ValueError(f"检查点记录的输出位置 {checkpoint.offset} 超过输出文件大小 {size}，"
+                         f"检查点已损坏，请使用 --restart 从头开始（或换一个输出文件）")
+    if not os.path.exists(output_path):
+        return 0
+
+    recovered = 0
+    with open(output_path, "rb+") as f:
+        f.seek(checkpoint.offset)
+        position = checkpoint.offset
+        for line in iter(f.readline, b""):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("incomplete line")
+                result = json.loads(line)
+            except ValueError:
+                # 崩溃时写了一半的行：截掉，对应的查询会重新请求
+                f.truncate(position)
+                print(f"⚠️  输出文件末尾有不完整的行，已截掉 {size - position} 字节")
+                break
+            checkpoint.record(result["id"], result["status"],
+                              result.get("attempt", checkpoint.attempts(result["id"]) + 1))
+            position += len(line)
+            recovered += 1
+    checkpoint.offset = position
+    return recovered
+
+
+def run_job(job, use_cache=True):
+    """执行一个查询，返回输出行（dict）；失败时 status 为 error"""
+    from news_archive import extract_digest
+    from query_cache import get_query_cache
+    from scheduler import request_priority
+    from usage_tracker import normalize_usage
+
+    started = time.monotonic()
+    output = {key: value for key, value in job.items() if key not in ("id", "query", "mode")}
+    output.update({"id": job["id"], "query": job["query"], "mode": job["mode"]})
+
+    # 优先级保存在 contextvar 中，线程池的线程不会继承，需要在线程内设置
+    with request_priority("background", tenant="batch"):
+        try:
+            cache = get_query_cache()
+            hit = cache.lookup(job["query"]) if use_cache and job["mode"] == "websearch" else None
+            if hit:
+                result, source = hit["result"], "cache"
+            elif job["mode"] == "websearch":
+                from get_news_with_websearch_final import fetch_web_search_result
+
+                result, source = fetch_web_search_result(job["query"]), "websearch"
+                cache.store(job["query"], result, source="batch")
+            else:
+                from deadline import Deadline
+                from get_news_with_websearch import fetch_knowledge_result
+
+                result, source = fetch_knowledge_result(job["query"], Deadline(KNOWLEDGE_DEADLINE)), "knowledge"
+
+            digest = extract_digest(result)
+            if not digest["text"]:
+                raise RuntimeError("响应中没有文本内容")
+        except Exception as e:
+            # 任何异常（例如响应不是 JSON、缺少字段）都只让这一个查询失败，不中断整个批次
+            output.update({"status": "error", "error": f"{type(e).__name__}: {e}", "latency": round(time.monotonic() - started, 3)})
+            return output
+
+    output.update({
+        "status": "ok",
+        "source": source,
+        "text": digest["text"],
+        "search_results": digest["search_results"],
+        "model": digest["model"],
+        "usage": normalize_usage(digest["usage"]) if source != "cache" else None,
+        "latency": round(time.monotonic() - started, 3)
+    })
+    return output
+
+
+def run_batch(input_path, output_path=None, workers=DEFAULT_WORKERS, max_attempts=DEFAULT_MAX_ATTEMPTS,
+              use_cache=True, restart=False):
+    """
+    执行批量任务（可续跑），返回统计 {"total", "ok", "error", "skipped", "interrupted"}
+    """
+    output_path = output_path or f"{os.path.splitext(input_path)[0]}.results.jsonl"
+    checkpoint_path = f"{output_path}.checkpoint.json"
+
+    jobs = read_jobs(input_path)
+    fingerprint = file_fingerprint(input_path)
+
+    if restart:
+        for path in (output_path, checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+    checkpoint = Checkpoint.load(checkpoint_path)
+    if checkpoint.input_fingerprint and checkpoint.input_fingerprint != fingerprint:
+        raise ValueError("输入文件在上次运行后被修改，请使用 --restart 从头开始（或换一个输出文件）")
+    checkpoint.input_fingerprint = fingerprint
+
+    recovered = recover_output(output_path, checkpoint)
+    if recovered:
+        print(f"♻️  从输出文件补上检查点之后完成的 {recovered} 个结果")
+
+    pending = [job for job in jobs if not checkpoint.is_done(job["id"], max_attempts)]
+    skipped = len(jobs) - len(pending)
+    print(f"共 {len(jobs)} 个查询，已完成 {skipped} 个，本次执行 {len(pending)} 个（并发 {workers}）")
+    print(f"输出: {output_path}")
+    checkpoint.save()
+
+    stats = {"total": len(jobs), "ok": 0, "error": 0, "skipped": skipped, "interrupted": False}
+    if not pending:
+        return stats
+
+    started = time.monotonic()
+    last_saved = time.monotonic()
+    unsaved = 0
+
+    # recover_output 已截掉不完整的行，追加的位置就是检查点记录的位置
+    out = open(output_path, "ab")
+
+    def write_result(output):
+        nonlocal unsaved, last_saved
+        # 每个查询在一次运行中只执行一次，这是它的第 attempts + 1 次请求；写入输出，恢复时按它记录
+        output["attempt"] = checkpoint.attempts(output["id"]) + 1
+        out.write((json.dumps(output, ensure_ascii=False) + "\n").encode("utf-8"))
+        out.flush()
+        checkpoint.record(output["id"], output["status"], output["attempt"])
+        stats[output["status"]] += 1
+        unsaved += 1
+        if unsaved >= CHECKPOINT_EVERY or time.monotonic() - last_saved >= CHECKPOINT_INTERVAL:
+            save_checkpoint()
+
+    def save_checkpoint():
+        nonlocal unsaved, last_saved
+        # 输出先落盘，检查点记录的位置之前的内容才是可靠的
+        os.fsync(out.fileno())
+        checkpoint.offset = out.tell()
+        checkpoint.save()
+        unsaved = 0
+        last_saved = time.monotonic()
+        done = stats["ok"] + stats["error"]
+        rate = done / (time.monotonic() - started)
+        eta = (len(pending) - done) / rate if rate else 0
+        print(f"  [{done}/{len(pending)}] 成功 {stats['ok']}，失败 {stats['error']}，"
+              f"{rate:.1f} 个/秒，预计还需 {eta / 60:.1f} 分钟")
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    in_flight = set()
+    try:
+        try:
+            # 只提交并发数两倍的任务，Ctrl-C 时没有大量已排队的任务需要取消
+            for job in pending:
+                in_flight.add(executor.submit(run_job, job, use_cache))
+                if len(in_flight) < workers * 2:
+                    continue
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.discard(future)
+                    write_result(future.result())
+            for future in as_completed(list(in_flight)):
+                in_flight.discard(future)
+                write_result(future.result())
+        except KeyboardInterrupt:
+            stats["interrupted"] = True
+            for future in in_flight:
+                future.cancel()
+            running = [future for future in in_flight if not future.cancelled()]
+            in_flight.clear()
+            print(f"\n⏸️  已中断，等待进行中的 {len(running)} 个请求完成（再按 Ctrl-C 直接退出，这些查询下次重新请求）")
+            try:
+                for future in running:
+                    write_result(future.result())
+            except KeyboardInterrupt:
+                pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        save_checkpoint()
+        out.close()
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="可续跑的批量查询（JSONL 输入输出）")
+    parser.add_argument("input", help="输入 JSONL 文件，每行一个查询")
+    parser.add_argument("-o", "--output", help="输出 JSONL 文件（默认 <输入>.results.jsonl）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="并发请求数")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="失败的查询最多请求几次（跨多次运行）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用查询缓存")
+    parser.add_argument("--restart", action="store_true", help="丢弃已有的检查点和输出，从头开始")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟服务")
+    args = parser.parse_args()
+
+    if args.mock:
+        from mock_server import start_mock_server
+
+        _, base_url = start_mock_server()
+        os.environ["API_BASE_URL"] = base_url
+        os.environ.setdefault("API_KEY", "mock-key")
+
+    try:
+        stats = run_batch(args.input, args.output, workers=args.workers, max_attempts=args.max_attempts,
+                          use_cache=not args.no_cache, restart=args.restart)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print("=" * 80)
+    print(f"本次成功 {stats['ok']}，失败 {stats['error']}，之前已完成 {stats['skipped']}，共 {stats['total']} 个查询")
+    if stats["interrupted"]:
+        print("⏸️  任务未完成，重新运行同样的命令即可继续")
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+请求录制 / 回放 (cassette)
+录制模式把真实的请求/响应对（请求头、响应头、压缩后的原始字节、首字节时间和分块时间）
+保存到 cassette 文件；回放模式完全不访问网络，直接用 cassette 中的数据构造响应，
+可以按原始的分块时间节奏回放，也可以全速回放，方便反复分析解析、归档和输出环节的性能。
+
+用法：
+    NEWS_CASSETTE=cassettes/websearch.json NEWS_CASSETTE_MODE=record python get_news_with_websearch_final.py
+    NEWS_CASSETTE=cassettes/websearch.json NEWS_CASSETTE_MODE=replay python get_news_with_websearch_final.py
+    NEWS_CASSETTE=cassettes/websearch.json NEWS_CASSETTE_SPEED=fast python get_news_with_websearch_final.py
+
+    python cassette.py info cassettes/websearch.json
+"""
+
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3._collections import HTTPHeaderDict
+from urllib3.response import HTTPResponse
+
+CASSETTE_VERSION = 1
+CHUNK_SIZE = 8192
+
+# 录制时需要脱敏的请求头
+SENSITIVE_HEADERS = {"x-api-key", "authorization", "cookie"}
+
+# 回放时不再适用的响应头（正文已经是完整字节，不再分块传输）
+HOP_BY_HOP_HEADERS = {"transfer-encoding", "connection", "keep-alive"}
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """回放时 cassette 中没有匹配的请求"""
+
+
+def mask_secret(value):
+    """脱敏密钥，只保留前 10 位和后 4 位"""
+    if len(value) <= 14:
+        return "***"
+    return f"{value[:10]}...{value[-4:]}"
+
+
+def _mask_header(name, value):
+    if name.lower() not in SENSITIVE_HEADERS:
+        return value
+    if value.startswith("Bearer "):
+        return "Bearer " + mask_secret(value[len("Bearer "):])
+    return mask_secret(value)
+
+
+def _body_bytes(body):
+    if body is None:
+        return b""
+    if isinstance(body, str):
+        return body.encode("utf-8")
+    return bytes(body)
+
+
+def request_key(method, url, body):
+    """请求的匹配键：方法 + URL + 请求体哈希（不包含请求头，避免密钥影响匹配）"""
+    digest = hashlib.sha256(_body_bytes(body)).hexdigest()
+    return f"{method.upper()} {url} {digest}"
+
+
+class Cassette:
+    """cassette 文件：按顺序保存的请求/响应对"""
+
+    def __init__(self, path):
+        self.path = path
+        self.interactions = []
+        self._lock = threading.Lock()
+        self._pending = None
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.interactions = data.get("interactions", [])
+
+    def append(self, interaction):
+        """追加一条录制结果并立即写盘"""
+        with self._lock:
+            self.interactions.append(interaction)
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": CASSETTE_VERSION,
+                "interactions": self.interactions
+            }, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def take(self, method, url, body):
+        """取出下一条匹配的响应；同一请求多次出现时按录制顺序依次返回"""
+        with self._lock:
+            if self._pending is None:
+                self._pending = {}
+                for interaction in self.interactions:
+                    self._pending.setdefault(interaction["key"], []).append(interaction)
+
+            queue = self._pending.get(request_key(method, url, body))
+            if queue:
+                return queue.pop(0)
+
+            # 请求体不同（例如时间戳变化）时，退回到按方法 + URL 匹配
+            prefix = f"{method.upper()} {url} "
+            for key, queue in self._pending.items():
+                if key.startswith(prefix) and queue:
+                    return queue.pop(0)
+
+        raise CassetteMiss(f"cassette {self.path} 中没有匹配的请求: {method} {url}")
+
+
+class _TimedBody:
+    """回放用的响应体，可按录制时的时间节奏逐块返回"""
+
+    def __init__(self, chunks, started, realtime):
+        self._chunks = chunks
+        self._started = started
+        self._realtime = realtime
+        self._index = 0
+        self._offset = 0
+        self.closed = not chunks
+
+    def readable(self):
+        return True
+
+    def read(self, amt=None):
+        if self.closed:
+            return b""
+
+        parts = []
+        remaining = amt
+        while self._index < len(self._chunks) and (remaining is None or remaining > 0):
+            at, data = self._chunks[self._index]
+            if self._realtime and self._offset == 0:
+                delay = self._started + at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            end = len(data) if remaining is None else min(len(data), self._offset + remaining)
+            piece = data[self._offset:end]
+            parts.append(piece)
+            if remaining is not None:
+                remaining -= len(piece)
+
+            self._offset = end
+            if self._offset >= len(data):
+                self._index += 1
+                self._offset = 0
+
+            # 按时间回放时一次只返回一个分块，保持原始的到达节奏
+            if self._realtime:
+                break
+
+        if self._index >= len(self._chunks):
+            self.closed = True
+        return b"".join(parts)
+
+    def close(self):
+        self.closed = True
+
+
+def _build_response(adapter, request, interaction, started, realtime):
+    """用 cassette 中的数据构造 requests.Response"""
+    recorded = interaction["response"]
+
+    if realtime:
+        delay = started + recorded.get("ttfb", 0) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    headers = HTTPHeaderDict()
+    for name, value in recorded["headers"]:
+        if name.lower() not in HOP_BY_HOP_HEADERS:
+            headers.add(name, value)
+
+    chunks = [(chunk["t"], base64.b64decode(chunk["data"])) for chunk in recorded["chunks"]]
+    raw = HTTPResponse(
+        body=_TimedBody(chunks, started, realtime),
+        headers=headers,
+        status=recorded["status"],
+        reason=recorded.get("reason"),
+        preload_content=False,
+        decode_content=True,
+    )
+
+    return adapter.build_response(request, raw)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """真实发送请求，并把请求/响应对写入 cassette"""
+
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        started = time.monotonic()
+        response = super().send(request, stream=True, timeout=timeout,
+                                verify=verify, cert=cert, proxies=proxies)
+        ttfb = time.monotonic() - started
+
+        # 读取未解压的原始字节，保留压缩格式 (gzip / br) 和分块时间
+        chunks = []
+        for data in response.raw.stream(CHUNK_SIZE, decode_content=False):
+            chunks.append({
+                "t": round(time.monotonic() - started, 6),
+                "data": base64.b64encode(data).decode("ascii")
+            })
+        response.close()
+
+        interaction = {
+            "key": request_key(request.method, request.url, request.body),
+            "recorded_at": datetime.now().isoformat(),
+            "request": {
+                "method": request.method,
+                "url": request.url,
+                "headers": [[k, _mask_header(k, v)] for k, v in request.headers.items()],
+                "body": _body_bytes(request.body).decode("utf-8", errors="replace")
+            },
+            "response": {
+                "status": response.status_code,
+                "reason": response.reason,
+                "headers": [[k, v] for k, v in response.raw.headers.items()],
+                "ttfb": round(ttfb, 6),
+                "elapsed": round(time.monotonic() - started, 6),
+                "chunks": chunks
+            }
+        }
+        self.cassette.append(interaction)
+
+        # 返回给调用方的是基于录制数据重建的响应，解压流程与回放完全一致
+        return _build_response(self, request, interaction, started, realtime=False)
+
+
+class ReplayAdapter(HTTPAdapter):
+    """不访问网络，从 cassette 中返回响应"""
+
+    def __init__(self, cassette, realtime=True, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        self.realtime = realtime
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        started = time.monotonic()
+        interaction = self.cassette.take(request.method, request.url, request.body)
+        response = _build_response(self, request, interaction, started, self.realtime)
+        if not stream:
+            response.content  # 与真实请求一致：非流式时立即读完正文
+        return response
+
+
+def mount_cassette(session, path, mode="replay", realtime=True):
+    """在 session 上挂载录制或回放适配器"""
+    cassette = Cassette(path)
+
+    if mode == "record":
+        adapter = RecordingAdapter(cassette)
+    elif mode == "replay":
+        if not cassette.interactions:
+            raise FileNotFoundError(f"cassette 不存在或为空: {path}")
+        adapter = ReplayAdapter(cassette, realtime=realtime)
+    else:
+        raise ValueError(f"未知的 cassette 模式: {mode}（可选 record / replay）")
+
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return cassette
+
+
+def show_info(path):
+    """显示 cassette 中的请求概况"""
+    cassette = Cassette(path)
+
+    print(f"Cassette: {path}")
+    print(f"请求数量: {len(cassette.interactions)}")
+    print("-" * 80)
+
+    for i, interaction in enumerate(cassette.interactions, 1):
+        req = interaction["request"]
+        resp = interaction["response"]
+        size = sum(len(base64.b64decode(c["data"])) for c in resp["chunks"])
+        encoding = dict((k.lower(), v) for k, v in resp["headers"]).get("content-encoding", "identity")
+        print(f"{i}. {req['method']} {req['url']}")
+        print(f"   状态码: {resp['status']}  编码: {encoding}  大小: {size} 字节  分块: {len(resp['chunks'])}")
+        print(f"   首字节: {resp.get('ttfb', 0):.2f}s  总耗时: {resp.get('elapsed', 0):.2f}s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "info":
+        print("用法: python cassette.py info <cassette.json>")
+        sys.exit(1)
+
+    show_info(sys.argv[2])
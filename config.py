@@ -2,16 +2,20 @@
 """
 配置管理模块
 支持从环境变量、.env 文件或默认值读取配置
+
+API_KEYS（逗号分隔）可以配置多个密钥组成密钥池，请求按各密钥的剩余配额轮换 (key_pool.py)；
+API_KEY 未设置时使用 API_KEYS 中的第一个。
 """
 
 import os
+import re
 
 def get_api_key():
     """
     获取 API Key，优先级：
     1. 环境变量 API_KEY
     2. .env 文件中的 API_KEY
-    3. 硬编码的默认值
+    3. API_KEYS 中的第一个
     """
     # 1. 首先尝试从环境变量获取
     api_key = os.environ.get('API_KEY')
@@ -29,9 +33,45 @@ def get_api_key():
                     if key.strip() == 'API_KEY':
                         return value.strip()
 
-    # 3. 如果没有找到，返回 None 或抛出错误
+    # 3. 使用密钥池中的第一个
+    keys = get_pool_keys()
+    if keys:
+        return keys[0]
+
+    # 4. 如果没有找到，返回 None 或抛出错误
     raise ValueError("API_KEY not found. Please set it in environment variable or .env file")
 
+def get_pool_keys():
+    """
+    获取 API_KEYS 中配置的密钥（逗号或空白分隔），优先级：
+    1. 环境变量 API_KEYS
+    2. .env 文件中的 API_KEYS
+    未配置时返回空列表
+    """
+    value = os.environ.get('API_KEYS')
+
+    if not value:
+        env_file = os.path.join(os.path.dirname(__file__), '.env')
+        if os.path.exists(env_file):
+            with open(env_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#') and '=' in line:
+                        key, val = line.split('=', 1)
+                        if key.strip() == 'API_KEYS':
+                            value = val.strip()
+
+    keys = []
+    for key in re.split(r'[,\s]+', value or ''):
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+def get_api_keys():
+    """获取密钥池：API_KEY 在前，其后是 API_KEYS 中的其他密钥"""
+    primary = get_api_key()
+    return [primary] + [key for key in get_pool_keys() if key != primary]
+
 def get_api_base_url():
     """获取 API Base URL"""
     # 从环境变量获取
@@ -75,5 +115,6 @@ def get_default_model():
 
 # 导出配置
 API_KEY = get_api_key()
+API_KEYS = get_api_keys()
 API_BASE_URL = get_api_base_url()
 DEFAULT_MODEL = get_default_model()
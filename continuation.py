@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+输出截断续写
+响应因达到 max_tokens 而被截断时（Messages 的 stop_reason == "max_tokens"，
+Chat Completions 的 finish_reason == "length"），把已生成的内容（包括 web_search 的调用和搜索结果）
+作为 assistant 消息发回，请模型从断点继续，只为缺少的结尾付费，不需要重新搜索。
+
+max_tokens 根据 usage_log.jsonl 中同类请求（端点、模型、工具和 system 提示词相同）观测到的输出长度确定，
+统计每 RELOAD_INTERVAL 秒重新读取一次。
+
+用法：
+    python continuation.py          # 查看各类请求建议的 max_tokens
+"""
+
+import argparse
+import copy
+import math
+import threading
+import time
+from collections import defaultdict
+
+from usage_tracker import load_usage, task_key
+
+TRUNCATED_REASONS = ("max_tokens", "length")
+
+# 每次请求最多续写的次数
+MAX_CONTINUATIONS = 2
+
+# 至少有这么多条观测才根据历史调整 max_tokens
+MIN_SAMPLES = 5
+# 只看最近的记录
+RECENT_SAMPLES = 200
+# 在观测到的 p95 输出长度上留出的余量；被截断的请求按上限计入，
+# 截断较多时建议值会逐步增大
+HEADROOM = 1.25
+ROUND_TO = 256
+MIN_MAX_TOKENS = 512
+MAX_MAX_TOKENS = 8192
+# 用量日志只追加，每隔这么久（秒）才重新读取，不在每次构建请求体时解析整个文件
+RELOAD_INTERVAL = 60
+
+_samples = {}
+_loaded_at = 0.0
+_samples_lock = threading.Lock()
+
+
+def is_truncated(result):
+    """响应是否因达到 max_tokens 被截断"""
+    if "choices" in result:
+        choices = result.get("choices") or [{}]
+        return choices[0].get("finish_reason") in TRUNCATED_REASONS
+    return result.get("stop_reason") in TRUNCATED_REASONS
+
+
+def build_output_samples(entries):
+    """
+    按 (端点, 模型, 工具, 任务) 和 (端点, None, 工具, 任务) 分组最近的输出长度
+    续写请求只生成结尾，不计入
+    """
+    samples = defaultdict(list)
+    for entry in entries:
+        if entry.get("continuation") or entry.get("error"):
+            continue
+        tools = tuple(sorted(entry.get("tools") or []))
+        # 没有 task 字段的旧记录无法区分任务，不参与统计
+        task = entry.get("task")
+        if task is None:
+            continue
+        output = entry.get("output_tokens", 0) or 0
+        samples[(entry.get("endpoint"), entry.get("model"), tools, task)].append(output)
+        samples[(entry.get("endpoint"), None, tools, task)].append(output)
+    return {key: outputs[-RECENT_SAMPLES:] for key, outputs in samples.items()}
+
+
+def output_samples():
+    """进程内缓存的输出长度统计，超过 RELOAD_INTERVAL 秒才重新读取用量日志"""
+    global _samples, _loaded_at
+    if time.time() - _loaded_at >= RELOAD_INTERVAL:
+        with _samples_lock:
+            if time.time() - _loaded_at >= RELOAD_INTERVAL:
+                _samples = build_output_samples(load_usage())
+                _loaded_at = time.time()
+    return _samples
+
+
+def _suggest_from_samples(samples, endpoint, model, tools, task, default):
+    outputs = []
+    for key in ((endpoint, model, tools, task), (endpoint, None, tools, task)):
+        outputs = samples.get(key, [])
+        if len(outputs) >= MIN_SAMPLES:
+            break
+    if len(outputs) < MIN_SAMPLES:
+        return default
+
+    outputs = sorted(outputs)
+    p95 = outputs[max(0, math.ceil(0.95 * len(outputs)) - 1)]
+    size = math.ceil(p95 * HEADROOM / ROUND_TO) * ROUND_TO
+    return max(MIN_MAX_TOKENS, min(size, MAX_MAX_TOKENS))
+
+
+def suggest_max_tokens(endpoint, default, tools=None, entries=None, model=None, system=None):
+    """
+    根据历史输出长度为请求选择 max_tokens
+    endpoint 为 "/v1/messages" 或 "/v1/chat/completions"，tools 为工具类型列表，
+    model 和 system（system 提示词）与请求体一致；先看同一模型的记录，不足时看同类请求的全部模型
+    观测不足时返回 default
+    """
+    samples = output_samples() if entries is None else build_output_samples(entries)
+    return _suggest_from_samples(samples, endpoint, model, tuple(sorted(tools or [])), task_key(system), default)
+
+
+def _merge_usage(total, usage):
+    merged = dict(total or {})
+    for key, value in (usage or {}).items():
+        if isinstance(value, (int, float)):
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _continue_messages_payload(payload, result):
+    content = copy.deepcopy(result.get("content", []))
+    if not content or content[-1].get("type") != "text":
+        return None
+    # assistant 消息的最后一段文本不能以空白结尾
+    content[-1]["text"] = content[-1]["text"].rstrip()
+    if not content[-1]["text"]:
+        content.pop()
+        if not content:
+            return None
+
+    data = dict(payload)
+    data["messages"] = list(payload["messages"]) + [{"role": "assistant", "content": content}]
+    if payload.get("tools"):
+        # 复用已有的搜索结果，续写时不再调用工具
+        data["tool_choice"] = {"type": "none"}
+    return data
+
+
+def _merge_messages_result(result, extra):
+    merged = dict(result)
+    content = [dict(block) for block in result.get("content", [])]
+    for block in extra.get("content", []):
+        if block.get("type") == "text" and content and content[-1].get("type") == "text":
+            content[-1]["text"] = content[-1]["text"].rstrip() + block.get("text", "")
+        else:
+            content.append(block)
+    merged["content"] = content
+    merged["stop_reason"] = extra.get("stop_reason")
+    merged["usage"] = _merge_usage(result.get("usage"), extra.get("usage"))
+    return merged
+
+
+def _continue_chat_payload(payload, result):
+    text = (result["choices"][0].get("message", {}).get("content") or "").rstrip()
+    if not text:
+        return None
+    data = dict(payload)
+    data["messages"] = list(payload["messages"]) + [{"role": "assistant", "content": text}]
+    return data
+
+
+def _merge_chat_result(result, extra):
+    merged = dict(result)
+    choice = dict(result["choices"][0])
+    message = dict(choice.get("message", {}))
+    extra_choice = (extra.get("choices") or [{}])[0]
+
+    message["content"] = (message.get("content") or "").rstrip() + (extra_choice.get("message", {}).get("content") or "")
+    choice["message"] = message
+    choice["finish_reason"] = extra_choice.get("finish_reason")
+    merged["choices"] = [choice] + result["choices"][1:]
+    merged["usage"] = _merge_usage(result.get("usage"), extra.get("usage"))
+    return merged
+
+
+def complete_truncated(url, headers, payload, result, timeout=60, max_rounds=MAX_CONTINUATIONS, deadline=None):
+    """
+    如果响应被截断，发送续写请求并把结果合并到原响应中
+    支持 /v1/messages 和 /v1/chat/completions 两种格式，返回合并后的响应（result["continuations"] 为续写次数）
+    续写失败时返回已有的内容
+    deadline (deadline.Deadline) 不为空时每次续写的超时限制在剩余时间内，剩余时间不够时不再续写
+    """
+    from deadline import DeadlineExceeded
+    from http_client import get_session
+
+    is_chat = "choices" in result
+    rounds = 0
+
+    while is_truncated(result) and rounds < max_rounds:
+        if is_chat:
+            data = _continue_chat_payload(payload, result)
+        else:
+            data = _continue_messages_payload(payload, result)
+        if data is None:
+            break
+
+        round_timeout = timeout
+        if deadline is not None:
+            try:
+                round_timeout = deadline.cap(timeout)
+            except DeadlineExceeded:
+                print("⚠️  剩余时间不足，不再续写，返回已有内容")
+                break
+
+        rounds += 1
+        print(f"⚠️  输出达到 max_tokens ({payload.get('max_tokens')}) 上限，发送续写请求（第 {rounds} 次）")
+
+        try:
+            response = get_session().post(url, headers=headers, json=data, timeout=round_timeout)
+        except Exception as e:
+            print(f"⚠️  续写请求失败: {type(e).__name__}: {e}")
+            break
+        if response.status_code != 200:
+            print(f"⚠️  续写请求失败: {response.status_code} {response.text[:200]}")
+            break
+
+        extra = response.json()
+        if is_chat:
+            result = _merge_chat_result(result, extra)
+        else:
+            result = _merge_messages_result(result, extra)
+
+    if rounds:
+        result["continuations"] = rounds
+        if is_truncated(result):
+            print(f"⚠️  续写 {rounds} 次后输出仍不完整")
+        else:
+            print(f"✓ 续写 {rounds} 次后输出完整")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看各类请求建议的 max_tokens")
+    parser.parse_args()
+
+    entries = load_usage()
+    samples = build_output_samples(entries)
+    truncated = defaultdict(int)
+    for entry in entries:
+        if not entry.get("continuation") and entry.get("stop_reason") in TRUNCATED_REASONS:
+            truncated[(entry.get("endpoint"), tuple(sorted(entry.get("tools") or [])), entry.get("task"))] += 1
+
+    print(f"用量记录: {len(entries)} 条（任务为 system 提示词的哈希，- 表示没有 system）")
+    print("-" * 80)
+    for endpoint, model, tools, task in sorted(samples, key=lambda key: tuple(str(part) for part in key)):
+        if model is not None:
+            continue
+        label = f"{endpoint} {'+'.join(tools) or '无工具'}"
+        suggested = _suggest_from_samples(samples, endpoint, None, tools, task, None)
+        print(f"{label:<40} 任务 {task or '-':<12} 样本 {len(samples[(endpoint, model, tools, task)]):>5}  "
+              f"截断 {truncated[(endpoint, tools, task)]:>4}  建议 max_tokens {suggested or '样本不足':>5}")
+
+
+if __name__ == "__main__":
+    main()
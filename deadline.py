@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+请求截止时间
+一次用户请求只有一个截止时间，之后的每一步（web_search、续写、降级请求）都从剩余时间里分配超时，
+不再各自从头计时。
+
+    from deadline import Deadline
+
+    deadline = Deadline(60)
+    timeout = deadline.cap(request_timeout("/v1/messages", data, default=90))
+    get_session().post(url, headers=headers, json=data, timeout=timeout)
+
+默认的截止时间：设置了 NEWS_DEADLINE（秒）时使用它；否则按 usage_log.jsonl 中观测到的
+web_search 延迟 p95 × DEADLINE_FACTOR（限制在 MIN_DEADLINE-MAX_DEADLINE 之间），
+没有足够样本时为 DEFAULT_DEADLINE（高于 web_search 通常的 60-90 秒），默认情况下主路径不会被截断。
+"""
+
+import os
+import time
+
+# 没有 web_search 延迟样本时的默认截止时间（秒）
+DEFAULT_DEADLINE = 120.0
+# 按观测延迟计算默认截止时间：p95 × 系数，限制在上下限之间
+DEADLINE_PERCENTILE = 95
+DEADLINE_FACTOR = 1.2
+MIN_DEADLINE = 30.0
+MAX_DEADLINE = 300.0
+WEB_SEARCH_TOOL = "web_search_20250305"
+# 剩余时间少于该值时不再发出新请求
+MIN_REQUEST_TIME = 1.0
+
+
+class DeadlineExceeded(TimeoutError):
+    """剩余时间不足以发出请求"""
+
+
+def observed_web_search_latency(percentile=DEADLINE_PERCENTILE):
+    """最近 web_search 请求延迟的分位数（秒），样本不足时返回 None"""
+    from adaptive_timeout import get_timeout_policy
+
+    _, histogram = get_timeout_policy().histogram("/v1/messages", None, (WEB_SEARCH_TOOL,))
+    return histogram.quantile(percentile) if histogram is not None else None
+
+
+def default_deadline():
+    """默认的截止时间（秒）"""
+    if os.environ.get("NEWS_DEADLINE"):
+        return float(os.environ["NEWS_DEADLINE"])
+    latency = observed_web_search_latency()
+    if latency is None:
+        return DEFAULT_DEADLINE
+    return round(max(MIN_DEADLINE, min(latency * DEADLINE_FACTOR, MAX_DEADLINE)), 1)
+
+
+class Deadline:
+    """从创建时开始计时的截止时间"""
+
+    def __init__(self, budget=None):
+        self.budget = float(budget) if budget else default_deadline()
+        self.started = time.monotonic()
+        self.expires_at = self.started + self.budget
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self, reserve=0.0):
+        """剩余时间（秒），reserve 为留给后续步骤的时间"""
+        return max(0.0, self.expires_at - time.monotonic() - reserve)
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def cap(self, timeout, reserve=0.0):
+        """
+        把 requests 的超时（秒数或 (连接超时, 读超时)）限制在剩余时间内
+        剩余时间不足 MIN_REQUEST_TIME 时抛出 DeadlineExceeded
+        """
+        remaining = self.remaining(reserve)
+        if remaining < MIN_REQUEST_TIME:
+            raise DeadlineExceeded(f"距离截止时间只剩 {remaining:.1f} 秒")
+        if isinstance(timeout, tuple):
+            return tuple(min(part, remaining) for part in timeout)
+        return min(timeout, remaining) if timeout else remaining
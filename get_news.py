@@ -9,18 +9,31 @@ import json
 from datetime import datetime
 import time
 from config import API_KEY, API_BASE_URL
+from http_client import get_session
+from adaptive_timeout import request_timeout
+from model_registry import get_registry
+from model_router import route
+from continuation import complete_truncated, suggest_max_tokens
 
 def try_models(models_to_try=None):
     """尝试不同的模型获取新闻"""
     if models_to_try is None:
-        # 使用该 API 支持的 Claude 模型
-        models_to_try = [
+        # 先用路由选出的模型，失败后再依次尝试该 API 支持的其他 Claude 模型
+        routed = route("knowledge", max_latency=30)
+        print(f"自动选择模型: {routed['model']}（{routed['reason']}）")
+        models_to_try = [routed["model"]] + [m for m in [
             "claude-3-5-haiku-20241022",
             "claude-sonnet-4-5-20250929",
             "claude-sonnet-4-20250514"
-        ]
+        ] if m != routed["model"]]
 
+    registry = get_registry()
     for model in models_to_try:
+        # 使用缓存的模型列表，跳过确定不可用的模型
+        if registry.is_available(model) is False:
+            print(f"\n跳过模型 {model}（不在可用模型列表中）")
+            continue
+
         print(f"\n尝试使用模型: {model}")
         success = get_international_news(model)
         if success:
@@ -40,12 +53,13 @@ def get_international_news(model="claude-3-5-haiku-20241022"):
     }
 
     # 构建请求数据
+    system_prompt = "你是一个国际新闻专家，专门提供准确、简洁的国际新闻摘要。"
     data = {
         "model": model,
         "messages": [
             {
                 "role": "system",
-                "content": "你是一个国际新闻专家，专门提供准确、简洁的国际新闻摘要。"
+                "content": system_prompt
             },
             {
                 "role": "user",
@@ -53,14 +67,15 @@ def get_international_news(model="claude-3-5-haiku-20241022"):
             }
         ],
         "temperature": 0.7,
-        "max_tokens": 2000
+        "max_tokens": suggest_max_tokens("/v1/chat/completions", 2000, model=model, system=system_prompt)
     }
 
     try:
         print("正在获取国际新闻...")
         print("-" * 80)
 
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+        timeout = request_timeout("/v1/chat/completions", data, default=30)
+        response = get_session().post(url, headers=headers, json=data, timeout=timeout)
 
         # 打印响应状态码
         print(f"响应状态码: {response.status_code}")
@@ -72,7 +87,7 @@ def get_international_news(model="claude-3-5-haiku-20241022"):
 
         response.raise_for_status()
 
-        result = response.json()
+        result = complete_truncated(url, headers, data, response.json(), timeout=timeout)
 
         # 提取回复内容
         if "choices" in result and len(result["choices"]) > 0:
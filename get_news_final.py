@@ -6,28 +6,25 @@
 2. /v1/messages (Anthropic 格式)
 """
 
-import requests
 import json
 from datetime import datetime
 import argparse
 from config import API_KEY, API_BASE_URL
-
-def get_news_chat_completions():
-    """使用 /v1/chat/completions 端点 (OpenAI 格式)"""
-
-    url = f"{API_BASE_URL}/v1/chat/completions"
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
-
-    data = {
-        "model": "claude-3-5-haiku-20241022",
+from http_client import get_session
+from adaptive_timeout import request_timeout
+from model_router import choose_model
+from continuation import complete_truncated, suggest_max_tokens
+
+def build_chat_payload(model=None):
+    """构建 /v1/chat/completions 请求体，未指定模型时自动选择"""
+    model = model or choose_model("knowledge", max_latency=30)
+    system_prompt = "你是一个国际新闻专家。"
+    return {
+        "model": model,
         "messages": [
             {
                 "role": "system",
-                "content": "你是一个国际新闻专家。"
+                "content": system_prompt
             },
             {
                 "role": "user",
@@ -35,18 +32,46 @@ def get_news_chat_completions():
             }
         ],
         "temperature": 0.7,
-        "max_tokens": 2000
+        "max_tokens": suggest_max_tokens("/v1/chat/completions", 2000, model=model, system=system_prompt)
+    }
+
+def build_messages_payload(model=None):
+    """构建 /v1/messages 请求体，未指定模型时自动选择"""
+    model = model or choose_model("knowledge", max_latency=60)
+    return {
+        "model": model,
+        "max_tokens": suggest_max_tokens("/v1/messages", 1024, model=model),
+        "messages": [
+            {
+                "role": "user",
+                "content": "请基于你的知识库，提供5条重要的国际新闻事件。每条包括：标题、内容摘要、涉及国家。用中文回答。"
+            }
+        ]
     }
 
+def get_news_chat_completions():
+    """使用 /v1/chat/completions 端点 (OpenAI 格式)"""
+
+    url = f"{API_BASE_URL}/v1/chat/completions"
+
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {API_KEY}"
+    }
+
+    data = build_chat_payload()
+
     try:
         print("=== 方式 1: /v1/chat/completions (OpenAI 格式) ===")
         print(f"URL: {url}")
+        print(f"Model: {data['model']}")
         print("-" * 80)
 
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+        timeout = request_timeout("/v1/chat/completions", data, default=30)
+        response = get_session().post(url, headers=headers, json=data, timeout=timeout)
 
         if response.status_code == 200:
-            result = response.json()
+            result = complete_truncated(url, headers, data, response.json(), timeout=timeout)
 
             if "choices" in result and len(result["choices"]) > 0:
                 content = result["choices"][0]["message"]["content"]
@@ -76,33 +101,24 @@ def get_news_messages():
         "content-type": "application/json"
     }
 
-    data = {
-        "model": "claude-sonnet-4-5-20250929",
-        "max_tokens": 1024,
-        "messages": [
-            {
-                "role": "user",
-                "content": "请基于你的知识库，提供5条重要的国际新闻事件。每条包括：标题、内容摘要、涉及国家。用中文回答。"
-            }
-        ]
-    }
+    data = build_messages_payload()
 
     try:
         print("=== 方式 2: /v1/messages (Anthropic 格式) ===")
         print(f"URL: {url}")
+        print(f"Model: {data['model']}")
         print("-" * 80)
 
-        response = requests.post(url, headers=headers, json=data, timeout=60)
+        timeout = request_timeout("/v1/messages", data, default=60)
+        response = get_session().post(url, headers=headers, json=data, timeout=timeout)
 
         if response.status_code == 200:
-            result = response.json()
+            result = complete_truncated(url, headers, data, response.json(), timeout=timeout)
 
             if "content" in result:
-                text_content = ""
-                for item in result["content"]:
-                    if item.get("type") == "text":
-                        text_content = item.get("text", "")
-                        break
+                text_content = "".join(
+                    item.get("text", "") for item in result["content"] if item.get("type") == "text"
+                )
 
                 if text_content:
                     print(f"\n📰 国际新闻\n")
@@ -4,10 +4,11 @@
 使用 Anthropic API 格式 (不包含 web_search 工具)
 """
 
-import requests
 import json
 from datetime import datetime
 from config import API_KEY, API_BASE_URL
+from http_client import get_session
+from adaptive_timeout import request_timeout
 
 def get_news_with_messages_api():
     """使用 /v1/messages 端点获取新闻"""
@@ -39,7 +40,8 @@ def get_news_with_messages_api():
         print(f"Model: {data['model']}")
         print("-" * 80)
 
-        response = requests.post(url, headers=headers, json=data, timeout=60)
+        timeout = request_timeout("/v1/messages", data, default=60)
+        response = get_session().post(url, headers=headers, json=data, timeout=timeout)
 
         print(f"状态码: {response.status_code}")
 
@@ -124,7 +126,8 @@ def get_news_with_openai_headers():
         print(f"URL: {url}")
         print("-" * 80)
 
-        response = requests.post(url, headers=headers, json=data, timeout=60)
+        timeout = request_timeout("/v1/messages", data, default=60)
+        response = get_session().post(url, headers=headers, json=data, timeout=timeout)
 
         print(f"状态码: {response.status_code}")
 
@@ -7,10 +7,16 @@
 3. 通过精心设计的 prompt 让 AI 标注来源
 """
 
-import requests
+import argparse
 import json
 from datetime import datetime
 
+from http_client import get_session
+from adaptive_timeout import request_timeout
+from model_router import route
+from usage_tracker import format_usage
+from continuation import complete_truncated, suggest_max_tokens
+
 # 导入配置模块
 try:
     from config import API_KEY, API_BASE_URL, DEFAULT_MODEL
@@ -23,6 +29,42 @@ except ImportError:
     API_BASE_URL = os.environ.get('API_BASE_URL', "https://spai.aicoding.sh")
     DEFAULT_MODEL = os.environ.get('DEFAULT_MODEL', "claude-sonnet-4-5-20250929")
 
+# 固定的格式说明（system prompt），每次请求都相同
+SOURCE_SYSTEM_PROMPT = """你是一个专业的新闻助手。在提供新闻时，必须遵循以下格式：
+
+对于每条新闻，必须包含：
+1. **标题**：简洁明确的新闻标题
+2. **内容**：2-3句话的新闻摘要
+3. **来源说明**：
+   - 如果是基于你的知识库（截止到2024年4月）：明确说明"基于知识库"
+   - 说明这是哪个地区/国家的事件
+   - 如果知道具体的新闻机构，可以提及（如路透社、BBC等）
+
+重要：必须明确区分"实时新闻"和"知识库信息"。"""
+
+SOURCE_USER_PROMPT = "请提供5条重要的国际新闻。每条新闻必须明确标注信息来源和时效性。"
+
+def save_source_news(content, result, label, prefix):
+    """保存带来源标注的新闻文本和 JSON 响应"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"{prefix}_{timestamp}.txt"
+
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(f"国际新闻 ({label}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write("=" * 80 + "\n\n")
+        f.write(content)
+        f.write("\n\n" + "=" * 80 + "\n")
+        f.write("注意：以上新闻基于 AI 的知识库（截止2024年4月），不是实时网络搜索结果。\n")
+        f.write("如需实时新闻，请使用：python get_news_with_websearch_final.py\n")
+
+    print(f"\n✓ 已保存到 {filename}")
+
+    # 也保存 JSON
+    json_file = f"{prefix}_{timestamp}.json"
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"✓ JSON 响应已保存到 {json_file}")
+
 def get_news_openai_format_with_source_prompt():
     """
     方法1：OpenAI 格式 + 优化的提示词
@@ -36,42 +78,38 @@ def get_news_openai_format_with_source_prompt():
         "Authorization": f"Bearer {API_KEY}"
     }
 
+    # 知识库问答不需要 sonnet，按观测延迟自动选择模型（请求超时为 30 秒）
+    routed = route("knowledge", max_latency=30)
+    model = routed["model"]
+
     data = {
-        "model": "claude-3-5-haiku-20241022",
+        "model": model,
         "messages": [
             {
                 "role": "system",
-                "content": """你是一个专业的新闻助手。在提供新闻时，必须遵循以下格式：
-
-对于每条新闻，必须包含：
-1. **标题**：简洁明确的新闻标题
-2. **内容**：2-3句话的新闻摘要
-3. **来源说明**：
-   - 如果是基于你的知识库（截止到2024年4月）：明确说明"基于知识库"
-   - 说明这是哪个地区/国家的事件
-   - 如果知道具体的新闻机构，可以提及（如路透社、BBC等）
-
-重要：必须明确区分"实时新闻"和"知识库信息"。"""
+                "content": SOURCE_SYSTEM_PROMPT
             },
             {
                 "role": "user",
-                "content": "请提供5条重要的国际新闻。每条新闻必须明确标注信息来源和时效性。"
+                "content": SOURCE_USER_PROMPT
             }
         ],
         "temperature": 0.7,
-        "max_tokens": 2000
+        "max_tokens": suggest_max_tokens("/v1/chat/completions", 2000, model=model, system=SOURCE_SYSTEM_PROMPT)
     }
 
     try:
         print("=" * 80)
         print("方法 1: OpenAI 格式 + 来源标注提示词")
+        print(f"模型: {model}（{routed['reason']}）")
         print("=" * 80)
 
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+        timeout = request_timeout("/v1/chat/completions", data, default=30)
+        response = get_session().post(url, headers=headers, json=data, timeout=timeout)
         print(f"状态码: {response.status_code}")
 
         if response.status_code == 200:
-            result = response.json()
+            result = complete_truncated(url, headers, data, response.json(), timeout=timeout)
 
             if "choices" in result and len(result["choices"]) > 0:
                 content = result["choices"][0]["message"]["content"]
@@ -79,27 +117,72 @@ def get_news_openai_format_with_source_prompt():
                 print(f"\n📰 国际新闻（带来源标注）\n")
                 print(content)
                 print("\n" + "=" * 80)
+                print(f"用量: {format_usage(result.get('usage'))}")
+
+                save_source_news(content, result, "OpenAI 格式 + 来源标注", "news_openai_sources")
+                return True
+
+        else:
+            print(f"❌ 请求失败: {response.status_code}")
+            print(f"错误: {response.text}")
+            return False
+
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        return False
+
+def get_news_messages_format_with_source_prompt():
+    """
+    方法2：Anthropic Messages 格式 + 同样的提示词
+    来源标注说明放在 system 中，user 消息只包含请求
+    （system prompt 约 250 tokens，低于最小可缓存长度 1024 / 2048 tokens，不标记 cache_control）
+    """
+
+    url = f"{API_BASE_URL}/v1/messages"
+
+    headers = {
+        "x-api-key": API_KEY,
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json"
+    }
+
+    routed = route("knowledge", max_latency=30)
+    model = routed["model"]
+
+    data = {
+        "model": model,
+        "max_tokens": suggest_max_tokens("/v1/messages", 2000, model=model, system=SOURCE_SYSTEM_PROMPT),
+        "temperature": 0.7,
+        "system": SOURCE_SYSTEM_PROMPT,
+        "messages": [
+            {
+                "role": "user",
+                "content": SOURCE_USER_PROMPT
+            }
+        ]
+    }
 
-                # 保存
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"news_openai_sources_{timestamp}.txt"
+    try:
+        print("=" * 80)
+        print("方法 2: Messages 格式 + 来源标注提示词")
+        print(f"模型: {model}（{routed['reason']}）")
+        print("=" * 80)
 
-                with open(filename, "w", encoding="utf-8") as f:
-                    f.write(f"国际新闻 (OpenAI 格式 + 来源标注) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write("=" * 80 + "\n\n")
-                    f.write(content)
-                    f.write("\n\n" + "=" * 80 + "\n")
-                    f.write("注意：以上新闻基于 AI 的知识库（截止2024年4月），不是实时网络搜索结果。\n")
-                    f.write("如需实时新闻，请使用：python get_news_with_websearch_final.py\n")
+        timeout = request_timeout("/v1/messages", data, default=30)
+        response = get_session().post(url, headers=headers, json=data, timeout=timeout)
+        print(f"状态码: {response.status_code}")
 
-                print(f"\n✓ 已保存到 {filename}")
+        if response.status_code == 200:
+            result = complete_truncated(url, headers, data, response.json(), timeout=timeout)
+            content = "".join(item.get("text", "") for item in result.get("content", []) if item.get("type") == "text")
 
-                # 也保存 JSON
-                json_file = f"news_openai_sources_{timestamp}.json"
-                with open(json_file, "w", encoding="utf-8") as f:
-                    json.dump(result, f, indent=2, ensure_ascii=False)
-                print(f"✓ JSON 响应已保存到 {json_file}")
+            if content:
+                print(f"\n📰 国际新闻（带来源标注）\n")
+                print(content)
+                print("\n" + "=" * 80)
+                print(f"用量: {format_usage(result.get('usage'))}")
 
+                save_source_news(content, result, "Messages 格式 + 来源标注", "news_messages_sources")
                 return True
 
         else:
@@ -162,6 +245,15 @@ def get_news_comparison():
     print("  3. 对比两者结果，获得更全面的信息")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="国际新闻获取工具 - 带来源标注")
+    parser.add_argument(
+        "--method",
+        choices=["chat", "messages"],
+        default="chat",
+        help="chat: /v1/chat/completions；messages: /v1/messages（来源标注提示词放在 system 中）"
+    )
+    args = parser.parse_args()
+
     print("=" * 80)
     print("国际新闻获取工具 - OpenAI 格式（带来源标注）")
     print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -177,7 +269,10 @@ if __name__ == "__main__":
     print("\n" + "=" * 80)
 
     # 执行
-    success = get_news_openai_format_with_source_prompt()
+    if args.method == "messages":
+        success = get_news_messages_format_with_source_prompt()
+    else:
+        success = get_news_openai_format_with_source_prompt()
 
     if success:
         # 显示对比信息
@@ -2,16 +2,44 @@
 """
 使用 web_search 工具获取国际新闻
 模拟浏览器请求头以避免 Cloudflare 阻断
+
+每次请求只有一个截止时间（--deadline，默认 NEWS_DEADLINE，或观测到的 web_search 延迟 p95 × 1.2，没有样本时 120 秒），超时前按以下顺序降级，返回截止时能拿到的最好结果：
+    websearch   实时 web_search
+    cache       查询缓存中的结果（web_search 失败或来不及时使用，可以是过期的结果）
+    knowledge   不带工具、基于模型知识库的回答（没有可用缓存时，在截止前 KNOWLEDGE_RESERVE 秒并行发出）
+
+用法：
+    python get_news_with_websearch.py                         # 按截止时间获取新闻
+    python get_news_with_websearch.py --query "最新欧洲新闻" --deadline 30
+    python get_news_with_websearch.py --probe                 # 测试 web_search 工具是否可用
+    python get_news_with_websearch.py --mock
 """
 
-import requests
+import argparse
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from config import API_KEY, API_BASE_URL
 
-def get_news_with_web_search():
-    """使用 web_search 工具"""
+from http_client import get_session
+from adaptive_timeout import request_timeout
+from deadline import Deadline, DeadlineExceeded
+
+# 降级顺序，越靠前越好
+TIERS = ("websearch", "cache", "knowledge")
+# 没有可用缓存时，在截止前多少秒开始并行请求知识库回答
+KNOWLEDGE_RESERVE = 20.0
+# 作为降级结果时，缓存最多可以是多久之前的（秒）
+STALE_CACHE_AGE = 86400
+
+KNOWLEDGE_PROMPT = "你是一个国际新闻助手。当前无法联网搜索，请基于你的知识库回答，并说明信息可能不是最新的。用中文回答。"
 
+def get_news_with_web_search(deadline=None):
+    """使用 web_search 工具；失败时在同一个截止时间内尝试不带工具的请求"""
+    from config import API_KEY, API_BASE_URL
+
+    deadline = deadline or Deadline()
     url = f"{API_BASE_URL}/v1/messages"
 
     # 模拟浏览器的完整请求头
@@ -55,7 +83,8 @@ def get_news_with_web_search():
         print(f"Model: {data['model']}")
         print("-" * 80)
 
-        response = requests.post(url, headers=headers, json=data, timeout=60)
+        timeout = deadline.cap(request_timeout("/v1/messages", data, default=60))
+        response = get_session().post(url, headers=headers, json=data, timeout=timeout)
 
         print(f"状态码: {response.status_code}")
         print(f"Response Headers: {dict(response.headers)}")
@@ -105,15 +134,17 @@ def get_news_with_web_search():
 
             # 尝试不带 web_search 工具
             print("\n尝试不带 web_search 工具...")
-            return try_without_tools(headers)
+            return try_without_tools(headers, deadline)
 
     except Exception as e:
         print(f"❌ 错误: {type(e).__name__}: {e}")
         return False
 
-def try_without_tools(headers):
+def try_without_tools(headers, deadline=None):
     """不使用工具参数"""
+    from config import API_BASE_URL
 
+    deadline = deadline or Deadline()
     url = f"{API_BASE_URL}/v1/messages"
 
     data = {
@@ -129,7 +160,8 @@ def try_without_tools(headers):
     }
 
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=60)
+        timeout = deadline.cap(request_timeout("/v1/messages", data, default=60))
+        response = get_session().post(url, headers=headers, json=data, timeout=timeout)
 
         if response.status_code == 200:
             result = response.json()
@@ -147,9 +179,11 @@ def try_without_tools(headers):
         print(f"不带工具也失败: {e}")
         return False
 
-def test_different_tool_types():
-    """测试不同的工具类型"""
+def test_different_tool_types(deadline=None):
+    """测试不同的工具类型，超过截止时间后不再测试剩下的类型"""
+    from config import API_KEY, API_BASE_URL
 
+    deadline = deadline or Deadline()
     url = f"{API_BASE_URL}/v1/messages"
 
     headers = {
@@ -189,7 +223,8 @@ def test_different_tool_types():
         }
 
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
+            timeout = deadline.cap(request_timeout("/v1/messages", data, default=30))
+            response = get_session().post(url, headers=headers, json=data, timeout=timeout)
             print(f"  状态码: {response.status_code}")
 
             if response.status_code == 200:
@@ -199,6 +234,9 @@ def test_different_tool_types():
                 error_msg = response.text[:100] if len(response.text) > 100 else response.text
                 print(f"  ❌ 失败: {error_msg}")
 
+        except DeadlineExceeded as e:
+            print(f"  ⏱️  {e}，停止测试")
+            return False
         except Exception as e:
             print(f"  ❌ 错误: {e}")
 
@@ -206,21 +244,186 @@ def test_different_tool_types():
 
     return False
 
+
+def fetch_knowledge_result(query, deadline):
+    """不带工具的知识库回答（降级的最后一级），返回 /v1/messages 响应"""
+    from config import API_KEY, API_BASE_URL
+    from model_router import choose_model
+
+    url = f"{API_BASE_URL}/v1/messages"
+    headers = {
+        "x-api-key": API_KEY,
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json"
+    }
+    data = {
+        "model": choose_model("knowledge", max_latency=deadline.remaining()),
+        "max_tokens": 1024,
+        "system": KNOWLEDGE_PROMPT,
+        "messages": [{"role": "user", "content": f"请提供{query}。"}]
+    }
+    timeout = deadline.cap(request_timeout("/v1/messages", data, default=30))
+
+    response = get_session().post(url, headers=headers, json=data, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"请求失败: {response.status_code} {response.text[:300]}")
+    return response.json()
+
+
+def get_news_within_deadline(query="最新国际新闻", budget=None, use_cache=True):
+    """
+    在一个截止时间内获取新闻，按 websearch → cache → knowledge 降级
+    返回 {"tier", "result", "elapsed", "errors"}，tier 为提供结果的一级（都失败时为 None）；
+    cache 级另有 "age"（秒）和 "stale"（是否超过查询缓存的新鲜期）
+    """
+    from get_news_with_websearch_final import fetch_web_search_result
+    from model_router import choose_model
+    from news_archive import save_digest
+    from query_cache import get_query_cache
+    from query_log import log_query
+    from usage_tracker import normalize_usage
+
+    deadline = Deadline(budget)
+    cache = get_query_cache()
+    outcome = {"tier": None, "result": None, "errors": {}}
+
+    def finish(tier, result, **extra):
+        outcome.update(tier=tier, result=result, elapsed=deadline.elapsed(), **extra)
+        if tier == "cache":
+            served = "cache:stale" if extra["stale"] else "cache"
+        else:
+            served = tier or "error"
+        tokens = 0
+        if tier in ("websearch", "knowledge"):
+            usage = normalize_usage(result.get("usage"))
+            tokens = usage["input_tokens"] + usage["output_tokens"]
+        log_query(query, outcome["elapsed"], served, tokens=tokens)
+        return outcome
+
+    # 新鲜期内的缓存和实时搜索一样好，直接使用；过期的缓存留作降级结果
+    cached = cache.lookup(query, max_age=STALE_CACHE_AGE, record=False) if use_cache else None
+    if cached and cached["age"] <= cache.max_age:
+        return finish("cache", cached["result"], age=cached["age"], stale=False)
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        model = choose_model("web_search", max_latency=deadline.remaining())
+        pending = {executor.submit(fetch_web_search_result, query, model=model, deadline=deadline): "websearch"}
+        knowledge = None
+
+        while pending and not deadline.expired:
+            # 没有缓存可用时，在截止前 KNOWLEDGE_RESERVE 秒开始并行请求知识库回答
+            if cached is None and knowledge is None and deadline.remaining() <= KNOWLEDGE_RESERVE:
+                pending[executor.submit(fetch_knowledge_result, query, deadline)] = "knowledge"
+                knowledge = {}
+
+            wait_for = deadline.remaining()
+            if cached is None and knowledge is None:
+                wait_for = max(0.0, deadline.remaining() - KNOWLEDGE_RESERVE)
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                tier = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    outcome["errors"][tier] = f"{type(e).__name__}: {e}"
+                    if tier == "websearch" and cached is None and knowledge is None:
+                        # 实时搜索失败且没有缓存，立即改用知识库回答
+                        pending[executor.submit(fetch_knowledge_result, query, deadline)] = "knowledge"
+                        knowledge = {}
+                    continue
+
+                if tier == "websearch":
+                    cache.store(query, result)
+                    save_digest(query, result, source="websearch")
+                    return finish("websearch", result)
+                knowledge = result
+
+            if "websearch" in outcome["errors"] and cached is not None:
+                break
+            if knowledge and "websearch" not in pending.values():
+                break
+
+        if "websearch" not in outcome["errors"] and "websearch" in pending.values():
+            outcome["errors"]["websearch"] = f"截止时间 {deadline.budget:g} 秒内未完成"
+        if cached is not None:
+            return finish("cache", cached["result"], age=cached["age"], stale=True)
+        if knowledge:
+            return finish("knowledge", knowledge)
+        if "knowledge" not in outcome["errors"] and knowledge is not None:
+            outcome["errors"]["knowledge"] = f"截止时间 {deadline.budget:g} 秒内未完成"
+        return finish(None, None)
+    finally:
+        # 未完成的请求超时已限制在截止时间内，不等待它们结束
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def print_deadline_result(query, outcome):
+    """显示按截止时间获取的结果和提供结果的一级"""
+    from news_archive import extract_digest
+
+    labels = {"websearch": "实时搜索", "cache": "查询缓存", "knowledge": "知识库（未联网）"}
+    print("=" * 80)
+    print(f"查询: {query}")
+    for tier, error in outcome["errors"].items():
+        print(f"⚠️  {labels[tier]}失败: {error}")
+
+    if outcome["tier"] is None:
+        print(f"❌ {outcome['elapsed']:.1f} 秒内没有可用结果")
+        return
+
+    note = ""
+    if outcome["tier"] == "cache":
+        note = f"，{outcome['age'] / 60:.0f} 分钟前的结果" + ("（已过期）" if outcome["stale"] else "")
+    print(f"✅ 结果来自: {labels[outcome['tier']]} [{outcome['tier']}]，用时 {outcome['elapsed']:.1f} 秒{note}")
+
+    digest = extract_digest(outcome["result"])
+    if digest["search_results"]:
+        print(f"\n📊 搜索结果")
+        for sr in digest["search_results"]:
+            print(f"   - {sr['title']}")
+            print(f"     {sr['url']}")
+    print(f"\n📰 AI 总结:\n")
+    print(digest["text"])
+    print("=" * 80)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="在截止时间内获取国际新闻，按 web_search → 缓存 → 知识库降级")
+    parser.add_argument("--query", default="最新5条重要国际新闻", help="查询内容")
+    parser.add_argument("--deadline", type=float, help="整个请求的截止时间（秒，默认 NEWS_DEADLINE 或按 web_search 延迟计算）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用查询缓存")
+    parser.add_argument("--probe", action="store_true", help="测试 web_search 工具和不同的工具类型")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟服务")
+    args = parser.parse_args()
+
+    if args.mock:
+        from mock_server import start_mock_server
+
+        _, base_url = start_mock_server()
+        os.environ["API_BASE_URL"] = base_url
+        os.environ.setdefault("API_KEY", "mock-key")
+
     print("=" * 80)
-    print("Web Search 工具测试")
+    print("Web Search 工具测试" if args.probe else "国际新闻获取（截止时间内降级）")
     print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 80 + "\n")
 
-    # 先测试带 web_search
-    success = get_news_with_web_search()
+    if args.probe:
+        # 全部测试共用一个截止时间
+        deadline = Deadline(args.deadline)
+        success = get_news_with_web_search(deadline)
 
-    if not success:
-        print("\n" + "=" * 80)
-        print("测试不同的工具类型...")
-        print("=" * 80)
-        test_different_tool_types()
+        if not success and not deadline.expired:
+            print("\n" + "=" * 80)
+            print("测试不同的工具类型...")
+            print("=" * 80)
+            test_different_tool_types(deadline)
+    else:
+        outcome = get_news_within_deadline(args.query, budget=args.deadline, use_cache=not args.no_cache)
+        print_deadline_result(args.query, outcome)
 
     print("\n" + "=" * 80)
     print("测试完成")
-    print("=" * 80)
\ No newline at end of file
+    print("=" * 80)
@@ -4,24 +4,123 @@
 支持 Brotli 解压缩
 """
 
-import requests
+import os
 import json
+import time
+import argparse
 from datetime import datetime
 
+from http_client import get_session
+from adaptive_timeout import request_timeout
+from model_registry import get_registry
+from model_router import choose_model
+from usage_tracker import format_usage, normalize_usage
+from news_archive import save_digest, extract_digest
+from query_cache import get_query_cache
+from query_log import log_query
+from local_retrieval import answer_locally, print_local_answer
+from continuation import complete_truncated, suggest_max_tokens
+
 # 导入配置模块
 try:
     from config import API_KEY, API_BASE_URL, DEFAULT_MODEL
 except ImportError:
     # 如果配置模块不存在，从环境变量获取
-    import os
     API_KEY = os.environ.get('API_KEY')
     if not API_KEY:
         raise ValueError("API_KEY not found. Please set it in environment variable or .env file")
     API_BASE_URL = os.environ.get('API_BASE_URL', "https://spai.aicoding.sh")
     DEFAULT_MODEL = os.environ.get('DEFAULT_MODEL', "claude-sonnet-4-5-20250929")
 
-def get_news_with_web_search(query="最新国际新闻"):
-    """使用 web_search 工具获取新闻"""
+# 与查询无关的固定说明放在 system 中，user 消息只包含查询
+# （约 60 tokens，远低于最小可缓存长度 1024 / 2048 tokens，不标记 cache_control）
+WEB_SEARCH_SYSTEM_PROMPT = "你是一个国际新闻助手。请使用 web_search 工具搜索用户要求的新闻，每条新闻包括：1) 新闻标题 2) 简要内容 3) 来源。用中文回答。"
+
+def build_web_search_payload(query, max_uses=5, model=None):
+    """构建带 web_search 工具的 /v1/messages 请求体，未指定模型时自动选择"""
+    model = model or choose_model("web_search", max_latency=90)
+    return {
+        "model": model,
+        "max_tokens": suggest_max_tokens("/v1/messages", 2048, tools=["web_search_20250305"], model=model,
+                                         system=WEB_SEARCH_SYSTEM_PROMPT),
+        "system": WEB_SEARCH_SYSTEM_PROMPT,
+        "messages": [
+            {
+                "role": "user",
+                "content": f"请搜索并提供{query}。"
+            }
+        ],
+        "tools": [{
+            "type": "web_search_20250305",
+            "name": "web_search",
+            "max_uses": max_uses
+        }]
+    }
+
+def fetch_web_search_result(query, timeout=None, model=None, deadline=None):
+    """
+    发送 web_search 请求，返回续写后的完整响应（不打印搜索过程、不保存文件）
+    请求失败时抛出 RuntimeError 或 requests 异常；供网关 (news_gateway.py) 等服务调用
+    deadline (deadline.Deadline) 把请求和续写的超时限制在剩余时间内
+    """
+    url = f"{API_BASE_URL}/v1/messages"
+    headers = {
+        "x-api-key": API_KEY,
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json"
+    }
+    data = build_web_search_payload(query, model=model)
+    timeout = timeout or request_timeout("/v1/messages", data, default=90)
+
+    response = get_session().post(url, headers=headers, json=data,
+                                  timeout=deadline.cap(timeout) if deadline is not None else timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"请求失败: {response.status_code} {response.text[:300]}")
+    return complete_truncated(url, headers, data, response.json(), timeout=timeout, deadline=deadline)
+
+def print_cached_news(query, hit):
+    """显示查询缓存中的结果（不访问网络）"""
+    digest = extract_digest(hit["result"])
+
+    print("=" * 80)
+    print(f"使用 Web Search 工具获取: {query}")
+    print("=" * 80)
+    tier = "精确匹配" if hit["tier"] == "exact" else f"近似匹配，相似度 {hit['similarity']:.2f}"
+    print(f"♻️  命中查询缓存（{tier}）: {hit['query']}，{hit['age'] / 60:.0f} 分钟前的结果")
+
+    if digest["search_results"]:
+        print(f"\n📊 搜索结果")
+        for sr in digest["search_results"]:
+            print(f"   - {sr['title']}")
+            print(f"     {sr['url']}")
+
+    print(f"\n📰 AI 总结:\n")
+    print(digest["text"])
+    print("\n" + "=" * 80)
+
+
+def get_news_with_web_search(query="最新国际新闻", use_cache=True, use_local=True):
+    """
+    使用 web_search 工具获取新闻，新鲜期内的相同或相近查询直接使用缓存结果；
+    最近的归档和抓取的文章足以回答时，根据本地资料回答 (local_retrieval.py)
+    """
+    started = time.monotonic()
+
+    if use_cache:
+        hit = get_query_cache().lookup(query)
+        if hit:
+            print_cached_news(query, hit)
+            log_query(query, time.monotonic() - started, "cache:prefetch" if hit["source"] == "prefetch" else "cache")
+            return True
+
+    if use_local:
+        local = answer_locally(query)
+        if local:
+            print_local_answer(query, local)
+            usage = normalize_usage(local["result"].get("usage"))
+            log_query(query, time.monotonic() - started, "local",
+                      tokens=usage["input_tokens"] + usage["output_tokens"])
+            return True
 
     url = f"{API_BASE_URL}/v1/messages"
 
@@ -36,33 +135,23 @@ def get_news_with_web_search(query="最新国际新闻"):
         "Accept-Encoding": "gzip, deflate, br"  # 告诉服务器支持 brotli
     }
 
-    data = {
-        "model": DEFAULT_MODEL,
-        "max_tokens": 2048,
-        "messages": [
-            {
-                "role": "user",
-                "content": f"请搜索并提供{query}，包括：1) 新闻标题 2) 简要内容 3) 来源。用中文回答。"
-            }
-        ],
-        "tools": [{
-            "type": "web_search_20250305",
-            "name": "web_search",
-            "max_uses": 5
-        }]
-    }
+    data = build_web_search_payload(query)
 
     try:
         print("=" * 80)
         print(f"使用 Web Search 工具获取: {query}")
+        print(f"模型: {data['model']}")
         print("=" * 80)
 
+        # 需要搜索网络，超时按历史延迟确定（没有记录时为 90 秒）
+        timeout = request_timeout("/v1/messages", data, default=90)
+
         # 确保 requests 自动处理解压
-        response = requests.post(
+        response = get_session().post(
             url,
             headers=headers,
             json=data,
-            timeout=90  # 增加超时时间，因为需要搜索网络
+            timeout=timeout
         )
 
         print(f"状态码: {response.status_code}")
@@ -74,9 +163,12 @@ def get_news_with_web_search(query="最新国际新闻"):
             try:
                 # 如果响应是 brotli 压缩的，requests 会自动解压
                 result = response.json()
+                # 输出被截断时续写缺少的结尾，不重新搜索
+                result = complete_truncated(url, headers, data, result, timeout=timeout)
 
                 print(f"\n响应类型: {result.get('type', 'unknown')}")
                 print(f"模型: {result.get('model', 'unknown')}")
+                print(f"用量: {format_usage(result.get('usage'))}")
 
                 # 解析内容
                 if "content" in result:
@@ -144,6 +236,13 @@ def get_news_with_web_search(query="最新国际新闻"):
                             json.dump(result, f, indent=2, ensure_ascii=False)
                         print(f"✓ 完整响应已保存到 {json_file}")
 
+                        entry = save_digest(query, result, source="websearch")
+                        print(f"✓ 已归档 ({entry['id']})")
+                        get_query_cache().store(query, result)
+                        usage = normalize_usage(result.get("usage"))
+                        log_query(query, time.monotonic() - started, "websearch",
+                                  tokens=usage["input_tokens"] + usage["output_tokens"])
+
                         return True
                     else:
                         print("⚠️  没有找到文本内容")
@@ -180,20 +279,37 @@ def get_news_with_web_search(query="最新国际新闻"):
             print(f"❌ 请求失败: {response.status_code}")
             print(f"错误: {response.text[:500]}")
 
+        log_query(query, time.monotonic() - started, "error")
         return False
 
     except Exception as e:
         print(f"❌ 发生错误: {type(e).__name__}: {e}")
+        log_query(query, time.monotonic() - started, "error")
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="使用 Web Search 获取最新国际新闻")
+    parser.add_argument("--query", default="最新5条重要国际新闻", help="查询内容")
+    parser.add_argument("--no-cache", action="store_true", help="不使用查询缓存，总是重新搜索")
+    parser.add_argument("--no-local", action="store_true", help="不根据本地归档和文章回答，总是 web_search")
+    args = parser.parse_args()
+
     print("\n" + "=" * 80)
     print("国际新闻获取工具 - 使用 Web Search")
     print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 80 + "\n")
 
+    # 手动指定的模型先用缓存的模型列表校验，避免等待 60-90 秒后才发现模型不可用
+    # （自动选择时路由已排除不可用的模型）
+    pinned_model = os.environ.get('MODEL_OVERRIDE')
+    registry = get_registry()
+    if pinned_model and registry.is_available(pinned_model) is False:
+        print(f"⚠️  模型 {pinned_model} 不在可用模型列表中，请运行 python list_models.py 查看")
+    elif pinned_model and registry.supports_tool(pinned_model, "web_search_20250305") is False:
+        print(f"⚠️  模型 {pinned_model} 之前的 web_search 请求均失败")
+
     # 获取最新的国际新闻
-    get_news_with_web_search("最新5条重要国际新闻")
+    get_news_with_web_search(args.query, use_cache=not args.no_cache, use_local=not args.no_local)
 
     print("\n" + "=" * 80)
     print("完成")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+HTTP 请求层
+所有脚本共享同一个 requests Session（复用连接），
+自动把每次请求的模型延迟记录到模型注册表 (model_registry.py)、
+token 用量和读超时记录到 usage_log.jsonl (usage_tracker.py)，
+并支持通过环境变量启用请求录制 / 回放 (cassette)：
+
+    NEWS_CASSETTE=cassettes/websearch.json   cassette 文件路径
+    NEWS_CASSETTE_MODE=record | replay       录制或回放（默认 replay）
+    NEWS_CASSETTE_SPEED=realtime | fast      回放时保留原始时间节奏或全速回放（默认 realtime）
+
+未使用 cassette 时，请求体相同的并发请求只向上游发送一次 (single_flight.py)，
+设置 NEWS_SINGLE_FLIGHT=0 可关闭。
+
+发往 API 的请求按优先级和租户排队 (scheduler.py)，设置 NEWS_SCHEDULER=0 可关闭。
+API_KEYS 中配置了多个密钥时，请求按各密钥的剩余配额轮换 (key_pool.py)。
+"""
+
+import os
+import threading
+
+import requests
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session():
+    """创建新的 Session，按环境变量挂载 cassette"""
+    cassette_path = os.environ.get('NEWS_CASSETTE')
+    mode = os.environ.get('NEWS_CASSETTE_MODE', 'replay')
+    # 回放的数据不计入模型延迟、超时和 token 用量
+    record = not (cassette_path and mode == 'replay')
+
+    if os.environ.get('NEWS_SCHEDULER', '1') != '0':
+        from scheduler import ScheduledSession
+
+        session_class = ScheduledSession
+    else:
+        session_class = requests.Session
+    if record:
+        from usage_tracker import TimeoutRecordingMixin
+
+        session_class = type(session_class.__name__, (TimeoutRecordingMixin, session_class), {})
+    session = session_class()
+
+    from key_pool import get_key_pool, mount_key_pool
+
+    key_pool = get_key_pool()
+    if cassette_path:
+        from cassette import mount_cassette
+
+        realtime = os.environ.get('NEWS_CASSETTE_SPEED', 'realtime') != 'fast'
+        mount_cassette(session, cassette_path, mode=mode, realtime=realtime)
+    elif os.environ.get('NEWS_SINGLE_FLIGHT', '1') != '0':
+        from single_flight import mount_single_flight
+
+        mount_single_flight(session, key_pool)
+    elif key_pool is not None:
+        mount_key_pool(session, key_pool)
+
+    # 记录每个模型的延迟、工具支持情况和 token 用量
+    if record:
+        import model_registry
+        import usage_tracker
+
+        session.hooks['response'].append(model_registry.record_response)
+        session.hooks['response'].append(usage_tracker.record_response)
+
+    return session
+
+
+def get_session():
+    """获取共享的 Session（首次调用时创建）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def reset_session():
+    """丢弃共享的 Session（修改环境变量后重新创建）"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
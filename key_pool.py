@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+多密钥轮换
+单个 API_KEY 的吞吐受该密钥的限流上限约束。在 API_KEYS 中配置多个密钥后，发往 /v1/ 的请求按密钥轮换：
+
+1. 剩余配额：从响应头（anthropic-ratelimit-* / x-ratelimit-*）读取各密钥的剩余请求数、token 数和重置时间，
+   优先使用剩余比例高、进行中请求少的密钥；配额用完的密钥等到重置时间后再使用
+2. 错误率：按最近请求的失败比例（指数加权）降低选中概率
+3. 冷却：429 后按 retry-after（没有时从 5 秒开始逐次加倍）暂停使用，401 / 403 后暂停 1 小时
+
+所有密钥都不可用时等待最先恢复的密钥（最多 NEWS_KEY_MAX_WAIT 秒，默认 30 秒）。
+轮换在相同请求合并 (single_flight.py) 之后进行，合并的请求只占用一次配额；
+只替换请求头中属于密钥池的密钥，脚本显式指定的其他密钥不受影响。日志中的密钥只显示前 10 位和后 4 位。
+
+http_client.create_session() 在配置了两个及以上密钥时自动挂载。
+
+用法：
+    python key_pool.py                          # 显示密钥池（脱敏）
+    python key_pool.py --demo --keys 1,2,4      # 使用本地模拟服务比较不同密钥数的吞吐
+"""
+
+import argparse
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+from requests.adapters import HTTPAdapter
+
+from cassette import mask_secret
+
+DEFAULT_MAX_WAIT = 30.0
+# 429 没有 retry-after 时的冷却时间（秒），连续 429 时加倍
+RATE_LIMIT_COOLDOWN = 5.0
+MAX_RATE_LIMIT_COOLDOWN = 300.0
+# 401 / 403 后的冷却时间（秒）
+AUTH_COOLDOWN = 3600.0
+# 错误率的指数加权系数
+ERROR_DECAY = 0.2
+
+POOLED_PATH_PREFIX = "/v1/"
+# 换一个密钥重试的状态码
+RETRY_STATUSES = (401, 403, 429)
+
+# 配额种类 -> (上限, 剩余, 重置时间) 响应头，依次为 Anthropic 和 OpenAI 格式
+QUOTA_HEADERS = {
+    "requests": (
+        ("anthropic-ratelimit-requests-limit", "x-ratelimit-limit-requests"),
+        ("anthropic-ratelimit-requests-remaining", "x-ratelimit-remaining-requests"),
+        ("anthropic-ratelimit-requests-reset", "x-ratelimit-reset-requests")
+    ),
+    "tokens": (
+        ("anthropic-ratelimit-tokens-limit", "x-ratelimit-limit-tokens"),
+        ("anthropic-ratelimit-tokens-remaining", "x-ratelimit-remaining-tokens"),
+        ("anthropic-ratelimit-tokens-reset", "x-ratelimit-reset-tokens")
+    )
+}
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value, now=None):
+    """
+    解析配额重置时间，返回时间戳
+    支持 RFC 3339 时间（Anthropic）、"6m0s" / "250ms" 这样的时长（OpenAI）和秒数
+    """
+    now = time.time() if now is None else now
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return now + float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return now + sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_retry_after(value, now=None):
+    """解析 retry-after（秒数或 HTTP 日期），返回需要等待的秒数"""
+    now = time.time() if now is None else now
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+    except (TypeError, ValueError):
+        return None
+
+
+def _header(headers, names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+class _KeyState:
+    """单个密钥的配额、错误率和冷却状态"""
+
+    def __init__(self, key):
+        self.key = key
+        self.label = mask_secret(key)
+        self.in_flight = 0
+        # 配额种类 -> {"limit", "remaining", "reset_at"}
+        self.quota = {}
+        self.cooldown_until = 0.0
+        self.rate_limited_streak = 0
+        self.error_rate = 0.0
+        self.last_used = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.auth_failures = 0
+
+    def _remaining(self, kind, quota, now):
+        """估计的剩余配额：已过重置时间时按上限计，请求数配额扣除进行中的请求；未知时返回 None"""
+        remaining = quota["remaining"] if quota["reset_at"] > now else quota["limit"]
+        if remaining is None:
+            return None
+        return remaining - (self.in_flight if kind == "requests" else 0)
+
+    def ready_at(self, now):
+        """密钥可以再次使用的时间"""
+        ready = self.cooldown_until
+        for kind, quota in self.quota.items():
+            remaining = self._remaining(kind, quota, now)
+            if remaining is not None and remaining <= 0:
+                # 已过重置时间但进行中的请求占满上限时，等进行中的请求结束
+                ready = max(ready, quota["reset_at"] if quota["reset_at"] > now else math.inf)
+        return ready
+
+    def headroom(self, now):
+        """剩余配额比例（0-1），没有配额信息时为 1"""
+        fractions = [1.0]
+        for kind, quota in self.quota.items():
+            remaining = self._remaining(kind, quota, now)
+            if remaining is not None and quota["limit"]:
+                fractions.append(max(0.0, remaining / quota["limit"]))
+        return min(fractions)
+
+    def score(self, now):
+        return self.headroom(now) * (1.0 - self.error_rate) / (1 + self.in_flight)
+
+    def update_quota(self, headers, now):
+        for kind, (limit_names, remaining_names, reset_names) in QUOTA_HEADERS.items():
+            remaining = _header(headers, remaining_names)
+            if remaining is None:
+                continue
+            try:
+                remaining = int(float(remaining))
+                limit = _header(headers, limit_names)
+                limit = int(float(limit)) if limit is not None else None
+            except ValueError:
+                continue
+            reset_at = parse_reset(_header(headers, reset_names), now) or now + 60
+            previous = self.quota.get(kind)
+            # 并发请求的响应到达顺序和服务端计数顺序不一定相同，同一窗口内取最小的剩余数
+            if previous and abs(previous["reset_at"] - reset_at) < 1 and previous["reset_at"] > now:
+                remaining = min(remaining, previous["remaining"])
+            self.quota[kind] = {"limit": limit, "remaining": remaining, "reset_at": reset_at}
+
+
+class KeyPool:
+    """按剩余配额、错误率和冷却状态在多个密钥之间分配请求"""
+
+    def __init__(self, keys, max_wait=None, verbose=True):
+        if not keys:
+            raise ValueError("密钥池为空")
+        self.verbose = verbose
+        self.states = [_KeyState(key) for key in dict.fromkeys(keys)]
+        self.keys = {state.key for state in self.states}
+        self.max_wait = float(os.environ.get("NEWS_KEY_MAX_WAIT", DEFAULT_MAX_WAIT)) if max_wait is None else max_wait
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.states)
+
+    def has_ready(self, exclude=()):
+        """除 exclude 外是否有现在就能使用的密钥"""
+        now = time.time()
+        with self._condition:
+            return any(state.ready_at(now) <= now for state in self.states if state not in exclude)
+
+    def acquire(self, max_wait=None):
+        """
+        选择一个密钥并计入进行中的请求，用完后调用 release()
+        所有密钥都不可用时最多等待 max_wait 秒；最先恢复的密钥也要更久时不再等待，直接使用它
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        give_up = time.time() + max_wait
+
+        with self._condition:
+            while True:
+                now = time.time()
+                ready = [state for state in self.states if state.ready_at(now) <= now]
+                if ready:
+                    state = max(ready, key=lambda state: (state.score(now), -state.last_used))
+                    break
+
+                state = min(self.states, key=lambda state: state.ready_at(now))
+                wake = state.ready_at(now)
+                if wake == math.inf:
+                    # 只是在等进行中的请求结束，release() 会唤醒
+                    self._condition.wait(max(0.0, give_up - now))
+                    if time.time() < give_up:
+                        continue
+                    break
+                if wake > give_up:
+                    print(f"⚠️  所有密钥都在冷却或配额已用完，使用 {state.label}"
+                          f"（{wake - now:.0f} 秒后恢复）")
+                    break
+                self._condition.wait(wake - now)
+
+            state.in_flight += 1
+            state.requests += 1
+            state.last_used = now
+            return state
+
+    def release(self, state, response=None, error=None):
+        """请求结束：按响应更新配额、错误率和冷却状态；error 为请求异常"""
+        message = None
+        with self._condition:
+            now = time.time()
+            state.in_flight -= 1
+            failed = True
+
+            if response is not None:
+                state.update_quota(response.headers, now)
+                status = response.status_code
+                if status == 429:
+                    state.rate_limited += 1
+                    state.rate_limited_streak += 1
+                    wait = parse_retry_after(response.headers.get("retry-after"), now)
+                    if wait is None:
+                        wait = min(RATE_LIMIT_COOLDOWN * 2 ** (state.rate_limited_streak - 1), MAX_RATE_LIMIT_COOLDOWN)
+                    state.cooldown_until = max(state.cooldown_until, now + wait)
+                    message = f"⚠️  密钥 {state.label} 被限流 (429)，冷却 {wait:.0f} 秒"
+                elif status in (401, 403):
+                    state.auth_failures += 1
+                    state.cooldown_until = max(state.cooldown_until, now + AUTH_COOLDOWN)
+                    message = f"⚠️  密钥 {state.label} 认证失败 ({status})，{AUTH_COOLDOWN / 60:.0f} 分钟内不再使用"
+                else:
+                    state.rate_limited_streak = 0
+                    failed = status >= 500
+
+            if failed:
+                state.errors += 1
+            state.error_rate = (1 - ERROR_DECAY) * state.error_rate + ERROR_DECAY * failed
+            self._condition.notify_all()
+
+        if message and self.verbose:
+            print(message)
+
+    def snapshot(self):
+        """各密钥的状态（密钥已脱敏）"""
+        now = time.time()
+        with self._condition:
+            keys = []
+            for state in self.states:
+                requests_quota = state.quota.get("requests")
+                keys.append({
+                    "key": state.label,
+                    "requests": state.requests,
+                    "errors": state.errors,
+                    "rate_limited": state.rate_limited,
+                    "auth_failures": state.auth_failures,
+                    "error_rate": round(state.error_rate, 3),
+                    "in_flight": state.in_flight,
+                    "remaining": requests_quota["remaining"] if requests_quota else None,
+                    "headroom": round(state.headroom(now), 3),
+                    "cooldown": round(max(0.0, state.cooldown_until - now), 1)
+                })
+            return keys
+
+
+def _pooled_header(request, pool):
+    """请求头中属于密钥池的密钥，返回 (头名称, 前缀)，不属于时返回 None"""
+    path = request.path_url.split("?", 1)[0]
+    if not path.startswith(POOLED_PATH_PREFIX):
+        return None
+    if request.headers.get("x-api-key") in pool.keys:
+        return "x-api-key", ""
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer ") and authorization[len("Bearer "):] in pool.keys:
+        return "Authorization", "Bearer "
+    return None
+
+
+class KeyPoolAdapter(HTTPAdapter):
+    """实际发往上游前从密钥池选择密钥"""
+
+    key_pool = None
+
+    def __init__(self, key_pool=None, **kwargs):
+        super().__init__(**kwargs)
+        if key_pool is not None:
+            self.key_pool = key_pool
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        pool = self.key_pool
+        header = _pooled_header(request, pool) if pool is not None else None
+        if header is None:
+            return super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+
+        # 等待密钥恢复的时间不超过请求的读超时
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        max_wait = min(pool.max_wait, read_timeout) if read_timeout else None
+        name, prefix = header
+        tried = []
+
+        while True:
+            state = pool.acquire(max_wait)
+            tried.append(state)
+            request.headers[name] = prefix + state.key
+            try:
+                response = super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert,
+                                        proxies=proxies)
+            except Exception as e:
+                pool.release(state, error=e)
+                raise
+            pool.release(state, response)
+
+            # 限流或认证失败时，有其他可用的密钥就换一个重试（每个密钥最多一次）
+            if response.status_code not in RETRY_STATUSES or not pool.has_ready(exclude=tried):
+                return response
+            response.close()
+
+
+def pooled_adapter(adapter_class, key_pool, **kwargs):
+    """
+    创建在 adapter_class 之后轮换密钥的适配器
+    例如 pooled_adapter(SingleFlightAdapter, pool)：先合并相同请求，只有实际发出的请求占用密钥
+    """
+    cls = type(f"Pooled{adapter_class.__name__}", (adapter_class, KeyPoolAdapter), {"key_pool": key_pool})
+    return cls(**kwargs)
+
+
+def mount_key_pool(session, key_pool):
+    """在 session 上挂载密钥轮换适配器，返回适配器"""
+    adapter = KeyPoolAdapter(key_pool)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return adapter
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_key_pool():
+    """进程内共享的密钥池；配置的密钥少于两个时返回 None"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                try:
+                    from config import get_api_keys
+
+                    keys = get_api_keys()
+                except ValueError:
+                    keys = []
+                _pool = KeyPool(keys) if len(keys) >= 2 else False
+    return _pool or None
+
+
+def run_demo(base_url, key_count, rate, duration, workers):
+    """模拟服务按密钥限流时，测量 key_count 个密钥的吞吐"""
+    import requests
+
+    pool = KeyPool([f"mock-{'x' * 16}-key{i:02d}" for i in range(key_count)], verbose=False)
+    session = requests.Session()
+    mount_key_pool(session, pool)
+    headers = {"x-api-key": pool.states[0].key, "anthropic-version": "2023-06-01", "content-type": "application/json"}
+    payload = {"model": "claude-3-5-haiku-20241022", "max_tokens": 64, "messages": [{"role": "user", "content": "ping"}]}
+    stop_at = time.monotonic() + duration
+    counts = {"ok": 0, "limited": 0}
+    lock = threading.Lock()
+
+    def worker():
+        while time.monotonic() < stop_at:
+            response = session.post(f"{base_url}/v1/messages", headers=headers, json=payload, timeout=10)
+            with lock:
+                counts["ok" if response.status_code == 200 else "limited"] += 1
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(workers):
+            executor.submit(worker)
+    elapsed = time.monotonic() - started
+    return counts["ok"] / elapsed, counts["limited"], pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多密钥轮换")
+    parser.add_argument("--demo", action="store_true", help="使用本地模拟服务比较不同密钥数的吞吐")
+    parser.add_argument("--keys", default="1,2,4", help="演示的密钥数（逗号分隔）")
+    parser.add_argument("--rate", type=int, default=10, help="模拟服务每个密钥每秒的请求上限")
+    parser.add_argument("--duration", type=float, default=5, help="每轮演示的时长（秒）")
+    parser.add_argument("--workers", type=int, default=16, help="并发请求数")
+    args = parser.parse_args()
+
+    if not args.demo:
+        pool = get_key_pool()
+        if pool is None:
+            print("未配置密钥池（API_KEYS 中至少需要两个密钥），所有请求使用 API_KEY")
+            return
+        print(f"密钥池: {len(pool)} 个密钥")
+        for key in pool.snapshot():
+            print(f"  {key['key']}")
+        return
+
+    from mock_server import start_mock_server
+
+    _, base_url = start_mock_server(latency=0.05, key_rate_limit=args.rate)
+    print(f"模拟服务每个密钥每秒最多 {args.rate} 个请求，{args.workers} 个并发，每轮 {args.duration:g} 秒")
+    print("-" * 80)
+
+    baseline = None
+    for key_count in [int(value) for value in args.keys.split(",") if value.strip()]:
+        throughput, limited, pool = run_demo(base_url, key_count, args.rate, args.duration, args.workers)
+        baseline = baseline or throughput / key_count
+        print(f"{key_count:>3} 个密钥: {throughput:6.1f} 请求/秒  "
+              f"（单密钥的 {throughput / baseline:.1f} 倍）  429: {limited}")
+        for key in pool.snapshot():
+            print(f"      {key['key']}  请求 {key['requests']:>4}  429 {key['rate_limited']:>3}  "
+                  f"错误率 {key['error_rate']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,53 @@
 #!/usr/bin/env python3
 """
 列出 API 支持的所有模型
+模型列表来自模型注册表缓存，过期后才会重新请求 /v1/models
 """
 
-import requests
+import argparse
 import json
-from config import API_KEY, API_BASE_URL
+from model_registry import get_registry
 
-def list_models():
+def list_models(force=False):
     """获取可用的模型列表"""
 
-    url = f"{API_BASE_URL}/v1/models"
-
-    headers = {
-        "Authorization": f"Bearer {API_KEY}"
-    }
+    registry = get_registry()
 
     try:
         print("正在获取可用模型列表...")
         print("-" * 80)
 
-        response = requests.get(url, headers=headers, timeout=30)
+        was_fresh = registry.is_fresh()
+        if not registry.refresh(force=force):
+            print("❌ 无法获取模型列表，且没有本地缓存")
+            return
 
-        print(f"响应状态码: {response.status_code}")
+        if was_fresh and not force:
+            print("使用缓存的模型列表（python list_models.py --refresh 强制刷新）")
 
-        if response.status_code == 200:
-            result = response.json()
+        models = [registry.data["models"][model_id] for model_id in registry.model_ids()]
+        print(f"\n找到 {len(models)} 个可用模型:\n")
 
-            if "data" in result:
-                models = result["data"]
-                print(f"\n找到 {len(models)} 个可用模型:\n")
+        for i, model in enumerate(models, 1):
+            model_id = model.get("id", "N/A")
+            stats = registry.stats(model_id)
+            if stats and stats["latency_ewma"] is not None:
+                print(f"{i}. {model_id}  (平均延迟 {stats['latency_ewma']:.1f}s, 请求 {stats['requests']} 次)")
+            else:
+                print(f"{i}. {model_id}")
 
-                for i, model in enumerate(models, 1):
-                    model_id = model.get("id", "N/A")
-                    print(f"{i}. {model_id}")
+        # 保存到文件
+        with open("available_models.json", "w", encoding="utf-8") as f:
+            json.dump({"object": "list", "data": models}, f, indent=2, ensure_ascii=False)
 
-                # 保存到文件
-                with open("available_models.json", "w", encoding="utf-8") as f:
-                    json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\n✓ 完整模型信息已保存到 available_models.json")
 
-                print(f"\n✓ 完整模型信息已保存到 available_models.json")
-            else:
-                print("响应中没有找到模型数据")
-                print(f"完整响应: {json.dumps(result, indent=2, ensure_ascii=False)}")
-        else:
-            print(f"请求失败，响应内容: {response.text}")
-
-    except requests.exceptions.RequestException as e:
-        print(f"❌ 请求失败: {e}")
-    except json.JSONDecodeError as e:
-        print(f"❌ 解析响应失败: {e}")
     except Exception as e:
         print(f"❌ 发生错误: {e}")
 
 if __name__ == "__main__":
-    list_models()
+    parser = argparse.ArgumentParser(description="列出 API 支持的所有模型")
+    parser.add_argument("--refresh", action="store_true", help="忽略缓存，重新验证模型列表")
+    args = parser.parse_args()
+
+    list_models(force=args.refresh)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+API 中转压测工具
+用 N 个并发虚拟用户（闭环）或固定到达率（开环）向 API_BASE_URL 或本地模拟服务发送请求，
+统计延迟分位数、错误分布和吞吐量，并可逐级加压找出吞吐量上限。
+
+用法：
+    python load_test.py --users 10 --duration 30
+    python load_test.py --rate 5 --duration 60 --mix chat=6,messages=3,websearch=1
+    python load_test.py --ramp 1,2,4,8,16 --duration 20
+    python load_test.py --mock --users 20 --duration 10
+"""
+
+import argparse
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+REQUEST_KINDS = ("chat", "messages", "websearch")
+DEFAULT_MIX = "chat=5,messages=3,websearch=2"
+
+
+def parse_mix(text):
+    """解析请求配比，例如 chat=5,messages=3,websearch=2"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in REQUEST_KINDS:
+            raise ValueError(f"未知的请求类型: {name}（可选 {', '.join(REQUEST_KINDS)}）")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(values, p):
+    """计算分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class RequestFactory:
+    """按配比生成请求（复用各脚本中的请求体）"""
+
+    def __init__(self, api_base_url, api_key, mix):
+        from get_news_final import build_chat_payload, build_messages_payload
+        from get_news_with_websearch_final import build_web_search_payload
+
+        anthropic_headers = {
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+        openai_headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+
+        self.templates = {
+            "chat": (f"{api_base_url}/v1/chat/completions", openai_headers, build_chat_payload),
+            "messages": (f"{api_base_url}/v1/messages", anthropic_headers, build_messages_payload),
+            "websearch": (f"{api_base_url}/v1/messages", anthropic_headers,
+                          lambda: build_web_search_payload("最新5条重要国际新闻"))
+        }
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+
+    def next(self, rng):
+        kind = rng.choices(self.kinds, weights=self.weights)[0]
+        url, headers, build = self.templates[kind]
+        return kind, url, headers, build()
+
+
+class LoadStats:
+    """线程安全的结果统计"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.sent = Counter()
+        self.dropped = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, kind, latency, error=None):
+        with self.lock:
+            self.sent[kind] += 1
+            if error:
+                self.errors[(kind, error)] += 1
+            else:
+                self.latencies[kind].append(latency)
+
+    def drop(self):
+        with self.lock:
+            self.dropped += 1
+
+    def stop(self):
+        self.finished = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def successes(self):
+        return sum(len(values) for values in self.latencies.values())
+
+    @property
+    def total(self):
+        return sum(self.sent.values())
+
+    def throughput(self):
+        return self.successes / self.elapsed if self.elapsed else 0.0
+
+    def error_rate(self):
+        return 1 - self.successes / self.total if self.total else 0.0
+
+    def report(self, title="压测结果"):
+        print("\n" + "=" * 80)
+        print(title)
+        print("=" * 80)
+        print(f"持续时间: {self.elapsed:.1f}s  请求总数: {self.total}  成功: {self.successes}  "
+              f"错误率: {self.error_rate() * 100:.1f}%")
+        print(f"吞吐量: {self.throughput():.2f} 成功请求/秒  (发送 {self.total / self.elapsed:.2f} 请求/秒)")
+        if self.dropped:
+            print(f"⚠️  客户端并发已满，丢弃 {self.dropped} 个到达请求（可调大 --max-inflight）")
+
+        print(f"\n{'类型':<12}{'请求':>8}{'成功':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        all_latencies = []
+        for kind in sorted(self.sent):
+            values = self.latencies.get(kind, [])
+            all_latencies.extend(values)
+            self._print_row(kind, self.sent[kind], values)
+        self._print_row("全部", self.total, all_latencies)
+
+        if self.errors:
+            print("\n错误分布:")
+            for (kind, error), count in self.errors.most_common():
+                print(f"  {kind:<12}{error:<40}{count:>6}")
+
+    @staticmethod
+    def _print_row(name, sent, values):
+        cells = [percentile(values, p) for p in (50, 90, 95, 99)] + [max(values) if values else 0.0]
+        print(f"{name:<12}{sent:>8}{len(values):>8}" + "".join(f"{v:>8.2f}s" for v in cells))
+
+
+def _describe_error(response=None, exc=None):
+    if exc is not None:
+        return type(exc).__name__
+    return f"HTTP {response.status_code}"
+
+
+def send_one(session, factory, rng, stats, timeout, scheduled=None):
+    """发送一个请求并记录结果；开环模式下延迟从计划到达时间开始计算"""
+    kind, url, headers, payload = factory.next(rng)
+    start = scheduled if scheduled is not None else time.monotonic()
+
+    try:
+        response = session.post(url, headers=headers, json=payload, timeout=timeout)
+        response.content
+        error = None if response.status_code == 200 else _describe_error(response=response)
+    except requests.exceptions.RequestException as e:
+        error = _describe_error(exc=e)
+
+    stats.record(kind, time.monotonic() - start, error)
+
+
+def run_closed_loop(factory, users, duration, timeout):
+    """闭环模式：每个虚拟用户收到响应后立即发送下一个请求"""
+    stats = LoadStats()
+    deadline = stats.started + duration
+
+    def user_loop(user_id):
+        session = requests.Session()
+        rng = random.Random(user_id)
+        while time.monotonic() < deadline:
+            send_one(session, factory, rng, stats, timeout)
+
+    threads = [threading.Thread(target=user_loop, args=(i,), daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats.stop()
+    return stats
+
+
+def run_open_loop(factory, rate, duration, timeout, max_inflight):
+    """开环模式：按泊松过程到达，不受响应快慢影响"""
+    stats = LoadStats()
+    deadline = stats.started + duration
+    local = threading.local()
+    slots = threading.BoundedSemaphore(max_inflight)
+    rng = random.Random(0)
+
+    def worker(scheduled, seed):
+        try:
+            if not hasattr(local, "session"):
+                local.session = requests.Session()
+            send_one(local.session, factory, random.Random(seed), stats, timeout, scheduled)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        next_arrival = time.monotonic()
+        while next_arrival < deadline:
+            delay = next_arrival - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            if slots.acquire(blocking=False):
+                executor.submit(worker, next_arrival, rng.random())
+            else:
+                stats.drop()
+
+            next_arrival += rng.expovariate(rate)
+
+    stats.stop()
+    return stats
+
+
+def run_ramp(factory, steps, duration, timeout, open_loop, max_inflight):
+    """逐级加压，找出吞吐量上限"""
+    results = []
+    for step in steps:
+        label = f"到达率 {step}/s" if open_loop else f"并发用户 {step}"
+        print(f"\n▶ {label}，持续 {duration}s ...")
+        if open_loop:
+            stats = run_open_loop(factory, step, duration, timeout, max_inflight)
+        else:
+            stats = run_closed_loop(factory, int(step), duration, timeout)
+        stats.report(f"压测结果 - {label}")
+        results.append((step, stats))
+
+    print("\n" + "=" * 80)
+    print("吞吐量上限分析")
+    print("=" * 80)
+    print(f"{'负载':>10}{'吞吐量':>12}{'p95':>10}{'错误率':>10}")
+
+    best_step, best = results[0]
+    for step, stats in results:
+        all_latencies = [v for values in stats.latencies.values() for v in values]
+        print(f"{step:>10}{stats.throughput():>10.2f}/s{percentile(all_latencies, 95):>9.2f}s"
+              f"{stats.error_rate() * 100:>9.1f}%")
+        if stats.throughput() > best.throughput():
+            best_step, best = step, stats
+
+    print(f"\n吞吐量上限约 {best.throughput():.2f} 成功请求/秒（负载 {best_step}）")
+    for (step, stats), (prev_step, prev) in zip(results[1:], results):
+        if stats.error_rate() > 0.05 or stats.throughput() < prev.throughput() * 1.1:
+            print(f"从负载 {step} 开始吞吐量不再随负载增长（或错误率超过 5%），已接近上限")
+            break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API 中转压测工具")
+    parser.add_argument("--users", type=int, default=5, help="闭环模式的并发虚拟用户数")
+    parser.add_argument("--rate", type=float, help="开环模式的到达率（请求/秒），设置后使用开环模式")
+    parser.add_argument("--duration", type=float, default=30, help="每轮压测时长（秒）")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"请求配比（默认 {DEFAULT_MIX}）")
+    parser.add_argument("--ramp", help="逐级加压，逗号分隔的并发数（开环模式下为到达率）")
+    parser.add_argument("--timeout", type=float, default=90, help="单个请求超时（秒）")
+    parser.add_argument("--max-inflight", type=int, default=256, help="开环模式的最大在途请求数")
+    parser.add_argument("--mock", action="store_true", help="启动本地模拟服务并对其压测")
+    parser.add_argument("--mock-latency", type=float, default=0.2)
+    parser.add_argument("--mock-websearch-latency", type=float, default=1.0)
+    parser.add_argument("--mock-max-concurrency", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mock:
+        from mock_server import start_mock_server
+
+        _, base_url = start_mock_server(
+            latency=args.mock_latency,
+            websearch_latency=args.mock_websearch_latency,
+            max_concurrency=args.mock_max_concurrency
+        )
+        os.environ["API_BASE_URL"] = base_url
+        os.environ.setdefault("API_KEY", "mock-key")
+
+    from config import API_KEY, API_BASE_URL
+
+    factory = RequestFactory(API_BASE_URL, API_KEY, parse_mix(args.mix))
+    open_loop = args.rate is not None
+
+    print("=" * 80)
+    print("API 压测")
+    print(f"目标: {API_BASE_URL}{'（本地模拟）' if args.mock else ''}")
+    print(f"模式: {'开环' if open_loop else '闭环'}  请求配比: {args.mix}")
+    print("=" * 80)
+
+    if args.ramp:
+        steps = [float(s) if open_loop else int(s) for s in args.ramp.split(",")]
+        run_ramp(factory, steps, args.duration, args.timeout, open_loop, args.max_inflight)
+    elif open_loop:
+        run_open_loop(factory, args.rate, args.duration, args.timeout, args.max_inflight).report()
+    else:
+        run_closed_loop(factory, args.users, args.duration, args.timeout).report()
+
+
+if __name__ == "__main__":
+    main()
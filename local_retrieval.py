@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+本地检索回答
+"X 最近怎么样"、"Y 的最新进展"这类查询，往往一小时前刚获取过相关新闻。
+在发起 web_search 之前，先对最近的归档新闻（按条拆分）和已抓取的来源文章 (article_cache/) 做 BM25 检索；
+有足够新、足够相关的资料时，用轻量模型只根据这些资料回答，不再触发 web_search_20250305。
+
+- 中日韩文字按相邻二字、其他文字按单词切分；查询中的"最新""新闻""国际"等泛化词不参与匹配
+- 同一条新闻出现在多份摘要或同时被抓取为文章时，按标题或链接去重后再检索
+- 相关性按命中的查询词 IDF 占比（覆盖率）判断，至少 MIN_DOCUMENTS 篇资料达到 MIN_COVERAGE 才在本地回答
+- 资料时效默认 2 小时（NEWS_LOCAL_MAX_AGE，秒）；模型认为资料不足时回复 NO_ANSWER，转为 web_search
+- 结果记录在查询日志中 (served="local")，--report 统计本地回答的比例和节省的等待时间
+
+用法：
+    python local_retrieval.py --query "日本最近发生了什么"
+    python local_retrieval.py --report --days 7
+    python local_retrieval.py --query "欧盟 人工智能" --mock
+"""
+
+import argparse
+import math
+import os
+import re
+import statistics
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import requests
+
+DEFAULT_MAX_AGE = 7200
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 命中的查询词 IDF 占比达到该值的资料才算相关
+MIN_COVERAGE = 0.6
+# 至少有这么多篇相关资料才在本地回答
+MIN_DOCUMENTS = 2
+# 交给模型的资料篇数和每篇的最大字符数
+TOP_K = 6
+MAX_DOCUMENT_CHARS = 1500
+
+NO_ANSWER = "NO_ANSWER"
+
+LOCAL_SYSTEM_PROMPT = (f"你是一个国际新闻助手。只根据用户提供的资料回答，不要使用资料以外的信息；"
+                       f"每条新闻包括标题、简要内容和资料中的来源链接。资料不足以回答问题时只回复 {NO_ANSWER}。用中文回答。")
+
+# 不参与匹配的泛化词（查询先经过 query_cache.normalize_query 规范化）
+GENERIC_PATTERN = re.compile(r"\d+条|最新|新闻|国际|消息|情况|动态|进展|发生|什么|怎么样|有哪些|哪些|关于|有关|了|吗|呢|？|\?")
+
+
+def tokenize(text):
+    """切分为检索词：中日韩文字取相邻二字，其他文字取单词
+
+    只有在原文中紧挨着的两个字才组成二字词，空格和标点两侧的字不组合，
+    例如 "印度 气象卫星" 不会产生 "度气"。
+    """
+    from news_cluster import TOKEN_PATTERN, normalize_text
+
+    matches = list(TOKEN_PATTERN.finditer(normalize_text(text)))
+    terms = [match.group() for match in matches if match.group().isascii()]
+    terms.extend(a.group() + b.group() for a, b in zip(matches, matches[1:])
+                 if a.end() == b.start() and not a.group().isascii() and not b.group().isascii())
+    return terms
+
+
+def title_key(title):
+    """去掉空格、标点和大小写差异后的标题，用于识别同一条新闻"""
+    from news_cluster import TOKEN_PATTERN, normalize_text
+
+    return "".join(TOKEN_PATTERN.findall(normalize_text(title)))
+
+
+def dedup_documents(candidates):
+    """
+    同一条新闻可能出现在多份摘要里，也可能同时被抓取为来源文章；
+    按标题或链接去重，只保留最新的一份，避免重复计入 MIN_DOCUMENTS。
+    candidates 为 [(资料, 用于去重的链接)]
+    """
+    seen_titles = set()
+    seen_urls = set()
+    documents = []
+    for doc, links in sorted(candidates, key=lambda item: -item[0]["time"]):
+        key = title_key(doc["title"])
+        if (key and key in seen_titles) or seen_urls.intersection(links):
+            continue
+        if key:
+            seen_titles.add(key)
+        seen_urls.update(links)
+        documents.append(doc)
+    return documents
+
+
+def query_terms(query):
+    """查询的检索词（去掉泛化词和重复）"""
+    from news_cluster import normalize_text
+    from query_cache import normalize_query
+
+    # normalize_query 会删掉空格，按空格分开规范化，"欧盟 人工智能" 不产生 "盟人"
+    parts = [normalize_query(part) for part in normalize_text(query).split()]
+    return list(dict.fromkeys(tokenize(GENERIC_PATTERN.sub(" ", " ".join(parts)))))
+
+
+class BM25Index:
+    """内存中的 BM25 索引"""
+
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(f"{doc['title']}\n{doc['text']}")) for doc in documents]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.document_frequency = Counter()
+        for counts in self.term_counts:
+            self.document_frequency.update(counts.keys())
+
+    def idf(self, term):
+        n = len(self.documents)
+        df = self.document_frequency.get(term, 0)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, terms, top_k=TOP_K):
+        """返回 [(得分, 覆盖率, 资料)]，按得分从高到低"""
+        if not terms or not self.documents:
+            return []
+        weights = {term: self.idf(term) for term in terms}
+        total_weight = sum(weights.values())
+
+        results = []
+        for doc, counts, length in zip(self.documents, self.term_counts, self.lengths):
+            score = 0.0
+            matched = 0.0
+            for term, weight in weights.items():
+                frequency = counts.get(term, 0)
+                if not frequency:
+                    continue
+                matched += weight
+                norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+                score += weight * frequency * (self.k1 + 1) / (frequency + norm)
+            if score > 0:
+                results.append((score, matched / total_weight, doc))
+
+        results.sort(key=lambda item: -item[0])
+        return results[:top_k]
+
+
+def collect_documents(max_age=None, now=None):
+    """最近 max_age 秒内的归档新闻（按条拆分）和抓取的来源文章（已去重）"""
+    from article_fetcher import ArticleCache
+    from news_archive import iter_digests, split_news_items
+
+    max_age = max_age or float(os.environ.get("NEWS_LOCAL_MAX_AGE", DEFAULT_MAX_AGE))
+    now = now or time.time()
+    candidates = []
+
+    for digest in iter_digests(since=datetime.fromtimestamp(now - max_age)):
+        archived_at = datetime.fromisoformat(digest["archived_at"]).timestamp()
+        urls = [result["url"] for result in digest.get("search_results", [])]
+        for item in split_news_items(digest.get("text", "")):
+            # 条目里没有链接时用摘要的第一个搜索结果作来源，但它不代表这条新闻，不参与去重
+            links = re.findall(r"https?://[^\s)）>\]]+", item["summary"])
+            candidates.append(({
+                "kind": "digest",
+                "title": item["title"],
+                "text": item["summary"],
+                "time": archived_at,
+                "urls": links or urls[:1],
+                "query": digest["query"]
+            }, links))
+
+    cache = ArticleCache()
+    for url, meta in list(cache.index.items()):
+        if now - meta.get("fetched_at", 0) > max_age:
+            continue
+        article = cache.load_text(meta)
+        if article.get("text"):
+            candidates.append(({
+                "kind": "article",
+                "title": article.get("title") or meta.get("title", ""),
+                "text": article["text"],
+                "time": meta["fetched_at"],
+                "urls": [url]
+            }, [url]))
+
+    return dedup_documents(candidates)
+
+
+def retrieve(query, max_age=None, top_k=TOP_K):
+    """检索相关资料，不足以在本地回答时返回空列表"""
+    terms = query_terms(query)
+    if not terms:
+        return []
+    results = BM25Index(collect_documents(max_age)).search(terms, top_k=top_k)
+    relevant = [(score, coverage, doc) for score, coverage, doc in results if coverage >= MIN_COVERAGE]
+    return relevant if len(relevant) >= MIN_DOCUMENTS else []
+
+
+def answer_from_documents(query, documents, model=None, timeout=None):
+    """用轻量模型只根据资料回答，返回 (回答, 响应)；模型认为资料不足时回答为 None"""
+    from adaptive_timeout import request_timeout
+    from config import API_KEY, API_BASE_URL
+    from http_client import get_session
+    from model_router import choose_model
+    from news_archive import extract_digest
+
+    url = f"{API_BASE_URL}/v1/messages"
+    headers = {
+        "x-api-key": API_KEY,
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json"
+    }
+    sections = []
+    for i, doc in enumerate(documents, 1):
+        when = datetime.fromtimestamp(doc["time"]).strftime("%Y-%m-%d %H:%M")
+        sources = "\n".join(f"来源: {link}" for link in doc["urls"])
+        sections.append(f"[{i}] {doc['title']}（{when}）\n{doc['text'][:MAX_DOCUMENT_CHARS]}\n{sources}".strip())
+    data = {
+        "model": model or choose_model("knowledge", max_latency=30),
+        "max_tokens": 1024,
+        "system": LOCAL_SYSTEM_PROMPT,
+        "messages": [
+            {
+                "role": "user",
+                "content": "资料：\n\n" + "\n\n".join(sections) + f"\n\n问题：{query}"
+            }
+        ]
+    }
+    timeout = timeout or request_timeout("/v1/messages", data, default=30)
+
+    response = get_session().post(url, headers=headers, json=data, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"请求失败: {response.status_code} {response.text[:300]}")
+    result = response.json()
+    text = extract_digest(result)["text"].strip()
+    if not text or text.startswith(NO_ANSWER):
+        return None, result
+    return text, result
+
+
+def answer_locally(query, max_age=None):
+    """
+    尝试根据本地资料回答
+    成功返回 {"text", "documents", "result", "latency"}，没有足够的资料或请求失败时返回 None
+    """
+    started = time.monotonic()
+    try:
+        matches = retrieve(query, max_age)
+        if not matches:
+            return None
+        documents = [doc for _, _, doc in matches]
+        text, result = answer_from_documents(query, documents)
+    except (RuntimeError, OSError, requests.exceptions.RequestException) as e:
+        print(f"⚠️  本地检索回答失败，改用 web_search: {e}")
+        return None
+    if text is None:
+        return None
+    return {"text": text, "documents": documents, "result": result, "latency": time.monotonic() - started}
+
+
+def print_local_answer(query, answer):
+    """显示本地回答和引用的资料"""
+    print("=" * 80)
+    print(f"查询: {query}")
+    print(f"📚 根据本地资料回答（{len(answer['documents'])} 篇，用时 {answer['latency']:.1f} 秒，未使用 web_search）")
+    print("-" * 80)
+    for i, doc in enumerate(answer["documents"], 1):
+        age = (time.time() - doc["time"]) / 60
+        kind = "归档" if doc["kind"] == "digest" else "文章"
+        print(f"   [{i}] [{kind}，{age:.0f} 分钟前] {doc['title'][:60]}")
+    print(f"\n📰 AI 总结:\n")
+    print(answer["text"])
+    print("=" * 80)
+
+
+def local_report(days=7):
+    """按查询日志统计本地回答的比例和节省的等待时间"""
+    from query_log import load_query_log
+
+    entries = load_query_log(since=time.time() - days * 86400)
+    by_served = defaultdict(list)
+    for entry in entries:
+        by_served[entry["served"]].append(entry["latency"])
+
+    local = by_served.get("local", [])
+    live = by_served.get("websearch", [])
+    report = {
+        "queries": len(entries),
+        "local": len(local),
+        "local_ratio": len(local) / len(entries) if entries else 0.0,
+        "local_latency": statistics.mean(local) if local else None,
+        "websearch_latency": statistics.median(live) if live else None,
+        "saved_seconds": None
+    }
+    if local and live:
+        report["saved_seconds"] = sum(max(0.0, report["websearch_latency"] - latency) for latency in local)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="根据本地资料回答新闻查询")
+    parser.add_argument("--query", help="查询内容")
+    parser.add_argument("--max-age", type=float, help="资料时效（秒，默认 NEWS_LOCAL_MAX_AGE 或 7200）")
+    parser.add_argument("--report", action="store_true", help="统计本地回答的比例和节省的等待时间")
+    parser.add_argument("--days", type=float, default=7, help="统计最近 N 天")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟服务")
+    args = parser.parse_args()
+
+    if args.mock:
+        from mock_server import seed_mock_archive, start_mock_server
+
+        _, base_url = start_mock_server()
+        # 模拟服务使用临时的状态目录，先写入几份模拟摘要
+        seed_mock_archive()
+        os.environ["API_BASE_URL"] = base_url
+        os.environ.setdefault("API_KEY", "mock-key")
+
+    if args.query:
+        terms = query_terms(args.query)
+        print(f"检索词: {' '.join(terms) or '（无，查询过于宽泛）'}")
+        for score, coverage, doc in BM25Index(collect_documents(args.max_age)).search(terms):
+            print(f"   {score:6.2f}  覆盖 {coverage:.0%}  [{doc['kind']}] {doc['title'][:60]}")
+        answer = answer_locally(args.query, args.max_age)
+        if answer:
+            print_local_answer(args.query, answer)
+        else:
+            print("没有足够新、足够相关的本地资料，需要 web_search")
+
+    if args.report or not args.query:
+        report = local_report(args.days)
+        print(f"\n最近 {args.days:g} 天: {report['queries']} 次查询，本地回答 {report['local']} 次"
+              f"（{report['local_ratio'] * 100:.1f}%）")
+        if report["local_latency"] is not None:
+            print(f"本地回答平均 {report['local_latency']:.1f} 秒", end="")
+            if report["websearch_latency"] is not None:
+                print(f"，web_search 中位数 {report['websearch_latency']:.1f} 秒，"
+                      f"共节省等待 {report['saved_seconds'] / 60:.1f} 分钟")
+            else:
+                print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+"""
+本地模拟 API 服务
+模拟中转 API 的 /v1/models、/v1/chat/completions、/v1/messages（含 web_search）
+和 /v1/messages/batches 端点，以及 /articles/<slug> 模拟新闻来源页面，用于压测和离线调试，可配置延迟、错误率和并发上限。
+设置 --key-rate-limit 后按密钥限流（返回 anthropic-ratelimit-* 响应头，超出时返回 429 和 retry-after），
+以 "invalid" 开头的密钥返回 401。
+
+用法：
+    python mock_server.py --port 8787 --latency 0.5 --websearch-latency 3
+    API_BASE_URL=http://127.0.0.1:8787 python get_news_with_websearch_final.py
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_MODELS = [
+    "claude-3-5-haiku-20241022",
+    "claude-haiku-4-5-20251001",
+    "claude-opus-4-1-20250805",
+    "claude-sonnet-4-20250514",
+    "claude-sonnet-4-5-20250929"
+]
+
+# 模拟的新闻条目：(标题, 摘要, 来源 URL)
+MOCK_NEWS = [
+    ("联合国安理会就中东局势召开紧急会议", "安理会成员国呼吁各方保持克制，尽快恢复谈判。", "https://news.un.org/zh/story/mock-1"),
+    ("欧洲央行宣布维持利率不变", "欧洲央行表示通胀压力有所缓解，但仍需保持观察。", "https://www.reuters.com/markets/mock-2"),
+    ("日本举行众议院选举", "执政党联盟保住多数席位，新内阁将于下周组建。", "https://www3.nhk.or.jp/news/mock-3"),
+    ("巴西亚马逊雨林砍伐面积同比下降", "巴西政府称执法力度加强是主要原因。", "https://www.bbc.com/news/mock-4"),
+    ("非洲联盟峰会在亚的斯亚贝巴开幕", "峰会重点讨论区域安全与自由贸易区建设。", "https://www.aljazeera.com/news/mock-5"),
+    ("美国公布最新非农就业数据", "新增就业人数高于预期，失业率维持低位。", "https://apnews.com/article/mock-6"),
+    ("印度成功发射新一代气象卫星", "卫星将提升季风预报的准确性。", "https://www.thehindu.com/sci-tech/mock-7"),
+    ("欧盟通过人工智能监管细则", "新规对高风险 AI 系统提出透明度要求。", "https://www.politico.eu/article/mock-8"),
+    ("国际油价因供应担忧上涨", "布伦特原油价格升至近三个月高位。", "https://www.cnbc.com/mock-9"),
+    ("韩国与东盟签署数字经济合作协议", "协议涵盖跨境数据流动与电子商务。", "https://en.yna.co.kr/view/mock-10"),
+    ("墨西哥举行大规模抗议活动", "抗议者要求政府加强治安措施。", "https://www.cnn.com/world/mock-11"),
+    ("全球芯片销售额创季度新高", "人工智能需求推动半导体行业增长。", "https://www.ft.com/content/mock-12")
+]
+
+
+# 结构化输出中 countries 字段的模拟取值
+MOCK_COUNTRIES = ["日本", "巴西", "美国", "印度", "韩国", "墨西哥", "欧盟"]
+
+
+class MockState:
+    """模拟服务的配置和运行状态"""
+
+    def __init__(self, latency=0.2, websearch_latency=1.0, error_rate=0.0, max_concurrency=0, batch_latency=3.0,
+                 key_rate_limit=0):
+        self.latency = latency
+        self.websearch_latency = websearch_latency
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.batch_latency = batch_latency
+        self.key_rate_limit = key_rate_limit
+        self.key_windows = {}
+        self.batches = {}
+        self.in_flight = 0
+        self.request_count = 0
+        self.article_requests = 0
+        self.lock = threading.Lock()
+
+    def enter(self):
+        with self.lock:
+            self.request_count += 1
+            if self.max_concurrency and self.in_flight >= self.max_concurrency:
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def take_key_quota(self, key):
+        """
+        按密钥限流（每秒 key_rate_limit 个请求的固定窗口）
+        返回 (是否允许, 限流响应头)；未设置限流时返回 (True, {})
+        """
+        if not self.key_rate_limit:
+            return True, {}
+        with self.lock:
+            now = time.time()
+            window, count = self.key_windows.get(key, (0.0, 0))
+            if now - window >= 1.0:
+                window, count = float(int(now)), 0
+            allowed = count < self.key_rate_limit
+            if allowed:
+                count += 1
+            self.key_windows[key] = (window, count)
+        reset = datetime.fromtimestamp(window + 1.0, timezone.utc)
+        headers = {
+            "anthropic-ratelimit-requests-limit": str(self.key_rate_limit),
+            "anthropic-ratelimit-requests-remaining": str(self.key_rate_limit - count),
+            "anthropic-ratelimit-requests-reset": reset.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        }
+        if not allowed:
+            headers["retry-after"] = str(max(1, round(window + 1.0 - now)))
+        return allowed, headers
+
+
+def _pick_news(prompt, count=5):
+    """按提示词确定性地选出几条新闻，相同请求返回相同结果"""
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    return random.Random(seed).sample(MOCK_NEWS, count)
+
+
+def _render_text(items):
+    lines = []
+    for i, (title, summary, url) in enumerate(items, 1):
+        lines.append(f"{i}. **{title}**\n   {summary}\n   来源：{url}")
+    return "\n\n".join(lines)
+
+
+def _last_user_text(messages):
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content", "")
+        if isinstance(content, str):
+            return content
+        return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return ""
+
+
+def _continuation_prefix(messages):
+    """最后一条是 assistant 消息时为续写请求，返回已生成的文本"""
+    if not messages or messages[-1].get("role") != "assistant":
+        return None
+    content = messages[-1].get("content", "")
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if block.get("type") == "text")
+
+
+def _truncate(text, max_tokens):
+    """按 max_tokens 截断输出（模拟每 2 个字符 1 个 token），返回 (文本, 是否截断)"""
+    if max_tokens and len(text) // 2 > max_tokens:
+        return text[:max_tokens * 2], True
+    return text, False
+
+
+# 模拟提示词缓存：已缓存的前缀哈希
+_cached_prefixes = set()
+_cache_lock = threading.Lock()
+
+# 最小可缓存前缀（tokens）：与 API 一致，haiku 为 2048，其他模型为 1024，更短的前缀忽略 cache_control
+MIN_CACHEABLE_TOKENS = 1024
+MIN_CACHEABLE_TOKENS_HAIKU = 2048
+
+
+def _min_cacheable_tokens(model):
+    return MIN_CACHEABLE_TOKENS_HAIKU if "haiku" in (model or "") else MIN_CACHEABLE_TOKENS
+
+
+def _cache_usage(payload):
+    """按 cache_control 标记计算缓存写入 / 读取的 token 数（前缀短于最小长度时不缓存）"""
+    system = payload.get("system")
+    if not isinstance(system, list):
+        return {}
+
+    prefix = json.dumps([payload.get("tools", []), system], sort_keys=True, ensure_ascii=False)
+    if "cache_control" not in prefix:
+        return {}
+
+    tokens = len(prefix) // 2
+    if tokens < _min_cacheable_tokens(payload.get("model")):
+        return {"cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+    key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        hit = key in _cached_prefixes
+        _cached_prefixes.add(key)
+
+    if hit:
+        return {"cache_creation_input_tokens": 0, "cache_read_input_tokens": tokens}
+    return {"cache_creation_input_tokens": tokens, "cache_read_input_tokens": 0}
+
+
+def build_messages_response(payload):
+    """构造 /v1/messages 响应"""
+    prompt = _last_user_text(payload.get("messages", []))
+    items = _pick_news(prompt)
+    prefix = _continuation_prefix(payload.get("messages", []))
+    content = []
+
+    if prefix is None and any("web_search" in str(tool.get("type", "")) for tool in payload.get("tools", [])):
+        tool_id = f"srvtoolu_{uuid.uuid4().hex[:24]}"
+        content.append({
+            "type": "server_tool_use",
+            "id": tool_id,
+            "name": "web_search",
+            "input": {"query": prompt[:60]}
+        })
+        content.append({
+            "type": "web_search_tool_result",
+            "tool_use_id": tool_id,
+            "content": [
+                {"type": "web_search_result", "title": title, "url": url, "page_age": "1 hour ago"}
+                for title, _, url in items
+            ]
+        })
+
+    client_tools = [tool.get("name") for tool in payload.get("tools", []) if tool.get("type", "custom") == "custom"]
+    if prefix is None and "record_news" in client_tools:
+        # 结构化输出：调用 record_news 工具返回新闻记录
+        published_at = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+        records = [
+            {
+                "title": title,
+                "summary": summary,
+                "countries": [country for country in MOCK_COUNTRIES if country in title],
+                "source_urls": [url],
+                "published_at": published_at
+            }
+            for title, summary, url in items
+        ]
+        text = json.dumps(records, ensure_ascii=False)
+        content.append({
+            "type": "tool_use",
+            "id": f"toolu_{uuid.uuid4().hex[:24]}",
+            "name": "record_news",
+            "input": {"news": records}
+        })
+        stop_reason = "tool_use"
+    else:
+        text = _render_text(items)
+        if prefix and text.startswith(prefix):
+            text = text[len(prefix):]
+        text, truncated = _truncate(text, payload.get("max_tokens"))
+        content.append({"type": "text", "text": text})
+        stop_reason = "max_tokens" if truncated else "end_turn"
+
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": payload.get("model", MOCK_MODELS[-1]),
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": dict({
+            "input_tokens": len(prompt) + 20,
+            "output_tokens": len(text) // 2
+        }, **_cache_usage(payload))
+    }
+
+
+def build_chat_response(payload):
+    """构造 /v1/chat/completions 响应"""
+    prompt = _last_user_text(payload.get("messages", []))
+    text = _render_text(_pick_news(prompt))
+    prefix = _continuation_prefix(payload.get("messages", []))
+    if prefix and text.startswith(prefix):
+        text = text[len(prefix):]
+    text, truncated = _truncate(text, payload.get("max_tokens"))
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", MOCK_MODELS[0]),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "length" if truncated else "stop"
+        }],
+        "usage": {
+            "prompt_tokens": len(prompt) + 20,
+            "completion_tokens": len(text) // 2,
+            "total_tokens": len(prompt) + 20 + len(text) // 2
+        }
+    }
+
+
+def batch_status(batch, base_url):
+    """按创建时间计算 Message Batch 的处理进度"""
+    total = len(batch["requests"])
+    elapsed = time.time() - batch["created"]
+    done = total if batch["latency"] <= 0 else min(total, int(total * elapsed / batch["latency"]))
+    ended = done >= total
+
+    status = {
+        "id": batch["id"],
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": {
+            "processing": total - done,
+            "succeeded": done,
+            "errored": 0,
+            "canceled": 0,
+            "expired": 0
+        },
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(batch["created"])),
+        "ended_at": None,
+        "results_url": None
+    }
+    if ended:
+        status["ended_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(batch["created"] + batch["latency"]))
+        status["results_url"] = f"{base_url}/v1/messages/batches/{batch['id']}/results"
+    return status
+
+
+# 模拟文章页面的最后修改时间（服务启动时间）
+ARTICLE_LAST_MODIFIED = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())
+
+
+def build_article_html(slug):
+    """构造模拟新闻来源页面，slug 为 MOCK_NEWS 中 URL 的最后一段（例如 mock-3）"""
+    for title, summary, url in MOCK_NEWS:
+        if url.rstrip("/").rsplit("/", 1)[-1] == slug:
+            break
+    else:
+        return None
+
+    paragraphs = "\n".join(
+        f"<p>{summary}据报道，{title}引发各方关注，相关各方将在未来几天内继续磋商（第 {i} 段）。</p>"
+        for i in range(1, 5)
+    )
+    return f"""<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>{title} - Mock News</title>
+<meta property="og:title" content="{title}">
+<script>window.analytics = {{"page": "{slug}"}};</script>
+<style>body {{ font-family: sans-serif; }}</style>
+</head>
+<body>
+<header><nav><a href="/">首页</a> | <a href="/world">国际</a> | <a href="/tech">科技</a></nav></header>
+<article>
+<h1>{title}</h1>
+{paragraphs}
+</article>
+<aside><p>热门推荐：更多国际新闻请访问首页，订阅我们的每日新闻简报。</p></aside>
+<footer><p>© Mock News 版权所有，未经许可不得转载。</p></footer>
+</body>
+</html>
+""".encode("utf-8")
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """模拟 API 请求处理"""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, error_type, message, headers=None):
+        self._send_json(status, {"type": "error", "error": {"type": error_type, "message": message}}, headers)
+
+    def _api_key(self):
+        key = self.headers.get("x-api-key", "")
+        authorization = self.headers.get("Authorization", "")
+        if not key and authorization.startswith("Bearer "):
+            key = authorization[len("Bearer "):]
+        return key
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    @property
+    def base_url(self):
+        return f"http://{self.headers.get('Host', '%s:%d' % self.server.server_address)}"
+
+    def _get_batch(self, path):
+        if path.startswith("/v1/messages/batches/"):
+            parts = path[len("/v1/messages/batches/"):].split("/")
+            batch = self.state.batches.get(parts[0])
+            if batch is not None:
+                return batch, parts[1:]
+        return None, None
+
+    def _send_batch_results(self, batch):
+        lines = []
+        for request in batch["requests"]:
+            lines.append(json.dumps({
+                "custom_id": request["custom_id"],
+                "result": {"type": "succeeded", "message": build_messages_response(request["params"])}
+            }, ensure_ascii=False))
+        body = ("\n".join(lines) + "\n").encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/binary")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_article(self, slug):
+        """模拟新闻来源页面，支持 ETag / Last-Modified 条件请求"""
+        body = build_article_html(slug)
+        if body is None:
+            self._send_error(404, "not_found_error", f"Not found: {self.path}")
+            return
+
+        with self.state.lock:
+            self.state.article_requests += 1
+
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if (self.headers.get("If-None-Match") == etag
+                or self.headers.get("If-Modified-Since") == ARTICLE_LAST_MODIFIED):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", ARTICLE_LAST_MODIFIED)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        time.sleep(self.state.latency * random.uniform(0.5, 1.5))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", ARTICLE_LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        batch, rest = self._get_batch(self.path.rstrip("/"))
+        if batch is not None:
+            status = batch_status(batch, self.base_url)
+            if not rest:
+                self._send_json(200, status)
+            elif rest == ["results"] and status["processing_status"] == "ended":
+                self._send_batch_results(batch)
+            else:
+                self._send_error(404, "not_found_error", "Batch results are not available yet")
+            return
+
+        if self.path.startswith("/articles/"):
+            self._send_article(self.path[len("/articles/"):].rstrip("/"))
+            return
+
+        if self.path.rstrip("/") == "/v1/models":
+            etag = '"models-%d"' % len(MOCK_MODELS)
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"id": m, "object": "model", "owned_by": "anthropic", "created": 0} for m in MOCK_MODELS]
+            }, headers={"ETag": etag})
+        else:
+            self._send_error(404, "not_found_error", f"Not found: {self.path}")
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+        except (ValueError, UnicodeDecodeError):
+            self._send_error(400, "invalid_request_error", "Invalid JSON body")
+            return
+
+        if self.path == "/v1/messages/batches":
+            batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+            self.state.batches[batch_id] = {
+                "id": batch_id,
+                "requests": payload.get("requests", []),
+                "created": time.time(),
+                "latency": self.state.batch_latency
+            }
+            self._send_json(200, batch_status(self.state.batches[batch_id], self.base_url))
+            return
+
+        if self.path == "/v1/messages":
+            handler, uses_search = build_messages_response, bool(payload.get("tools"))
+        elif self.path == "/v1/chat/completions":
+            handler, uses_search = build_chat_response, False
+        else:
+            self._send_error(404, "not_found_error", f"Not found: {self.path}")
+            return
+
+        key = self._api_key()
+        if key.startswith("invalid"):
+            self._send_error(401, "authentication_error", "Invalid API key")
+            return
+        allowed, quota_headers = self.state.take_key_quota(key)
+        if not allowed:
+            self._send_error(429, "rate_limit_error", "Rate limit exceeded for this API key", quota_headers)
+            return
+
+        if not self.state.enter():
+            self._send_error(429, "rate_limit_error", "Too many concurrent requests")
+            return
+
+        try:
+            base = self.state.websearch_latency if uses_search else self.state.latency
+            time.sleep(base * random.uniform(0.5, 1.5))
+
+            if random.random() < self.state.error_rate:
+                self._send_error(500, "api_error", "Mock upstream error")
+                return
+
+            self._send_json(200, handler(payload), quota_headers)
+        finally:
+            self.state.leave()
+
+
+def seed_mock_archive(count=4, per_digest=5):
+    """
+    向（临时）归档写入几份模拟新闻摘要，供 rollup.py、local_retrieval.py 的 --mock 演示使用
+    每份摘要从 MOCK_NEWS 中依次取 per_digest 条，相邻摘要有重叠的新闻
+    """
+    from news_archive import archive_entry
+
+    for i in range(count):
+        items = [MOCK_NEWS[(i * 3 + j) % len(MOCK_NEWS)] for j in range(per_digest)]
+        search_results = [{"title": title, "url": url, "page_age": "1 hour ago"} for title, _, url in items]
+        archive_entry(f"最新{per_digest}条重要国际新闻", _render_text(items), search_results, source="mock")
+
+
+def start_mock_server(port=0, host="127.0.0.1", **options):
+    """
+    在后台线程启动模拟服务，返回 (server, base_url)
+    同时把状态目录切换到临时目录，模拟数据不写入真实的归档、缓存和统计（见 state_dir.py）
+    """
+    from state_dir import use_temp_state_dir
+
+    use_temp_state_dir()
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(**options)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 API 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.2, help="普通请求的平均延迟（秒）")
+    parser.add_argument("--websearch-latency", type=float, default=1.0, help="web_search 请求的平均延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 500 的比例")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="并发上限，超出返回 429（0 表示不限制）")
+    parser.add_argument("--batch-latency", type=float, default=3.0, help="Message Batch 全部完成所需时间（秒）")
+    parser.add_argument("--key-rate-limit", type=int, default=0, help="每个密钥每秒的请求上限，超出返回 429（0 表示不限制）")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(
+        latency=args.latency,
+        websearch_latency=args.websearch_latency,
+        error_rate=args.error_rate,
+        max_concurrency=args.max_concurrency,
+        batch_latency=args.batch_latency,
+        key_rate_limit=args.key_rate_limit
+    )
+
+    print(f"模拟 API 服务已启动: http://{args.host}:{args.port}")
+    print("按 Ctrl+C 停止")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n已停止")
+
+
+if __name__ == "__main__":
+    main()
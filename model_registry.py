@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+模型注册表
+缓存 /v1/models 的结果（TTL + ETag / Last-Modified 条件请求），
+并记录每个模型实际观测到的延迟、成功率和工具支持情况，
+脚本可以在不访问网络的情况下校验和选择模型。
+
+延迟和成功率按（模型, 服务端工具组合）分组统计：同一个模型带 web_search 时要慢得多，
+不带工具的样本不能用来估计 web_search 请求的延迟，反之亦然。
+
+观测先在内存中累积，每 SAVE_INTERVAL 秒、每 SAVE_BATCH 条或进程退出时写盘一次；
+写盘时持有文件锁，先读取磁盘上其他进程（load_test、batch_runner、网关等）写入的数据，
+把本进程新增的观测合并进去再原子替换，不会互相覆盖延迟样本。
+
+用法：
+    python model_registry.py            # 显示缓存的模型和统计（过期时自动刷新）
+    python model_registry.py --refresh  # 强制重新验证
+"""
+
+import argparse
+import atexit
+import json
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 没有 fcntl，退化为只在进程内加锁
+    fcntl = None
+
+REGISTRY_FILE = "model_registry.json"
+DEFAULT_TTL = 3600
+
+# 每个模型保留的最近延迟样本数
+LATENCY_SAMPLES = 50
+# 延迟指数移动平均的权重
+EWMA_ALPHA = 0.3
+# 观测累积这么久（秒）或这么多条后写盘
+SAVE_INTERVAL = 5.0
+SAVE_BATCH = 50
+
+# 服务端工具的类型带版本日期（例如 web_search_20250305），只有它们影响延迟分组；自定义工具（record_news）不区分
+SERVER_TOOL_PATTERN = re.compile(r"_\d{8}$")
+
+
+def tool_bucket(tools):
+    """统计分组的键：请求中服务端工具类型的组合，没有时为 "none" """
+    return "+".join(sorted({tool for tool in tools or [] if tool and SERVER_TOOL_PATTERN.search(tool)})) or "none"
+
+
+def _new_stats():
+    return {"requests": 0, "successes": 0, "latency_ewma": None, "recent_latencies": []}
+
+
+def _update_stats(stats, latency, ok):
+    stats["requests"] += 1
+    if ok:
+        stats["successes"] += 1
+        if stats["latency_ewma"] is None:
+            stats["latency_ewma"] = latency
+        else:
+            stats["latency_ewma"] = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * stats["latency_ewma"]
+        stats["recent_latencies"] = (stats["recent_latencies"] + [round(latency, 3)])[-LATENCY_SAMPLES:]
+
+
+def _apply_observation(data, model_id, latency, ok, tools, used_at):
+    """把一次观测计入 data["stats"]"""
+    stats = data["stats"].setdefault(model_id, dict(_new_stats(), tools={}))
+    stats["last_used"] = max(stats.get("last_used") or "", used_at)
+    # 模型整体的统计（显示用）和按工具组合分组的统计（选择模型用）
+    _update_stats(stats, latency, ok)
+    bucket = stats.setdefault("buckets", {}).setdefault(tool_bucket(tools), _new_stats())
+    _update_stats(bucket, latency, ok)
+
+    for tool in tools:
+        counts = stats["tools"].setdefault(tool, {"ok": 0, "failed": 0})
+        counts["ok" if ok else "failed"] += 1
+
+
+@contextmanager
+def _file_lock(path):
+    """跨进程的排他文件锁"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _summarize(stats):
+    latencies = sorted(stats["recent_latencies"])
+    p95 = latencies[max(0, math.ceil(0.95 * len(latencies)) - 1)] if latencies else None
+    return {
+        "requests": stats["requests"],
+        "success_rate": stats["successes"] / stats["requests"] if stats["requests"] else None,
+        "latency_ewma": stats["latency_ewma"],
+        "latency_p95": p95
+    }
+
+
+class ModelRegistry:
+    """带本地缓存的模型注册表"""
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL):
+        from state_dir import state_path
+
+        path = path or state_path(REGISTRY_FILE)
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        # 尚未写盘的观测 [(模型, 延迟, 是否成功, 工具, 时间)]
+        self._pending = []
+        self._saved_at = time.monotonic()
+        self.data = self._empty()
+
+        if os.path.exists(path):
+            try:
+                self.data.update(self._read_file())
+            except (OSError, ValueError) as e:
+                print(f"⚠️  模型注册表读取失败，将重新获取: {e}")
+
+    @staticmethod
+    def _empty():
+        return {"fetched_at": 0, "etag": None, "last_modified": None, "models": {}, "stats": {}}
+
+    def _read_file(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    # ---------- 模型列表 ----------
+
+    def is_fresh(self):
+        return bool(self.data["models"]) and time.time() - self.data["fetched_at"] < self.ttl
+
+    def refresh(self, force=False):
+        """
+        刷新模型列表
+        缓存未过期时不访问网络；过期后发送条件请求，304 时只更新时间戳
+        返回 True 表示缓存可用
+        """
+        if not force and self.is_fresh():
+            return True
+
+        from adaptive_timeout import request_timeout
+        from config import API_KEY, API_BASE_URL
+        from http_client import get_session
+
+        headers = {"Authorization": f"Bearer {API_KEY}"}
+        if self.data["etag"]:
+            headers["If-None-Match"] = self.data["etag"]
+        if self.data["last_modified"]:
+            headers["If-Modified-Since"] = self.data["last_modified"]
+
+        try:
+            response = get_session().get(f"{API_BASE_URL}/v1/models", headers=headers,
+                                         timeout=request_timeout("/v1/models", default=30))
+        except Exception as e:
+            print(f"⚠️  刷新模型列表失败，继续使用缓存: {type(e).__name__}: {e}")
+            return bool(self.data["models"])
+
+        with self._lock:
+            if response.status_code == 304:
+                self.data["fetched_at"] = time.time()
+            elif response.status_code == 200:
+                models = response.json().get("data", [])
+                self.data["models"] = {m["id"]: m for m in models if "id" in m}
+                self.data["etag"] = response.headers.get("ETag")
+                self.data["last_modified"] = response.headers.get("Last-Modified")
+                self.data["fetched_at"] = time.time()
+            else:
+                print(f"⚠️  刷新模型列表失败 ({response.status_code})，继续使用缓存")
+                return bool(self.data["models"])
+
+            self.save()
+        return True
+
+    def model_ids(self):
+        """可用模型 ID 列表（缓存过期时自动刷新）"""
+        self.refresh()
+        return sorted(self.data["models"])
+
+    def is_available(self, model_id):
+        """模型是否在列表中；没有任何缓存数据时返回 None"""
+        self.refresh()
+        if not self.data["models"]:
+            return None
+        return model_id in self.data["models"]
+
+    def resolve(self, name):
+        """
+        查找模型 ID：完全匹配优先，否则返回包含该名称的最新模型
+        例如 resolve("haiku") -> "claude-haiku-4-5-20251001"
+        """
+        self.refresh()
+        models = self.data["models"]
+        if name in models:
+            return name
+        candidates = [m for m in models if name in m]
+        if not candidates:
+            return None
+        # 模型 ID 以日期结尾，日期最大的视为最新
+        return max(candidates, key=lambda m: (m.rsplit("-", 1)[-1], m))
+
+    # ---------- 观测统计 ----------
+
+    def record(self, model_id, latency, ok, tools=None):
+        """记录一次请求的延迟和结果，tools 为请求中使用的工具类型列表"""
+        observation = (model_id, latency, ok, list(tools or []), datetime.now().isoformat())
+        with self._lock:
+            _apply_observation(self.data, *observation)
+            self._pending.append(observation)
+            if len(self._pending) >= SAVE_BATCH or time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+                self.save()
+
+    def stats(self, model_id, tools=None):
+        """
+        模型的观测统计：请求数、成功率、平均延迟、p95 延迟
+        tools 为 None 时返回所有请求的统计；否则只统计使用相同服务端工具组合的请求（[] 表示不带工具），
+        该组合没有观测时返回 None
+        """
+        stats = self.data["stats"].get(model_id)
+        if not stats:
+            return None
+        if tools is not None:
+            stats = stats.get("buckets", {}).get(tool_bucket(tools))
+            if not stats:
+                return None
+            return dict(_summarize(stats), tools=self.data["stats"][model_id]["tools"])
+        return dict(_summarize(stats), tools=stats["tools"])
+
+    def buckets(self, model_id):
+        """按工具组合分组的统计 {分组键: 统计}"""
+        stats = self.data["stats"].get(model_id, {})
+        return {key: _summarize(bucket) for key, bucket in stats.get("buckets", {}).items()}
+
+    def supports_tool(self, model_id, tool):
+        """根据观测判断模型是否支持某个工具；没有观测时返回 None"""
+        counts = self.data["stats"].get(model_id, {}).get("tools", {}).get(tool)
+        if not counts:
+            return None
+        if counts["ok"]:
+            return True
+        return False
+
+    def save(self):
+        """在文件锁内合并磁盘上的数据和本进程新增的观测后写盘"""
+        with self._lock, _file_lock(f"{self.path}.lock"):
+            try:
+                merged = self._empty()
+                merged.update(self._read_file())
+            except (OSError, ValueError):
+                merged = None
+
+            if merged is not None:
+                for observation in self._pending:
+                    _apply_observation(merged, *observation)
+                # 模型列表以较新的一次刷新为准
+                if self.data["fetched_at"] >= merged["fetched_at"]:
+                    for key in ("fetched_at", "etag", "last_modified", "models"):
+                        merged[key] = self.data[key]
+                self.data = merged
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._pending = []
+            self._saved_at = time.monotonic()
+
+    def flush(self):
+        """写入尚未保存的观测"""
+        with self._lock:
+            if self._pending:
+                self.save()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """获取共享的模型注册表"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+                atexit.register(_registry.flush)
+    return _registry
+
+
+def record_response(response, *args, **kwargs):
+    """
+    requests 响应钩子：从请求体中取出模型和工具，记录延迟和结果
+    只统计 /v1/messages 和 /v1/chat/completions 的 POST 请求
+    """
+    request = response.request
+    if getattr(response, "coalesced", False):
+        return response
+    if request.method != "POST" or not request.url.rstrip("/").endswith(("/v1/messages", "/v1/chat/completions")):
+        return response
+
+    try:
+        payload = json.loads(request.body or b"{}")
+    except (TypeError, ValueError):
+        return response
+
+    model_id = payload.get("model")
+    # 429 / 5xx 反映的是中转状态而不是模型能力，不计入工具支持情况
+    if model_id and response.status_code < 500 and response.status_code not in (401, 403, 429):
+        tools = [tool.get("type") or tool.get("name") for tool in payload.get("tools", [])]
+        get_registry().record(model_id, response.elapsed.total_seconds(), response.status_code == 200, tools)
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型注册表")
+    parser.add_argument("--refresh", action="store_true", help="忽略 TTL，立即重新验证")
+    args = parser.parse_args()
+
+    registry = get_registry()
+    registry.refresh(force=args.refresh)
+
+    fetched_at = registry.data["fetched_at"]
+    print(f"缓存时间: {datetime.fromtimestamp(fetched_at).strftime('%Y-%m-%d %H:%M:%S') if fetched_at else '无'}")
+    print(f"ETag: {registry.data['etag'] or '无'}")
+    print("-" * 80)
+
+    for model_id in registry.model_ids():
+        stats = registry.stats(model_id)
+        if not stats:
+            print(f"{model_id}")
+            continue
+        tools = ", ".join(f"{t}={'✅' if c['ok'] else '❌'}" for t, c in stats["tools"].items()) or "-"
+        print(f"{model_id}")
+        print(f"   请求: {stats['requests']}  成功率: {stats['success_rate'] * 100:.0f}%  工具: {tools}")
+        for key, bucket in sorted(registry.buckets(model_id).items()):
+            ewma = f"{bucket['latency_ewma']:.1f}s" if bucket["latency_ewma"] is not None else "-"
+            p95 = f"{bucket['latency_p95']:.1f}s" if bucket["latency_p95"] is not None else "-"
+            label = "不带工具" if key == "none" else key
+            print(f"   [{label}] 请求: {bucket['requests']}  成功率: {bucket['success_rate'] * 100:.0f}%  "
+                  f"平均延迟: {ewma}  p95: {p95}")
+
+
+if __name__ == "__main__":
+    main()
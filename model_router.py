@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+按延迟自动选择模型
+根据任务类型、可接受的最大延迟，以及模型注册表中观测到的延迟和成功率，
+为每个请求选出满足要求的最快模型。
+延迟和成功率只使用与任务相同工具组合的观测（web_search 任务只看带 web_search 的请求）；
+需要工具的任务只在观测到模型成功使用过该工具后才按延迟参与选择，之前只会被试用。
+
+设置 MODEL_OVERRIDE 环境变量（或 ./run.sh --model MODEL）可固定使用某个模型。
+
+用法：
+    python model_router.py --task web_search --max-latency 60
+"""
+
+import argparse
+import os
+import random
+
+from model_registry import get_registry
+
+try:
+    from config import DEFAULT_MODEL
+except (ImportError, ValueError):
+    DEFAULT_MODEL = os.environ.get('DEFAULT_MODEL', "claude-sonnet-4-5-20250929")
+
+# 各任务可用的候选模型（能力从低到高）
+TASK_CANDIDATES = {
+    # 基于知识库生成新闻，不需要 sonnet
+    "knowledge": [
+        "claude-3-5-haiku-20241022",
+        "claude-haiku-4-5-20251001",
+        "claude-sonnet-4-20250514",
+        "claude-sonnet-4-5-20250929"
+    ],
+    # 需要 web_search 工具
+    "web_search": [
+        "claude-haiku-4-5-20251001",
+        "claude-sonnet-4-20250514",
+        "claude-sonnet-4-5-20250929"
+    ],
+    # 翻译、摘要等基于已有内容的轻量任务
+    "translate": [
+        "claude-3-5-haiku-20241022",
+        "claude-haiku-4-5-20251001"
+    ],
+    "summarize": [
+        "claude-3-5-haiku-20241022",
+        "claude-haiku-4-5-20251001",
+        "claude-sonnet-4-5-20250929"
+    ]
+}
+
+# 没有足够观测数据时使用的模型
+TASK_DEFAULTS = {
+    "knowledge": "claude-3-5-haiku-20241022",
+    "web_search": DEFAULT_MODEL,
+    "translate": "claude-3-5-haiku-20241022",
+    "summarize": "claude-3-5-haiku-20241022"
+}
+
+# 任务需要的工具
+TASK_TOOLS = {
+    "web_search": "web_search_20250305"
+}
+
+# 至少有这么多次观测才参与按延迟排序
+MIN_SAMPLES = 3
+# 成功率低于该值的模型不参与选择
+MIN_SUCCESS_RATE = 0.8
+# 以一定概率试用缺少观测数据的候选模型，积累统计
+EXPLORE_RATE = 0.05
+
+
+def route(task, max_latency=None, override=None, explore=True):
+    """
+    为任务选择模型
+    返回 {"model": 模型 ID, "reason": 选择原因, "latency": 预计延迟或 None}
+    """
+    if task not in TASK_CANDIDATES:
+        raise ValueError(f"未知的任务类型: {task}（可选 {', '.join(TASK_CANDIDATES)}）")
+
+    override = override or os.environ.get('MODEL_OVERRIDE')
+    if override:
+        return {"model": override, "reason": "手动指定", "latency": None}
+
+    registry = get_registry()
+    tool = TASK_TOOLS.get(task)
+    tools = [tool] if tool else []
+    ranked = []
+    unexplored = []
+
+    for model in TASK_CANDIDATES[task]:
+        if registry.is_available(model) is False:
+            continue
+        supported = registry.supports_tool(model, tool) if tool else True
+        if supported is False:
+            continue
+
+        stats = registry.stats(model, tools=tools)
+        if (not supported or not stats or stats["requests"] < MIN_SAMPLES
+                or stats["latency_ewma"] is None):
+            unexplored.append(model)
+            continue
+        if stats["success_rate"] < MIN_SUCCESS_RATE:
+            continue
+
+        # 用 p95 衡量是否满足延迟要求，用平均延迟排序
+        if max_latency is not None and (stats["latency_p95"] or stats["latency_ewma"]) > max_latency:
+            continue
+        ranked.append((stats["latency_ewma"], model))
+
+    if explore and unexplored and random.random() < EXPLORE_RATE:
+        return {"model": random.choice(unexplored), "reason": "试用（缺少观测数据）", "latency": None}
+
+    if ranked:
+        latency, model = min(ranked)
+        return {"model": model, "reason": "满足要求的最快模型", "latency": latency}
+
+    return {"model": TASK_DEFAULTS[task], "reason": "没有满足要求的观测数据，使用默认模型", "latency": None}
+
+
+def choose_model(task, max_latency=None, override=None):
+    """为任务选择模型，只返回模型 ID"""
+    return route(task, max_latency=max_latency, override=override)["model"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按延迟自动选择模型")
+    parser.add_argument("--task", choices=list(TASK_CANDIDATES), default="knowledge")
+    parser.add_argument("--max-latency", type=float, help="可接受的最大延迟（秒，按 p95 判断）")
+    args = parser.parse_args()
+
+    registry = get_registry()
+    tool = TASK_TOOLS.get(args.task)
+    print(f"任务: {args.task}  工具: {tool or '无'}  最大延迟: {args.max_latency or '不限'}")
+    print("-" * 80)
+    print(f"{'候选模型':<32}{'请求':>6}{'成功率':>8}{'平均延迟':>10}{'p95':>8}")
+    for model in TASK_CANDIDATES[args.task]:
+        stats = registry.stats(model, tools=[tool] if tool else [])
+        if not stats:
+            print(f"{model:<32}{'-':>6}")
+            continue
+        ewma = f"{stats['latency_ewma']:.1f}s" if stats["latency_ewma"] is not None else "-"
+        p95 = f"{stats['latency_p95']:.1f}s" if stats["latency_p95"] is not None else "-"
+        print(f"{model:<32}{stats['requests']:>6}{stats['success_rate'] * 100:>7.0f}%{ewma:>10}{p95:>8}")
+
+    result = route(args.task, max_latency=args.max_latency, explore=False)
+    print(f"\n选择: {result['model']}（{result['reason']}）")
+
+
+if __name__ == "__main__":
+    main()
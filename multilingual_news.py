@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+多语言新闻输出
+提示词固定"用中文回答"，同一份新闻要中文、英文、日文三个版本时，原来需要三次 web_search。
+这里只做一次 web_search，得到中文的结构化新闻记录 (structured_news.py) 作为原文，
+其他语言由轻量模型（model_router 的 translate 任务）并行翻译：只翻译标题、摘要和国家，
+来源链接和发布时间直接沿用原文。
+
+原文保存在查询缓存（namespace "structured"）中，新鲜期内的相同查询不再搜索；
+译文按 (原文内容哈希, 语言) 缓存在 translation_cache.json，N 种语言的成本是一次搜索加最多 N 次小请求。
+
+用法：
+    python multilingual_news.py --languages zh,en,ja
+    python multilingual_news.py --query "最新5条欧洲重要新闻" --languages en,ko
+    python multilingual_news.py --mock
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+TRANSLATION_CACHE_FILE = "translation_cache.json"
+
+# 原文的语言
+SOURCE_LANGUAGE = "zh"
+
+# 语言代码 -> (语言名称, 文本输出中的字段名)
+LANGUAGES = {
+    "zh": ("中文", {"countries": "涉及国家: ", "separator": "、", "published_at": "发布时间: ", "source": "来源："}),
+    "en": ("English", {"countries": "Countries: ", "separator": ", ", "published_at": "Published: ",
+                       "source": "Source: "}),
+    "ja": ("日本語", {"countries": "関係国: ", "separator": "、", "published_at": "公開日時: ", "source": "出典："}),
+    "ko": ("한국어", {"countries": "관련 국가: ", "separator": ", ", "published_at": "게시 시간: ",
+                    "source": "출처: "}),
+    "fr": ("Français", {"countries": "Pays : ", "separator": ", ", "published_at": "Publié : ",
+                        "source": "Source : "}),
+    "de": ("Deutsch", {"countries": "Länder: ", "separator": ", ", "published_at": "Veröffentlicht: ",
+                       "source": "Quelle: "}),
+    "es": ("Español", {"countries": "Países: ", "separator": ", ", "published_at": "Publicado: ",
+                       "source": "Fuente: "})
+}
+
+# 翻译的字段，其余字段沿用原文
+TRANSLATED_FIELDS = ("title", "summary", "countries")
+
+TRANSLATE_SYSTEM_PROMPT = ("你是新闻翻译。把用户给出的新闻记录逐条翻译成目标语言，保持条数和顺序不变，"
+                           "专有名词使用目标语言的通用译名。翻译完成后必须调用 record_news 工具提交结果，"
+                           "source_urls 为空列表、published_at 为 null，不要输出其他文本。")
+
+# 最多保留的译文条数
+MAX_ENTRIES = 1000
+
+
+def content_hash(records):
+    """新闻记录的内容哈希（译文缓存的键）"""
+    canonical = json.dumps(records, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+class TranslationCache:
+    """按 (原文内容哈希, 语言) 保存译文"""
+
+    def __init__(self, path=None):
+        from state_dir import state_path
+
+        path = path or state_path(TRANSLATION_CACHE_FILE)
+        self.path = path
+        self._lock = threading.RLock()
+        self.entries = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f).get("entries", {})
+            except (OSError, ValueError) as e:
+                print(f"⚠️  译文缓存读取失败，将重新建立: {e}")
+
+    def get(self, digest, language):
+        with self._lock:
+            entry = self.entries.get(f"{digest}:{language}")
+        return entry["records"] if entry else None
+
+    def put(self, digest, language, records, model=None):
+        with self._lock:
+            self.entries[f"{digest}:{language}"] = {"time": time.time(), "records": records, "model": model}
+            if len(self.entries) > MAX_ENTRIES:
+                oldest = sorted(self.entries, key=lambda key: self.entries[key]["time"])
+                for key in oldest[:len(self.entries) - MAX_ENTRIES]:
+                    del self.entries[key]
+            self.save()
+
+    def save(self):
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": self.entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_translation_cache():
+    """进程内共享的译文缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TranslationCache()
+    return _cache
+
+
+def build_translation_payload(records, language, model=None):
+    """构建翻译请求：只发送需要翻译的字段，强制调用 record_news 返回译文"""
+    from model_router import choose_model
+    from structured_news import RECORD_NEWS_TOOL
+
+    name = LANGUAGES[language][0]
+    source = [{field: record[field] for field in TRANSLATED_FIELDS} for record in records]
+    return {
+        "model": model or choose_model("translate", max_latency=30),
+        "max_tokens": 4096,
+        "system": TRANSLATE_SYSTEM_PROMPT,
+        "messages": [
+            {
+                "role": "user",
+                "content": f"目标语言: {name} ({language})\n\n{json.dumps(source, ensure_ascii=False)}"
+            }
+        ],
+        "tools": [RECORD_NEWS_TOOL],
+        "tool_choice": {"type": "tool", "name": "record_news"}
+    }
+
+
+def translate_records(records, language, model=None, timeout=None):
+    """
+    把新闻记录翻译成 language，返回 (译文记录, 响应)
+    译文条数与原文不一致或没有调用 record_news 时抛出 RuntimeError
+    """
+    from adaptive_timeout import request_timeout
+    from config import API_KEY, API_BASE_URL
+    from http_client import get_session
+    from structured_news import find_record_call
+
+    url = f"{API_BASE_URL}/v1/messages"
+    headers = {
+        "x-api-key": API_KEY,
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json"
+    }
+    data = build_translation_payload(records, language, model=model)
+    timeout = timeout or request_timeout("/v1/messages", data, default=60)
+
+    response = get_session().post(url, headers=headers, json=data, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"请求失败: {response.status_code} {response.text[:300]}")
+    result = response.json()
+
+    call = find_record_call(result)
+    translated = (call or {}).get("input", {}).get("news")
+    if not isinstance(translated, list):
+        raise RuntimeError(f"没有调用 record_news 工具 (stop_reason={result.get('stop_reason')})")
+    if len(translated) != len(records):
+        raise RuntimeError(f"译文条数 ({len(translated)}) 与原文 ({len(records)}) 不一致")
+
+    merged = []
+    for original, item in zip(records, translated):
+        record = dict(original)
+        for field in ("title", "summary"):
+            if isinstance(item.get(field), str) and item[field].strip():
+                record[field] = item[field].strip()
+        countries = item.get("countries")
+        if isinstance(countries, list) and all(isinstance(c, str) for c in countries):
+            record["countries"] = [c.strip() for c in countries if c.strip()]
+        merged.append(record)
+    return merged, result
+
+
+def translate_all(records, languages, workers=None):
+    """
+    并行把原文翻译成多种语言，译文按 (原文内容哈希, 语言) 缓存
+    返回 {语言: {"records", "cached", "latency"} 或 {"error", "latency"}}
+    """
+    cache = get_translation_cache()
+    digest = content_hash(records)
+    outcomes = {}
+    pending = []
+
+    for language in languages:
+        if language == SOURCE_LANGUAGE:
+            outcomes[language] = {"records": records, "cached": True, "latency": 0.0}
+            continue
+        cached = cache.get(digest, language)
+        if cached is not None:
+            outcomes[language] = {"records": cached, "cached": True, "latency": 0.0}
+        else:
+            pending.append(language)
+
+    def run(language):
+        started = time.monotonic()
+        try:
+            translated, result = translate_records(records, language)
+        except (RuntimeError, requests.exceptions.RequestException) as e:
+            return language, {"error": str(e), "latency": time.monotonic() - started}
+        cache.put(digest, language, translated, model=result.get("model"))
+        return language, {"records": translated, "cached": False, "latency": time.monotonic() - started}
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=workers or len(pending)) as executor:
+            outcomes.update(executor.map(run, pending))
+
+    return {language: outcomes[language] for language in languages}
+
+
+def get_canonical_news(query, web_search=True, use_cache=True):
+    """获取原文（中文结构化新闻记录），新鲜期内的相同查询使用查询缓存，返回 (记录, 是否来自缓存)"""
+    from query_cache import get_query_cache
+    from structured_news import request_structured_news
+
+    cache = get_query_cache()
+    if use_cache:
+        hit = cache.lookup(query, namespace="structured")
+        if hit:
+            return hit["result"]["news"], True
+
+    records, errors, _ = request_structured_news(query, web_search=web_search)
+    for error in errors:
+        print(f"⚠️  {error}")
+    if records:
+        cache.store(query, {"news": records}, namespace="structured")
+    return records, False
+
+
+def get_multilingual_news(query="最新5条重要国际新闻", languages=("zh", "en", "ja"), web_search=True,
+                          use_cache=True):
+    """一次搜索、多语言输出：保存并归档，返回 {语言: 记录}"""
+    from news_archive import archive_entry
+    from structured_news import render_records
+
+    print("=" * 80)
+    print(f"多语言新闻: {query}（{', '.join(languages)}）")
+    print("=" * 80)
+
+    started = time.monotonic()
+    try:
+        records, from_cache = get_canonical_news(query, web_search=web_search, use_cache=use_cache)
+    except (RuntimeError, requests.exceptions.RequestException) as e:
+        print(f"❌ {e}")
+        return None
+    if not records:
+        print("❌ 没有有效的新闻记录")
+        return None
+    search_time = time.monotonic() - started
+    print(f"{'♻️  原文来自查询缓存' if from_cache else f'✓ 搜索完成，用时 {search_time:.1f} 秒'}，{len(records)} 条新闻")
+
+    outcomes = translate_all(records, languages)
+    translations = {}
+    for language, outcome in outcomes.items():
+        name, labels = LANGUAGES[language]
+        print("\n" + "-" * 80)
+        if "error" in outcome:
+            print(f"❌ [{language}] {name} 翻译失败: {outcome['error']}")
+            continue
+        if language == SOURCE_LANGUAGE:
+            state = "原文"
+        elif outcome["cached"]:
+            state = "译文缓存"
+        else:
+            state = f"翻译 {outcome['latency']:.1f} 秒"
+        print(f"🌐 [{language}] {name}（{state}）\n")
+        print(render_records(outcome["records"], labels))
+        translations[language] = outcome["records"]
+
+    calls = sum(1 for outcome in outcomes.values() if "error" not in outcome and not outcome["cached"])
+    print("\n" + "=" * 80)
+    print(f"搜索 {0 if from_cache else 1} 次，翻译请求 {calls} 次，总用时 {time.monotonic() - started:.1f} 秒")
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    json_file = f"news_multilingual_{timestamp}.json"
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump({"query": query, "source_language": SOURCE_LANGUAGE, "translations": translations},
+                  f, indent=2, ensure_ascii=False)
+    print(f"✓ 已保存到 {json_file}")
+
+    if not from_cache:
+        entry = archive_entry(query, render_records(records), source="structured", records=records,
+                              translations={lang: recs for lang, recs in translations.items()
+                                            if lang != SOURCE_LANGUAGE})
+        print(f"✓ 已归档 ({entry['id']})")
+    return translations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="一次搜索、多语言输出")
+    parser.add_argument("--query", default="最新5条重要国际新闻", help="查询内容")
+    parser.add_argument("--languages", default="zh,en,ja", help=f"逗号分隔的语言（可选 {','.join(LANGUAGES)}）")
+    parser.add_argument("--no-web-search", action="store_true", help="原文基于知识库生成，不使用 web_search")
+    parser.add_argument("--no-cache", action="store_true", help="不使用查询缓存，重新获取原文")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟服务")
+    args = parser.parse_args()
+
+    languages = list(dict.fromkeys(lang.strip() for lang in args.languages.split(",") if lang.strip()))
+    unknown = [lang for lang in languages if lang not in LANGUAGES]
+    if unknown:
+        parser.error(f"不支持的语言: {', '.join(unknown)}")
+
+    if args.mock:
+        from mock_server import start_mock_server
+
+        _, base_url = start_mock_server()
+        os.environ["API_BASE_URL"] = base_url
+        os.environ.setdefault("API_KEY", "mock-key")
+
+    translations = get_multilingual_news(args.query, languages, web_search=not args.no_web_search,
+                                         use_cache=not args.no_cache)
+    if not translations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
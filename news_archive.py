@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+新闻归档
+把每次获取到的新闻（查询、AI 总结、搜索结果来源、用量）保存到 archive/ 目录，
+按日期分目录存放，并在 archive/index.jsonl 中追加一行索引，方便后续检索和汇总。
+
+用法：
+    python news_archive.py              # 列出最近的归档
+    python news_archive.py --last 50
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+ARCHIVE_DIR = "archive"
+INDEX_FILE = "index.jsonl"
+
+_lock = threading.Lock()
+
+# 编号新闻条目的行首，例如 "1. 标题"、"### 2、标题"、"**3) 标题**"
+NEWS_ITEM_PATTERN = re.compile(r"^(?:#+\s*)?(?:\*\*)?\s*\d{1,2}\s*[.、)）]\s*(.+)$")
+
+
+def extract_digest(result):
+    """从 /v1/messages 响应中提取 AI 总结、搜索查询和搜索结果"""
+    text_content = []
+    queries = []
+    search_results = []
+
+    for item in result.get("content", []):
+        item_type = item.get("type", "")
+
+        if item_type in ("server_tool_use", "tool_use"):
+            query = item.get("input", {}).get("query")
+            if query:
+                queries.append(query)
+
+        elif item_type == "web_search_tool_result":
+            content = item.get("content", [])
+            if isinstance(content, list):
+                for result_item in content:
+                    if result_item.get("type") == "web_search_result":
+                        search_results.append({
+                            "title": result_item.get("title", ""),
+                            "url": result_item.get("url", ""),
+                            "page_age": result_item.get("page_age")
+                        })
+
+        elif item_type == "text":
+            text_content.append(item.get("text", ""))
+
+    return {
+        "text": "\n".join(text_content),
+        "search_queries": queries,
+        "search_results": search_results,
+        "model": result.get("model"),
+        "usage": result.get("usage"),
+        "stop_reason": result.get("stop_reason")
+    }
+
+
+def split_news_items(text):
+    """
+    把 AI 总结按编号拆成单条新闻
+    识别 "1. " "1、" "1)" "### 1." "**1. 标题**" 等常见格式，返回 [{"title", "summary"}]
+    """
+    items = []
+    current = None
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        match = NEWS_ITEM_PATTERN.match(stripped)
+        if match:
+            if current:
+                items.append(current)
+            title = match.group(1).replace("**", "").strip().strip("#").strip()
+            current = {"title": title, "summary": ""}
+        elif current and stripped:
+            current["summary"] = (current["summary"] + "\n" + stripped).strip()
+
+    if current:
+        items.append(current)
+    return items
+
+
+def archive_path(archive_dir=None):
+    """归档目录：未指定时为状态目录下的 archive/（见 state_dir.py）"""
+    from state_dir import state_path
+
+    return archive_dir or state_path(ARCHIVE_DIR)
+
+
+def archive_entry(query, text, search_results=None, source="websearch", archive_dir=None, **extra):
+    """
+    归档一条新闻记录
+    extra 中的字段（例如 batch_id、custom_id、model）会一起保存
+    返回归档记录
+    """
+    archive_dir = archive_path(archive_dir)
+    now = datetime.now()
+    search_results = search_results or []
+    digest_id = hashlib.sha256(
+        f"{now.isoformat()}|{query}|{text[:200]}".encode("utf-8")
+    ).hexdigest()[:16]
+
+    entry = {
+        "id": digest_id,
+        "query": query,
+        "source": source,
+        "archived_at": now.isoformat(),
+        "text": text,
+        "search_results": search_results
+    }
+    entry.update(extra)
+
+    day_dir = os.path.join(archive_dir, now.strftime("%Y%m%d"))
+    path = os.path.join(day_dir, f"{now.strftime('%H%M%S')}_{digest_id}.json")
+
+    with _lock:
+        os.makedirs(day_dir, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2, ensure_ascii=False)
+
+        index_entry = {
+            "id": digest_id,
+            "query": query,
+            "source": source,
+            "archived_at": entry["archived_at"],
+            "path": os.path.relpath(path, archive_dir),
+            "results": len(search_results),
+            "chars": len(text)
+        }
+        with open(os.path.join(archive_dir, INDEX_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(index_entry, ensure_ascii=False) + "\n")
+
+    return entry
+
+
+def save_digest(query, result, source="websearch", archive_dir=None, **extra):
+    """归档一次 /v1/messages 响应，返回归档记录"""
+    digest = extract_digest(result)
+    text = digest.pop("text")
+    search_results = digest.pop("search_results")
+    digest["response_id"] = result.get("id")
+    digest.update(extra)
+    return archive_entry(query, text, search_results, source=source, archive_dir=archive_dir, **digest)
+
+
+def read_index(archive_dir=None):
+    """读取归档索引"""
+    index_path = os.path.join(archive_path(archive_dir), INDEX_FILE)
+    if not os.path.exists(index_path):
+        return []
+
+    entries = []
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    return entries
+
+
+def load_digest(index_entry, archive_dir=None):
+    """按索引读取完整的归档记录"""
+    with open(os.path.join(archive_path(archive_dir), index_entry["path"]), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def iter_digests(since=None, source=None, archive_dir=None):
+    """按时间顺序遍历归档记录，since 为 datetime，只返回之后的记录"""
+    for index_entry in read_index(archive_dir):
+        if since is not None and datetime.fromisoformat(index_entry["archived_at"]) < since:
+            continue
+        if source is not None and index_entry["source"] != source:
+            continue
+        try:
+            yield load_digest(index_entry, archive_dir)
+        except (OSError, ValueError):
+            continue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="新闻归档")
+    parser.add_argument("--last", type=int, default=20, help="显示最近 N 条归档")
+    args = parser.parse_args()
+
+    entries = read_index()
+    print(f"归档目录: {archive_path()}")
+    print(f"归档总数: {len(entries)}")
+    print("-" * 80)
+
+    for entry in entries[-args.last:]:
+        print(f"{entry['archived_at'][:19]}  [{entry['source']}]  {entry['query']}")
+        print(f"   来源 {entry['results']} 条，总结 {entry['chars']} 字  ->  {entry['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+近似重复新闻聚类
+不同媒体对同一事件的标题措辞略有不同，分地区查询和多次获取也会带来大量近似重复。
+这里对标题做全角 / 半角统一，中日韩文字按单字、英文按单词切分后取相邻二元组作为 shingle，
+计算 MinHash 签名并用 LSH 分段 (banding) 找出候选对，不需要两两比较，每天 10 万条以上的标题也能在数秒内完成。
+候选对再用精确的 shingle Jaccard 确认，并且只有两个簇的代表（簇中最早的一条）也足够相似时才合并，
+避免签名估计的误差和单链传递把不同事件串成一个大簇。
+
+安装了 numpy 时签名计算是向量化的；没有 numpy 时使用纯 Python 实现（结果相同，速度较慢）。
+
+用法：
+    python news_cluster.py                   # 聚类最近 24 小时归档中的搜索结果和新闻条目
+    python news_cluster.py --hours 168 --top 30
+    python news_cluster.py --benchmark 100000
+"""
+
+import argparse
+import random
+import re
+import time
+import unicodedata
+import zlib
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 签名长度 = 分段数 × 每段行数；相似度约 (1/BANDS) ** (1/ROWS) ≈ 0.5 以上的标题会成为候选对
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# 候选对的估计 Jaccard 相似度达到该值才归为同一簇
+DEFAULT_THRESHOLD = 0.5
+
+# 哈希函数 (a * x + b) mod p，p 取 2^31 - 1，保证 numpy uint64 乘法不溢出
+MERSENNE_PRIME = (1 << 31) - 1
+
+# numpy 计算时每批处理的 shingle 数，限制中间矩阵的内存占用
+CHUNK_SHINGLES = 200000
+
+TOKEN_PATTERN = re.compile(
+    r"[぀-ヿ㐀-䶿一-鿿가-힯]|[a-z0-9]+(?:['.][a-z0-9]+)*"
+)
+
+
+def normalize_text(text):
+    """统一全角 / 半角和大小写，例如 "ＵＳＡ　２０２５" -> "usa 2025" """
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def shingles(text):
+    """
+    把标题切分为 shingle 集合
+    中日韩文字按单字、其他文字按单词切分，取相邻二元组；只有一个词时取该词
+    """
+    tokens = TOKEN_PATTERN.findall(normalize_text(text))
+    if len(tokens) < 2:
+        return set(tokens)
+    return {a + " " + b for a, b in zip(tokens, tokens[1:])}
+
+
+def jaccard(a, b):
+    """两个标题 shingle 集合的精确 Jaccard 相似度"""
+    return _set_jaccard(shingles(a), shingles(b))
+
+
+def _set_jaccard(sa, sb):
+    if not sa or not sb:
+        return 0.0
+    return len(sa & sb) / len(sa | sb)
+
+
+def shingle_hashes(text):
+    """
+    标题 shingle 的 CRC32 哈希集合
+    既是计算 MinHash 签名的输入，也可以代替 shingle 集合计算精确 Jaccard（可以在子进程中算好后传回）
+    """
+    return {zlib.crc32(s.encode("utf-8")) for s in shingles(text)}
+
+
+def _permutations(num_perm, seed=1):
+    rng = random.Random(seed)
+    return [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)]
+
+
+def _signatures_python(hashed, perms):
+    return [
+        tuple(min((a * x + b) % MERSENNE_PRIME for x in hashes) for a, b in perms)
+        for hashes in hashed
+    ]
+
+
+def _signatures_numpy(hashed, perms):
+    a = np.array([p[0] for p in perms], dtype=np.uint64)[:, None]
+    b = np.array([p[1] for p in perms], dtype=np.uint64)[:, None]
+    signatures = np.empty((len(hashed), len(perms)), dtype=np.uint64)
+
+    start = 0
+    while start < len(hashed):
+        # 按 shingle 数分批，把这一批标题的 shingle 拼接起来一次计算
+        end, total = start, 0
+        while end < len(hashed) and (total == 0 or total + len(hashed[end]) <= CHUNK_SHINGLES):
+            total += len(hashed[end])
+            end += 1
+
+        lengths = np.fromiter((len(h) for h in hashed[start:end]), dtype=np.int64, count=end - start)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        values = np.fromiter((x for h in hashed[start:end] for x in h), dtype=np.uint64, count=total)
+
+        permuted = (a * values[None, :] + b) % np.uint64(MERSENNE_PRIME)
+        signatures[start:end] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        start = end
+
+    return signatures
+
+
+def minhash_signatures(texts, num_perm=NUM_PERM, seed=1):
+    """计算 MinHash 签名，安装了 numpy 时返回 (n, num_perm) 数组，否则返回元组列表"""
+    return hashed_signatures([shingle_hashes(text) for text in texts], num_perm, seed)
+
+
+def hashed_signatures(hashed, num_perm=NUM_PERM, seed=1):
+    """按 shingle_hashes() 的结果计算 MinHash 签名，返回值同 minhash_signatures"""
+    # 空标题也给一个固定的 shingle，保证每条都有签名
+    hashed = [list(hashes) or [0] for hashes in hashed]
+    perms = _permutations(num_perm, seed)
+    if np is not None:
+        return _signatures_numpy(hashed, perms)
+    return _signatures_python(hashed, perms)
+
+
+def _candidate_pairs_python(signatures, threshold, bands, rows):
+    for band in range(bands):
+        buckets = {}
+        lo, hi = band * rows, (band + 1) * rows
+        for i, signature in enumerate(signatures):
+            first = buckets.setdefault(signature[lo:hi], i)
+            if first == i:
+                continue
+            # 同一分段哈希相同的候选对，再用签名估计相似度确认，减少误合并
+            same = sum(1 for x, y in zip(signature, signatures[first]) if x == y)
+            if same / len(signature) >= threshold:
+                yield i, first
+
+
+def _candidate_pairs_numpy(signatures, threshold, bands, rows):
+    n = len(signatures)
+    mixers = np.array(_permutations(rows, seed=2), dtype=np.uint64)[:, 0]
+
+    for band in range(bands):
+        # 每段的几行签名合成一个 64 位键，相同键的标题落在同一个桶里
+        keys = signatures[:, band * rows:(band + 1) * rows] @ mixers
+        _, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        first = first_index[inverse.reshape(-1)]
+        candidates = np.nonzero(first != np.arange(n))[0]
+        if not len(candidates):
+            continue
+
+        # 同一分段哈希相同的候选对，再用签名估计相似度确认，减少误合并
+        similarity = np.mean(signatures[candidates] == signatures[first[candidates]], axis=1)
+        confirmed = candidates[similarity >= threshold]
+        yield from zip(confirmed.tolist(), first[confirmed].tolist())
+
+
+def cluster_texts(texts, threshold=DEFAULT_THRESHOLD, bands=BANDS, rows=ROWS):
+    """
+    近似重复聚类
+    返回簇列表（每个簇是原始下标的列表，按簇大小降序，簇内按下标升序）
+    """
+    if not texts:
+        return []
+    hashed = [shingle_hashes(text) for text in texts]
+    return cluster_signatures(hashed_signatures(hashed, num_perm=bands * rows), threshold, bands, rows,
+                              shingle_sets=hashed)
+
+
+def cluster_signatures(signatures, threshold=DEFAULT_THRESHOLD, bands=BANDS, rows=ROWS, texts=None,
+                       shingle_sets=None):
+    """
+    按已计算好的 MinHash 签名聚类（签名可以在其他进程中计算，见 postprocess.py）
+    signatures 为 (n, bands * rows) 的 numpy 数组或元组列表，返回值同 cluster_texts
+    shingle_sets 为每条的 shingle 集合或 shingle_hashes() 哈希集合，也可以给出计算签名用的文本 texts：
+    给出时候选对用精确 Jaccard 确认，并要求两个簇的代表也相似才合并；
+    都不给出时只能按签名估计的相似度单链合并，容易把不同事件串在一起
+    """
+    if not len(signatures):
+        return []
+
+    if shingle_sets is None and texts is not None:
+        shingle_sets = [shingle_hashes(text) for text in texts]
+
+    def similar(i, j):
+        return _set_jaccard(shingle_sets[i], shingle_sets[j]) >= threshold
+
+    parent = list(range(len(signatures)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if np is not None:
+        pairs = _candidate_pairs_numpy(signatures, threshold, bands, rows)
+    else:
+        pairs = _candidate_pairs_python(signatures, threshold, bands, rows)
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i == root_j:
+            continue
+        # 簇的代表是下标最小的一条（根），与候选对都要达到阈值，簇不会沿着相似链无限扩张
+        if shingle_sets is not None and not (similar(i, j) and similar(root_i, root_j)):
+            continue
+        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = {}
+    for i in range(len(signatures)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(groups.values(), key=lambda group: (-len(group), group[0]))
+
+
+def cluster_items(items, key="title", threshold=DEFAULT_THRESHOLD):
+    """按 items[i][key] 聚类，返回簇列表（每个簇是 item 的列表）"""
+    clusters = cluster_texts([item.get(key, "") for item in items], threshold=threshold)
+    return [[items[i] for i in group] for group in clusters]
+
+
+def collect_archive_titles(hours=24):
+    """收集最近 N 小时归档中的搜索结果标题和新闻条目"""
+    from news_archive import iter_digests, split_news_items
+
+    items = []
+    for digest in iter_digests(since=datetime.now() - timedelta(hours=hours)):
+        for result in digest.get("search_results", []):
+            items.append({"title": result.get("title", ""), "url": result.get("url"), "kind": "source"})
+        for item in split_news_items(digest.get("text", "")):
+            items.append({"title": item["title"], "url": None, "kind": "summary"})
+    return items
+
+
+def _synthetic_headlines(count, seed=7):
+    """生成带近似重复的模拟标题（约 5 条一个事件），用于性能测试"""
+    rng = random.Random(seed)
+    words = ["联合国", "欧洲央行", "美联储", "日本政府", "非洲联盟", "巴西", "印度", "OPEC", "WHO", "欧盟",
+             "宣布", "召开", "通过", "否决", "讨论", "发布", "暂停", "启动", "利率", "紧急会议", "气候",
+             "贸易协定", "疫苗", "AI 监管", "减产", "援助", "选举", "地震", "峰会", "制裁", "芯片", "股市"]
+    suffixes = ["", "——路透社", " | BBC", "（更新）", " - 新华网", "：各方回应"]
+
+    events = ["".join(rng.sample(words, 6)) for _ in range(max(1, count // 5))]
+    return [rng.choice(events) + rng.choice(suffixes) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似重复新闻聚类")
+    parser.add_argument("--hours", type=float, default=24, help="聚类最近 N 小时的归档")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="相似度阈值")
+    parser.add_argument("--top", type=int, default=20, help="显示最大的 N 个簇")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="用 N 条模拟标题测试聚类速度")
+    args = parser.parse_args()
+
+    print(f"签名计算: {'numpy' if np is not None else '纯 Python（pip install numpy 可加速）'}")
+
+    if args.benchmark:
+        titles = _synthetic_headlines(args.benchmark)
+        started = time.perf_counter()
+        clusters = cluster_texts(titles, threshold=args.threshold)
+        elapsed = time.perf_counter() - started
+        print(f"{len(titles)} 条标题 -> {len(clusters)} 个簇，耗时 {elapsed:.2f}s "
+              f"({len(titles) / elapsed:.0f} 条/秒)")
+        return
+
+    items = collect_archive_titles(args.hours)
+    if not items:
+        print(f"最近 {args.hours:g} 小时没有归档记录")
+        return
+
+    clusters = cluster_items(items, threshold=args.threshold)
+    duplicates = sum(len(cluster) - 1 for cluster in clusters)
+    print(f"标题 {len(items)} 条 -> {len(clusters)} 个事件（近似重复 {duplicates} 条）")
+    print("=" * 80)
+
+    for i, cluster in enumerate(clusters[:args.top], 1):
+        print(f"{i}. [{len(cluster)}] {cluster[0]['title']}")
+        seen = {cluster[0]["title"]}
+        for item in cluster[1:]:
+            if item["title"] not in seen:
+                seen.add(item["title"])
+                print(f"      ~ {item['title']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+新闻网关 HTTP 服务
+多个内部服务各自运行 get_news_with_websearch_final.py 时，上游请求数随使用方数量增长。
+网关统一提供 GET /news?query=...，按 stale-while-revalidate 语义返回缓存的新闻：
+
+- 新鲜期内（--ttl）：直接返回缓存
+- 过期但在 --swr 秒内：立即返回旧结果，同时在后台刷新（每个查询同一时间只刷新一次）
+- 没有可用缓存：同步获取，同一查询的并发请求共享一次上游请求
+- 刷新失败时，在 --sie 秒内继续返回旧结果 (stale-if-error)，并带 Warning 头
+
+响应带 ETag，客户端带 If-None-Match 轮询时内容未变返回 304。
+上游请求数只取决于刷新频率，与使用方数量无关。
+查询按 query_cache.normalize_query 规范化，"今天的国际要闻" 和 "最新重要国际新闻" 共用同一份结果（条数不同的查询分开缓存）。
+
+接口：
+    GET /news?query=最新5条重要国际新闻[&format=text]
+    GET /stats
+
+用法：
+    python news_gateway.py --port 8080
+    python news_gateway.py --ttl 600 --swr 3600 --sie 86400
+    python news_gateway.py --mock                 # 使用本地模拟服务作为上游
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from query_cache import normalize_query
+
+GATEWAY_CACHE_FILE = "gateway_cache.json"
+
+DEFAULT_QUERY = "最新5条重要国际新闻"
+
+# 新鲜期、过期后继续返回并后台刷新的时间、刷新失败时继续返回旧结果的时间（秒）
+DEFAULT_TTL = 600
+DEFAULT_SWR = 3600
+DEFAULT_SIE = 86400
+# 刷新失败后，至少间隔这么久再重试
+ERROR_BACKOFF = 60
+# 同步获取时最长等待时间
+DEFAULT_WAIT = 180
+
+
+def fetch_digest(query):
+    """默认的上游：web_search 获取新闻并归档，返回 extract_digest 的结果"""
+    from get_news_with_websearch_final import fetch_web_search_result
+    from news_archive import extract_digest, save_digest
+
+    result = fetch_web_search_result(query)
+    digest = extract_digest(result)
+    if not digest["text"]:
+        raise RuntimeError("响应中没有文本内容")
+    save_digest(query, result, source="gateway")
+    return digest
+
+
+class _Entry:
+    __slots__ = ("query", "digest", "fetched_at", "etag", "body", "refreshing", "error", "error_at")
+
+    def __init__(self, query):
+        self.query = query
+        self.digest = None
+        self.fetched_at = 0.0
+        self.etag = None
+        self.body = None
+        self.refreshing = None
+        self.error = None
+        self.error_at = 0.0
+
+    def set_digest(self, digest, fetched_at):
+        self.digest = digest
+        self.fetched_at = fetched_at
+        # 响应体不包含随时间变化的字段（年龄放在 Age 头中），内容不变时 ETag 不变
+        self.body = json.dumps({
+            "query": self.query,
+            "text": digest["text"],
+            "search_results": digest.get("search_results", []),
+            "model": digest.get("model"),
+            "fetched_at": datetime.fromtimestamp(fetched_at).isoformat(timespec="seconds")
+        }, ensure_ascii=False).encode("utf-8")
+        self.etag = '"%s"' % hashlib.sha256(digest["text"].encode("utf-8")).hexdigest()[:20]
+
+    def view(self):
+        """当前结果的快照（后台刷新可能随时替换结果，调用方需持有锁）"""
+        return {"query": self.query, "digest": self.digest, "fetched_at": self.fetched_at,
+                "etag": self.etag, "body": self.body, "error": self.error}
+
+
+class NewsGateway:
+    """按 stale-while-revalidate / stale-if-error 语义管理每个查询的缓存"""
+
+    def __init__(self, fetcher=fetch_digest, ttl=DEFAULT_TTL, swr=DEFAULT_SWR, sie=DEFAULT_SIE,
+                 path=GATEWAY_CACHE_FILE):
+        from state_dir import state_path
+
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.swr = swr
+        self.sie = sie
+        # path 为 None 时不持久化；相对路径位于状态目录下（见 state_dir.py）
+        self.path = state_path(path) if path else None
+        self._entries = {}
+        self._lock = threading.Lock()
+        # 多个刷新线程同时保存时，写临时文件和替换必须串行，否则会写坏同一个 .tmp 文件
+        self._save_lock = threading.Lock()
+        self.stats = {"requests": 0, "fresh": 0, "stale": 0, "miss": 0, "stale_if_error": 0,
+                      "not_modified": 0, "refreshes": 0, "refresh_errors": 0}
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  网关缓存读取失败: {e}")
+            return
+        # 重启后立即可以返回旧结果，并按需刷新
+        for key, item in saved.items():
+            entry = _Entry(item["query"])
+            entry.set_digest(item["digest"], item["fetched_at"])
+            self._entries[key] = entry
+
+    def _save(self):
+        if not self.path:
+            return
+        # 在保存锁内取快照，后写入的总是更新的快照
+        with self._save_lock:
+            with self._lock:
+                data = {key: {"query": entry.query, "digest": entry.digest, "fetched_at": entry.fetched_at}
+                        for key, entry in self._entries.items() if entry.digest is not None}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _refresh(self, entry, done):
+        """获取一次上游结果（在后台线程中执行）"""
+        from scheduler import request_priority
+
+        self._count("refreshes")
+        # 使用方已经拿到旧结果时，后台刷新不与交互式请求争抢名额
+        priority = "background" if entry.digest is not None else "interactive"
+        try:
+            with request_priority(priority, tenant="gateway"):
+                digest = self.fetcher(entry.query)
+        except Exception as e:
+            self._count("refresh_errors")
+            print(f"⚠️  刷新失败 [{entry.query}]: {type(e).__name__}: {e}")
+            with self._lock:
+                entry.error = f"{type(e).__name__}: {e}"
+                entry.error_at = time.time()
+                entry.refreshing = None
+        else:
+            with self._lock:
+                entry.set_digest(digest, time.time())
+                entry.error = None
+                entry.refreshing = None
+            self._save()
+        finally:
+            done.set()
+
+    def _start_refresh(self, entry):
+        """开始刷新（已有刷新在进行时复用），返回完成事件；调用方需持有锁"""
+        if entry.refreshing is None:
+            entry.refreshing = threading.Event()
+            threading.Thread(target=self._refresh, args=(entry, entry.refreshing), daemon=True).start()
+        return entry.refreshing
+
+    def get(self, query, wait=DEFAULT_WAIT):
+        """
+        返回 (结果快照, 状态)，状态为 fresh / stale / miss / stale_if_error；
+        没有可用结果时返回 (结果快照, "error")
+        """
+        key = normalize_query(query)
+        now = time.time()
+
+        with self._lock:
+            self.stats["requests"] += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(query)
+
+            age = now - entry.fetched_at
+            backing_off = entry.error is not None and now - entry.error_at < ERROR_BACKOFF
+
+            if entry.digest is not None and age <= self.ttl:
+                self.stats["fresh"] += 1
+                return entry.view(), "fresh"
+
+            if entry.digest is not None and age <= self.ttl + self.swr:
+                if not backing_off:
+                    self._start_refresh(entry)
+                status = "stale" if entry.error is None else "stale_if_error"
+                self.stats[status] += 1
+                return entry.view(), status
+
+            if backing_off:
+                done = None
+            else:
+                done = self._start_refresh(entry)
+
+        if done is not None:
+            done.wait(wait)
+
+        with self._lock:
+            now = time.time()
+            if entry.digest is not None and now - entry.fetched_at <= self.ttl:
+                self.stats["miss"] += 1
+                return entry.view(), "miss"
+            if entry.digest is not None and now - entry.fetched_at <= self.ttl + self.sie:
+                self.stats["stale_if_error"] += 1
+                return entry.view(), "stale_if_error"
+            return entry.view(), "error"
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            queries = [
+                {"query": entry.query, "age": round(now - entry.fetched_at) if entry.digest else None,
+                 "refreshing": entry.refreshing is not None, "error": entry.error}
+                for entry in self._entries.values()
+            ]
+            return {"stats": dict(self.stats), "ttl": self.ttl, "swr": self.swr, "sie": self.sie,
+                    "queries": queries}
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    """GET /news 和 GET /stats"""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def gateway(self):
+        return self.server.gateway
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send_body(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = parse_qs(parts.query)
+
+        if parts.path == "/stats":
+            self._send_json(200, self.gateway.snapshot())
+            return
+        if parts.path != "/news":
+            self._send_json(404, {"error": f"Not found: {parts.path}"})
+            return
+
+        query = (params.get("query") or [DEFAULT_QUERY])[0].strip() or DEFAULT_QUERY
+        as_text = (params.get("format") or ["json"])[0] == "text"
+        entry, status = self.gateway.get(query)
+
+        if status == "error":
+            self._send_json(502, {"error": f"上游获取失败: {entry['error'] or '超时'}", "query": query})
+            return
+
+        gateway = self.gateway
+        age = max(0, int(time.time() - entry["fetched_at"]))
+        etag = entry["etag"][:-1] + ('-text"' if as_text else '"')
+        headers = {
+            "ETag": etag,
+            "Age": str(age),
+            "Last-Modified": formatdate(entry["fetched_at"], usegmt=True),
+            "Cache-Control": f"max-age={max(0, gateway.ttl - age)}, stale-while-revalidate={gateway.swr}, "
+                             f"stale-if-error={gateway.sie}",
+            "X-Cache": status.upper().replace("_", "-")
+        }
+        if status == "stale_if_error":
+            headers["Warning"] = '111 - "Revalidation Failed"'
+        elif status == "stale":
+            headers["Warning"] = '110 - "Response is Stale"'
+
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            gateway._count("not_modified")
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        if as_text:
+            body = entry["digest"]["text"].encode("utf-8")
+            self._send_body(200, body, "text/plain; charset=utf-8", headers)
+        else:
+            self._send_body(200, entry["body"], "application/json; charset=utf-8", headers)
+
+
+def start_gateway(port=0, host="127.0.0.1", **options):
+    """在后台线程启动网关，返回 (server, base_url)；options 传给 NewsGateway"""
+    server = ThreadingHTTPServer((host, port), GatewayHandler)
+    server.daemon_threads = True
+    server.gateway = NewsGateway(**options)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="新闻网关 HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="新鲜期（秒）")
+    parser.add_argument("--swr", type=float, default=DEFAULT_SWR, help="过期后继续返回旧结果并后台刷新的时间（秒）")
+    parser.add_argument("--sie", type=float, default=DEFAULT_SIE, help="刷新失败时继续返回旧结果的时间（秒）")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟服务作为上游")
+    args = parser.parse_args()
+
+    if args.mock:
+        from mock_server import start_mock_server
+
+        _, base_url = start_mock_server()
+        os.environ["API_BASE_URL"] = base_url
+        os.environ.setdefault("API_KEY", "mock-key")
+
+    server = ThreadingHTTPServer((args.host, args.port), GatewayHandler)
+    server.daemon_threads = True
+    server.gateway = NewsGateway(ttl=args.ttl, swr=args.swr, sie=args.sie)
+
+    print(f"新闻网关已启动: http://{args.host}:{args.port}/news?query={DEFAULT_QUERY}")
+    print(f"新鲜期 {args.ttl:g}s  stale-while-revalidate {args.swr:g}s  stale-if-error {args.sie:g}s")
+    print("按 Ctrl+C 停止")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+多进程后处理
+抓取之后的正文提取、文本规范化、国家 / 地区识别和 MinHash 签名计算都是 CPU 密集的，
+在一个进程里受 GIL 限制只能用一个核。这里把它们放到进程池中执行：
+
+- 文档按批（默认 32 篇）发送给子进程，每批只有一次进程间通信
+- 批数据打包为一段原始字节（长度偏移表 + 拼接的数据），不序列化字典；
+  超过 1 MB 的批通过共享内存 (multiprocessing.shared_memory) 传递，只传名字
+- 结果同样打包为原始字节返回，签名和 shingle 哈希为 uint32 数组（聚类时不必在主进程重新切分文本）
+
+抓取流程（asyncio + 线程池）只负责下载，把页面交给 PostProcessPool.submit() 后等待结果，
+事件循环不会被 CPU 计算阻塞。
+
+用法：
+    python postprocess.py --benchmark 2000              # 对比单进程和进程池的处理速度
+    python postprocess.py --benchmark 2000 --workers 4 --batch-size 64
+"""
+
+import argparse
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import unicodedata
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from news_cluster import NUM_PERM, cluster_signatures, hashed_signatures, shingle_hashes
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+DEFAULT_BATCH_SIZE = 32
+# 凑不满一批时最多等待的时间（秒）
+DEFAULT_LINGER = 0.02
+# 超过该大小的批通过共享内存传递
+SHM_THRESHOLD = 1024 * 1024
+# 计算签名时只取正文的前 N 个字符（标题 + 导语足以判断是否为同一事件）
+SIGNATURE_CHARS = 2000
+
+# 批数据头：文档数、每篇文档的字段数、标志位
+_HEADER = struct.Struct("<III")
+FLAG_SIGNATURES = 1
+
+ENTITY_SEPARATOR = "\x1f"
+
+# 国家 / 地区和国际组织的规范名称及别名
+COUNTRY_ALIASES = {
+    "美国": ("美国", "美方", "白宫", "华盛顿", "United States", "U.S.", "USA"),
+    "中国": ("中国", "中方", "北京", "China", "Beijing"),
+    "日本": ("日本", "日方", "东京", "Japan", "Tokyo"),
+    "韩国": ("韩国", "首尔", "South Korea", "Seoul"),
+    "朝鲜": ("朝鲜", "平壤", "North Korea"),
+    "印度": ("印度", "新德里", "India"),
+    "俄罗斯": ("俄罗斯", "俄方", "莫斯科", "克里姆林宫", "Russia", "Moscow", "Kremlin"),
+    "乌克兰": ("乌克兰", "基辅", "Ukraine", "Kyiv"),
+    "英国": ("英国", "伦敦", "United Kingdom", "Britain", "London"),
+    "法国": ("法国", "巴黎", "France", "Paris"),
+    "德国": ("德国", "柏林", "Germany", "Berlin"),
+    "意大利": ("意大利", "Italy"),
+    "西班牙": ("西班牙", "Spain"),
+    "土耳其": ("土耳其", "Turkey", "Türkiye"),
+    "以色列": ("以色列", "Israel"),
+    "巴勒斯坦": ("巴勒斯坦", "加沙", "Palestine", "Gaza"),
+    "伊朗": ("伊朗", "德黑兰", "Iran", "Tehran"),
+    "沙特阿拉伯": ("沙特", "Saudi Arabia"),
+    "埃及": ("埃及", "开罗", "Egypt", "Cairo"),
+    "南非": ("南非", "South Africa"),
+    "尼日利亚": ("尼日利亚", "Nigeria"),
+    "肯尼亚": ("肯尼亚", "Kenya"),
+    "巴西": ("巴西", "Brazil"),
+    "墨西哥": ("墨西哥", "Mexico"),
+    "阿根廷": ("阿根廷", "Argentina"),
+    "加拿大": ("加拿大", "Canada"),
+    "澳大利亚": ("澳大利亚", "Australia"),
+    "印度尼西亚": ("印度尼西亚", "印尼", "Indonesia"),
+    "越南": ("越南", "Vietnam"),
+    "泰国": ("泰国", "Thailand"),
+    "菲律宾": ("菲律宾", "Philippines"),
+    "巴基斯坦": ("巴基斯坦", "Pakistan"),
+    "欧盟": ("欧盟", "欧洲联盟", "布鲁塞尔", "European Union", "EU"),
+    "联合国": ("联合国", "United Nations", "UN"),
+    "北约": ("北约", "NATO"),
+    "东盟": ("东盟", "ASEAN"),
+    "非洲联盟": ("非洲联盟", "非盟", "African Union"),
+}
+
+_ALIAS_TO_NAME = {alias.lower(): name for name, aliases in COUNTRY_ALIASES.items() for alias in aliases}
+# 长别名优先匹配；英文别名要求单词边界
+ENTITY_PATTERN = re.compile("|".join(
+    re.escape(alias) if not alias[0].isascii() else rf"(?<![A-Za-z]){re.escape(alias)}(?![A-Za-z])"
+    for alias in sorted(_ALIAS_TO_NAME, key=len, reverse=True)
+), re.IGNORECASE)
+
+
+# 全角字母、数字和空格转为半角；中文标点保持不变（NFKC 会把"，"变成","）
+FULLWIDTH_TABLE = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F) if chr(code - 0xFEE0).isalnum()}
+FULLWIDTH_TABLE[0x3000] = " "
+
+
+def normalize_article_text(text):
+    """统一全角 / 半角字母数字，压缩段落内的空白（保留大小写、中文标点和段落分隔）"""
+    text = unicodedata.normalize("NFC", text or "").translate(FULLWIDTH_TABLE)
+    paragraphs = (" ".join(paragraph.split()) for paragraph in text.split("\n\n"))
+    return "\n\n".join(paragraph for paragraph in paragraphs if paragraph)
+
+
+def extract_entities(text):
+    """识别文本中提到的国家 / 地区和国际组织，按首次出现的顺序返回规范名称"""
+    names = (_ALIAS_TO_NAME.get(match.group(0).lower()) for match in ENTITY_PATTERN.finditer(text or ""))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def pack_fields(records, flags=0):
+    """
+    把 [(bytes, bytes, ...), ...] 打包为一段字节：
+    头部 | uint64 偏移表（文档数 × 字段数 + 1 项）| 拼接的字段数据
+    """
+    count = len(records)
+    width = len(records[0]) if records else 0
+    offsets = array("Q", [0])
+    for record in records:
+        for field in record:
+            offsets.append(offsets[-1] + len(field))
+    return b"".join([_HEADER.pack(count, width, flags), offsets.tobytes()] +
+                    [field for record in records for field in record])
+
+
+def unpack_fields(buffer):
+    """pack_fields 的逆操作，返回 (记录列表, 标志位)；字段是 buffer 的 memoryview 切片，不复制数据"""
+    view = memoryview(buffer)
+    count, width, flags = _HEADER.unpack_from(view)
+    offsets = array("Q")
+    offsets.frombytes(view[_HEADER.size:_HEADER.size + (count * width + 1) * 8])
+    base = _HEADER.size + len(offsets) * 8
+
+    records = []
+    for i in range(count):
+        records.append(tuple(
+            view[base + offsets[i * width + j]:base + offsets[i * width + j + 1]] for j in range(width)
+        ))
+    return records, flags
+
+
+def _process_document(content_type, body):
+    from article_fetcher import _detect_charset, extract_main_text
+
+    if "html" in content_type or not content_type:
+        extracted = extract_main_text(body.decode(_detect_charset(body, content_type), errors="replace"))
+    else:
+        extracted = {"title": "", "text": body.decode("utf-8", errors="replace")}
+
+    title = normalize_article_text(extracted["title"])
+    text = normalize_article_text(extracted["text"])
+    return title, text, extract_entities(f"{title}\n{text}")
+
+
+def process_batch(payload):
+    """
+    子进程中处理一批文档
+    payload 为打包的字节，或 ("shm", 共享内存名) 元组；返回打包的结果字节
+    """
+    block = None
+    if isinstance(payload, tuple):
+        block = shared_memory.SharedMemory(name=payload[1])
+        buffer = block.buf
+    else:
+        buffer = payload
+
+    try:
+        records, flags = unpack_fields(buffer)
+        processed = [_process_document(bytes(content_type).decode("utf-8"), bytes(body))
+                     for content_type, body in records]
+        del records
+    finally:
+        if block is not None:
+            del buffer
+            block.close()
+
+    hashed, signatures = None, None
+    if flags & FLAG_SIGNATURES and processed:
+        hashed = [shingle_hashes(f"{title}\n{text[:SIGNATURE_CHARS]}") for title, text, _ in processed]
+        signatures = hashed_signatures(hashed)
+
+    results = []
+    for i, (title, text, entities) in enumerate(processed):
+        signature, hashes = b"", b""
+        if signatures is not None:
+            signature = array("I", [int(x) for x in signatures[i]]).tobytes()
+            hashes = array("I", sorted(hashed[i])).tobytes()
+        results.append((title.encode("utf-8"), text.encode("utf-8"),
+                        ENTITY_SEPARATOR.join(entities).encode("utf-8"), signature, hashes))
+    return pack_fields(results, flags)
+
+
+def decode_results(packed):
+    """把 process_batch 返回的字节解析为结果字典列表"""
+    records, flags = unpack_fields(packed)
+    results = []
+    for title, text, entities, signature, hashes in records:
+        entities = bytes(entities).decode("utf-8")
+        results.append({
+            "title": bytes(title).decode("utf-8"),
+            "text": bytes(text).decode("utf-8"),
+            "entities": entities.split(ENTITY_SEPARATOR) if entities else [],
+            "signature": array("I", bytes(signature)) if flags & FLAG_SIGNATURES else None,
+            "shingles": frozenset(array("I", bytes(hashes))) if flags & FLAG_SIGNATURES else None
+        })
+    return results
+
+
+class PostProcessPool:
+    """
+    按批把文档交给进程池处理
+    submit() 可以在任意线程调用，返回 concurrent.futures.Future（asyncio 中可用 asyncio.wrap_future 等待）
+    """
+
+    def __init__(self, workers=None, batch_size=DEFAULT_BATCH_SIZE, linger=DEFAULT_LINGER,
+                 signatures=True, shm_threshold=SHM_THRESHOLD):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = max(1, batch_size)
+        self.linger = linger
+        self.flags = FLAG_SIGNATURES if signatures else 0
+        self.shm_threshold = shm_threshold if shared_memory is not None else None
+
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"documents": 0, "batches": 0, "shm_batches": 0, "bytes_in": 0, "bytes_out": 0}
+
+        self._batcher = threading.Thread(target=self._run_batcher, daemon=True)
+        self._batcher.start()
+
+    def submit(self, body, content_type="text/html"):
+        """提交一篇文档（原始字节），结果为 {"title", "text", "entities", "signature", "shingles"}"""
+        if self._closed:
+            raise RuntimeError("后处理进程池已关闭")
+        future = Future()
+        self._pending.put((content_type or "", body, future))
+        return future
+
+    def map(self, documents):
+        """处理 [(body, content_type), ...]，按顺序返回结果列表"""
+        futures = [self.submit(body, content_type) for body, content_type in documents]
+        return [future.result() for future in futures]
+
+    def _run_batcher(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._pending.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._send(batch)
+                    return
+                batch.append(item)
+            self._send(batch)
+
+    def _send(self, batch):
+        packed = pack_fields([(content_type.encode("utf-8"), body) for content_type, body, _ in batch], self.flags)
+        futures = [future for _, _, future in batch]
+
+        block = None
+        payload = packed
+        if self.shm_threshold is not None and len(packed) >= self.shm_threshold:
+            block = shared_memory.SharedMemory(create=True, size=len(packed))
+            block.buf[:len(packed)] = packed
+            payload = ("shm", block.name)
+
+        with self._lock:
+            self.stats["documents"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["bytes_in"] += len(packed)
+            self.stats["shm_batches"] += 1 if block is not None else 0
+
+        try:
+            job = self._executor.submit(process_batch, payload)
+        except Exception as e:
+            self._release(block)
+            for future in futures:
+                future.set_exception(e)
+            return
+        job.add_done_callback(lambda job: self._complete(job, futures, block))
+
+    @staticmethod
+    def _release(block):
+        if block is not None:
+            block.close()
+            block.unlink()
+
+    def _complete(self, job, futures, block):
+        self._release(block)
+        try:
+            packed = job.result()
+            results = decode_results(packed)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self.stats["bytes_out"] += len(packed)
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+    def close(self):
+        """处理完已提交的文档后关闭进程池"""
+        if self._closed:
+            return
+        self._closed = True
+        self._pending.put(None)
+        self._batcher.join()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def cluster_results(results, threshold=0.5):
+    """
+    按子进程计算的签名和 shingle 哈希对结果聚类，返回簇列表（每个簇是结果下标的列表）
+    结果没有签名（进程池以 signatures=False 创建）时抛出 ValueError
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    if any(result.get("signature") is None for result in results):
+        raise ValueError("结果没有 MinHash 签名，聚类需要以 signatures=True 创建 PostProcessPool")
+
+    signatures = [result["signature"] for result in results]
+    if np is not None:
+        matrix = np.array(signatures, dtype=np.uint64).reshape(len(signatures), NUM_PERM)
+    else:
+        matrix = [tuple(signature) for signature in signatures]
+    # 候选对用子进程传回的 shingle 哈希计算精确 Jaccard 确认
+    return cluster_signatures(matrix, threshold, shingle_sets=[result["shingles"] for result in results])
+
+
+def _synthetic_pages(count):
+    """用模拟新闻页面生成测试文档（内容略有不同）"""
+    from mock_server import MOCK_NEWS, build_article_html
+
+    pages = []
+    for i in range(count):
+        slug = MOCK_NEWS[i % len(MOCK_NEWS)][2].rstrip("/").rsplit("/", 1)[-1]
+        extra = f"<p>第 {i} 篇文章的补充报道，记者持续关注事态发展。</p></article>".encode("utf-8")
+        pages.append((build_article_html(slug).replace(b"</article>", extra), "text/html; charset=utf-8"))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程后处理")
+    parser.add_argument("--benchmark", type=int, default=2000, metavar="N", help="处理 N 篇模拟页面")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="子进程数（默认 CPU 核数）")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每批文档数")
+    args = parser.parse_args()
+
+    pages = _synthetic_pages(args.benchmark)
+    print(f"{len(pages)} 篇页面，共 {sum(len(body) for body, _ in pages) / 1024 / 1024:.1f} MB，"
+          f"CPU 核数 {os.cpu_count()}")
+    print("=" * 80)
+
+    started = time.perf_counter()
+    serial = decode_results(process_batch(pack_fields(
+        [(content_type.encode("utf-8"), body) for body, content_type in pages], FLAG_SIGNATURES)))
+    serial_elapsed = time.perf_counter() - started
+    print(f"单进程: {serial_elapsed:.2f}s ({len(pages) / serial_elapsed:.0f} 篇/秒)")
+
+    started = time.perf_counter()
+    with PostProcessPool(workers=args.workers, batch_size=args.batch_size) as pool:
+        results = pool.map(pages)
+    pool_elapsed = time.perf_counter() - started
+    stats = pool.stats
+    print(f"进程池 ({pool.workers} 个子进程，每批 {pool.batch_size} 篇): {pool_elapsed:.2f}s "
+          f"({len(pages) / pool_elapsed:.0f} 篇/秒，加速 {serial_elapsed / pool_elapsed:.1f}x)")
+    print(f"  批次 {stats['batches']}（共享内存 {stats['shm_batches']}）  "
+          f"发送 {stats['bytes_in'] / 1024 / 1024:.1f} MB  接收 {stats['bytes_out'] / 1024 / 1024:.1f} MB")
+
+    if [r["text"] for r in results] != [r["text"] for r in serial]:
+        print("⚠️  进程池结果与单进程不一致")
+
+    clusters = cluster_results(results)
+    print(f"聚类: {len(results)} 篇 -> {len(clusters)} 个事件")
+    print(f"示例: {results[0]['title']}  涉及: {'、'.join(results[0]['entities']) or '无'}")
+
+
+if __name__ == "__main__":
+    main()
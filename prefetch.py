@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+热门查询预取
+早间国际新闻等热门查询的请求时间很有规律，但第一个请求的人总要等待 60-90 秒的实时搜索。
+这里根据查询日志 (query_log.jsonl) 学习每个查询在一天中各时段的需求
+（按 15 分钟分段，最近的日子权重更高），在预计有人请求之前把结果写入查询缓存，
+第一个请求也能直接命中缓存。
+
+每天预取消耗的 token 不超过预算（--budget 或 NEWS_PREFETCH_BUDGET），
+预算按 "节省的等待时间 / 预计 token" 从高到低分配。预取请求以 background 优先级发送。
+
+用法：
+    python prefetch.py                     # 查看学到的需求高峰和接下来要预取的查询
+    python prefetch.py --run               # 预取一次（适合每 5 分钟由 cron 调用）
+    python prefetch.py --loop --interval 300
+    python prefetch.py --run --mock        # 使用本地模拟服务
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from query_log import load_query_log
+
+PREFETCH_STATE_FILE = "prefetch_state.json"
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+# 学习最近 N 天的日志，权重每 HALF_LIFE_DAYS 天减半
+HISTORY_DAYS = 28
+HALF_LIFE_DAYS = 7
+
+# 预取覆盖接下来多长时间的需求（秒），需小于查询缓存的新鲜期
+HORIZON = 20 * 60
+# 预计请求数达到该值才预取
+MIN_DEMAND = 0.5
+# 每天的预取 token 预算
+DEFAULT_BUDGET = 200000
+# 没有历史用量时，一次 web_search 请求的预计 token 数
+DEFAULT_TOKEN_ESTIMATE = 20000
+# 没有实时请求记录时，假设的冷启动等待时间（秒）
+DEFAULT_COLD_LATENCY = 60.0
+
+
+def _slot(timestamp):
+    moment = datetime.fromtimestamp(timestamp)
+    return (moment.hour * 60 + moment.minute) // SLOT_MINUTES
+
+
+def learn_demand(entries, now=None):
+    """
+    按查询学习各时段的需求
+    返回 {key: {"query", "rates", "tokens", "latency", "requests"}}，rates[i] 为第 i 个时段平均每天的请求数
+    """
+    now = now or time.time()
+    entries = [entry for entry in entries if now - HISTORY_DAYS * 86400 <= entry["time"] <= now]
+    if not entries:
+        return {}
+
+    # 把日志覆盖的天数按同样的衰减加权，作为每天请求数的分母
+    days = min(HISTORY_DAYS, math.ceil((now - min(entry["time"] for entry in entries)) / 86400) or 1)
+    day_weight = sum(0.5 ** (day / HALF_LIFE_DAYS) for day in range(days))
+
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[entry["key"]].append(entry)
+
+    model = {}
+    for key, group in groups.items():
+        rates = [0.0] * SLOTS_PER_DAY
+        for entry in group:
+            age_days = (now - entry["time"]) / 86400
+            rates[_slot(entry["time"])] += 0.5 ** (age_days / HALF_LIFE_DAYS) / day_weight
+
+        live = [entry for entry in group if entry["served"] == "websearch"]
+        model[key] = {
+            "query": group[-1]["query"],
+            "rates": rates,
+            "requests": len(group),
+            "tokens": statistics.median(e["tokens"] for e in live) if live else None,
+            "latency": statistics.median(e["latency"] for e in live) if live else None
+        }
+    return model
+
+
+def expected_demand(rates, start, end):
+    """[start, end) 时间段内的预计请求数（按时段重叠的比例累加，跨午夜时回绕）"""
+    total = 0.0
+    slot_seconds = SLOT_MINUTES * 60
+    moment = start
+    while moment < end:
+        local = datetime.fromtimestamp(moment)
+        offset = (local.hour * 3600 + local.minute * 60 + local.second) % slot_seconds
+        step = min(slot_seconds - offset, end - moment)
+        total += rates[_slot(moment)] * step / slot_seconds
+        moment += step
+    return total
+
+
+def peak_slots(rates, top=3):
+    """需求最高的几个时段，返回 [("07:30", 每天请求数), ...]"""
+    ranked = sorted(range(len(rates)), key=lambda i: -rates[i])[:top]
+    return [(f"{i * SLOT_MINUTES // 60:02d}:{i * SLOT_MINUTES % 60:02d}", rates[i]) for i in ranked if rates[i] > 0]
+
+
+def load_state():
+    from state_dir import state_path
+
+    path = state_path(PREFETCH_STATE_FILE)
+    if not os.path.exists(path):
+        return {"spent": {}, "runs": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state):
+    from state_dir import state_path
+
+    path = state_path(PREFETCH_STATE_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def default_token_estimate():
+    """最近 web_search 请求的平均 token 数（usage_log.jsonl），没有记录时使用默认值"""
+    from usage_tracker import load_usage
+
+    totals = [
+        entry.get("input_tokens", 0) + entry.get("output_tokens", 0) for entry in load_usage()[-500:]
+        if "web_search_20250305" in (entry.get("tools") or []) and not entry.get("error")
+    ]
+    return statistics.median(totals) if totals else DEFAULT_TOKEN_ESTIMATE
+
+
+def plan_prefetch(model, budget_left, now=None, horizon=HORIZON, min_demand=MIN_DEMAND, cache=None):
+    """
+    选出需要预取的查询
+    返回 (计划列表, 跳过列表)；计划项为 {"key", "query", "demand", "tokens", "saving"}
+    """
+    from query_cache import get_query_cache
+
+    now = now or time.time()
+    cache = cache or get_query_cache()
+    fallback_tokens = None
+
+    candidates = []
+    skipped = []
+    for key, info in model.items():
+        demand = expected_demand(info["rates"], now, now + horizon)
+        if demand < min_demand:
+            continue
+        # 缓存中的结果在整个预取窗口内仍然新鲜，不需要预取
+        if cache.lookup(info["query"], max_age=cache.max_age - horizon, record=False):
+            skipped.append({"key": key, "query": info["query"], "demand": demand, "reason": "缓存仍然新鲜"})
+            continue
+
+        tokens = info["tokens"]
+        if tokens is None:
+            if fallback_tokens is None:
+                fallback_tokens = default_token_estimate()
+            tokens = fallback_tokens
+        saving = demand * (info["latency"] or DEFAULT_COLD_LATENCY)
+        candidates.append({"key": key, "query": info["query"], "demand": demand, "tokens": tokens, "saving": saving})
+
+    # 按每个 token 节省的等待时间分配预算
+    candidates.sort(key=lambda item: -item["saving"] / max(item["tokens"], 1))
+    planned = []
+    for item in candidates:
+        if item["tokens"] <= budget_left:
+            planned.append(item)
+            budget_left -= item["tokens"]
+        else:
+            skipped.append(dict(item, reason="超出 token 预算"))
+    return planned, skipped
+
+
+def run_prefetch(budget=DEFAULT_BUDGET, horizon=HORIZON, min_demand=MIN_DEMAND, dry_run=False):
+    """预取一次，返回实际预取的查询列表"""
+    from query_cache import get_query_cache
+    from scheduler import request_priority
+    from usage_tracker import normalize_usage
+
+    now = time.time()
+    today = datetime.now().strftime("%Y-%m-%d")
+    state = load_state()
+    spent = state["spent"].get(today, 0)
+
+    model = learn_demand(load_query_log(since=now - HISTORY_DAYS * 86400), now)
+    planned, skipped = plan_prefetch(model, budget - spent, now, horizon, min_demand)
+
+    for item in skipped:
+        print(f"  ⏭  {item['query']}  预计 {item['demand']:.1f} 次请求，{item['reason']}")
+    if not planned:
+        print(f"接下来 {horizon / 60:.0f} 分钟没有需要预取的查询（今日已用 {spent}/{budget} tokens）")
+        return []
+
+    done = []
+    for item in planned:
+        print(f"  🔮 {item['query']}  预计 {item['demand']:.1f} 次请求，约 {item['tokens']:.0f} tokens")
+        if dry_run:
+            continue
+
+        from get_news_with_websearch_final import fetch_web_search_result
+        from news_archive import save_digest
+
+        started = time.monotonic()
+        try:
+            with request_priority("background", tenant="prefetch"):
+                result = fetch_web_search_result(item["query"])
+        except Exception as e:
+            print(f"     ❌ 预取失败: {type(e).__name__}: {e}")
+            continue
+
+        usage = normalize_usage(result.get("usage"))
+        tokens = usage["input_tokens"] + usage["output_tokens"]
+        get_query_cache().store(item["query"], result, source="prefetch")
+        save_digest(item["query"], result, source="prefetch")
+        spent += tokens
+        done.append(item["query"])
+        print(f"     ✓ 已写入缓存（{time.monotonic() - started:.1f}s，{tokens} tokens）")
+
+    if not dry_run:
+        state["spent"] = {day: value for day, value in state["spent"].items() if day >= today}
+        state["spent"][today] = spent
+        state["runs"] = (state.get("runs", []) + [{"time": now, "queries": done}])[-200:]
+        save_state(state)
+    print(f"今日预取已用 {spent}/{budget} tokens")
+    return done
+
+
+def print_report(budget, horizon, min_demand):
+    now = time.time()
+    entries = load_query_log(since=now - HISTORY_DAYS * 86400)
+    if not entries:
+        print("暂无查询记录（get_news_with_websearch_final.py 每次查询都会记录到 query_log.jsonl）")
+        return
+
+    model = learn_demand(entries, now)
+    print(f"最近 {HISTORY_DAYS} 天 {len(entries)} 次查询，{len(model)} 个不同的查询")
+    print("-" * 80)
+    for key, info in sorted(model.items(), key=lambda item: -item[1]["requests"])[:15]:
+        peaks = "  ".join(f"{slot} ({rate:.1f}/天)" for slot, rate in peak_slots(info["rates"]))
+        print(f"{info['query']:<24} {info['requests']:>4} 次  高峰: {peaks}")
+
+    # 第一个请求（冷启动）由预取命中的比例
+    served = defaultdict(int)
+    for entry in entries:
+        served[entry["served"]] += 1
+    cold = served["websearch"] + served["cache:prefetch"]
+    if cold:
+        print("-" * 80)
+        print(f"需要新结果的请求 {cold} 次：预取命中 {served['cache:prefetch']} 次 "
+              f"({served['cache:prefetch'] / cold * 100:.0f}%)，实时搜索 {served['websearch']} 次")
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    spent = load_state()["spent"].get(today, 0)
+    print("-" * 80)
+    print(f"接下来 {horizon / 60:.0f} 分钟的预取计划（今日已用 {spent}/{budget} tokens）:")
+    planned, skipped = plan_prefetch(model, budget - spent, now, horizon, min_demand)
+    for item in planned:
+        print(f"  🔮 {item['query']}  预计 {item['demand']:.1f} 次请求，约 {item['tokens']:.0f} tokens")
+    for item in skipped:
+        print(f"  ⏭  {item['query']}  {item['reason']}")
+    if not planned and not skipped:
+        print("  无")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热门查询预取")
+    parser.add_argument("--run", action="store_true", help="预取一次")
+    parser.add_argument("--loop", action="store_true", help="持续运行，每隔 --interval 秒预取一次")
+    parser.add_argument("--interval", type=float, default=300, help="--loop 的间隔（秒）")
+    parser.add_argument("--budget", type=int, default=int(os.environ.get("NEWS_PREFETCH_BUDGET", DEFAULT_BUDGET)),
+                        help="每天的预取 token 预算")
+    parser.add_argument("--horizon", type=float, default=HORIZON, help="覆盖接下来多少秒的需求")
+    parser.add_argument("--min-demand", type=float, default=MIN_DEMAND, help="预计请求数达到该值才预取")
+    parser.add_argument("--dry-run", action="store_true", help="只显示计划，不发送请求")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟服务")
+    args = parser.parse_args()
+
+    if args.mock:
+        from mock_server import start_mock_server
+
+        _, base_url = start_mock_server()
+        os.environ["API_BASE_URL"] = base_url
+        os.environ.setdefault("API_KEY", "mock-key")
+
+    if not (args.run or args.loop):
+        print_report(args.budget, args.horizon, args.min_demand)
+        return
+
+    while True:
+        print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 预取")
+        run_prefetch(args.budget, args.horizon, args.min_demand, dry_run=args.dry_run)
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
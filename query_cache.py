@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+查询结果缓存
+同一个请求常有多种说法："最新国际新闻"、"最新重要国际新闻"、"今天的国际要闻"……
+缓存分两层：
+1. 精确匹配：查询规范化（全角 / 半角、同义词、去掉"请""重要"等修饰）后的键相同
+2. 近似匹配：去掉修饰词和"最新""新闻""国际"等泛化词后剩下的内容词（中日韩文字片段、英文单词、数字）完全相同，
+   即两个查询只在修饰和说法上不同；有多条候选时取字符二元组相似度最高的一条
+   （"Fed rate decision" 和 "ECB rate decision"、"主题1" 和 "主题2" 内容词不同，不会互相命中）
+请求的条数（"5条""十条"统一为 "5条""10条"）和日期保留在键和内容词中，
+"最新10条国际新闻" 不会命中缓存的 5 条结果。
+
+只使用新鲜期内的结果。命中 / 未命中次数记录在 query_cache.json 中，
+查找时不立即写盘，在保存结果、间隔 STATS_SAVE_INTERVAL 秒或进程退出时一起写入。
+
+用法：
+    python query_cache.py                       # 显示命中率和缓存的查询
+    python query_cache.py --lookup "今天的国际要闻"
+    python query_cache.py --clear
+"""
+
+import argparse
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from news_cluster import normalize_text
+
+QUERY_CACHE_FILE = "query_cache.json"
+
+# 新鲜期（秒），超过后不再使用
+DEFAULT_MAX_AGE = 1800
+# 最多保留的缓存条数
+MAX_ENTRIES = 500
+# 只有命中统计变化时，至少间隔这么久（秒）才写盘
+STATS_SAVE_INTERVAL = 60
+
+# 同义词统一为同一种说法
+SYNONYMS = [
+    (("今天", "今日", "当前", "最近", "近期", "当天"), "最新"),
+    (("要闻", "新闻事件", "头条", "资讯"), "新闻"),
+    (("全球", "世界", "海外"), "国际")
+]
+
+# 不影响结果的修饰词
+FILLER_PATTERN = re.compile(r"请|帮我|给我|搜索并?|提供|查询|获取|一下|几条|重要|主要|的|。|，|,|\s")
+
+# 请求的条数，例如 "5 条"、"十条"、"二十五条"
+COUNT_PATTERN = re.compile(r"(\d+|[一二两三四五六七八九十]+)\s*条")
+CHINESE_DIGITS = {"一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+# 不区分查询内容的泛化词：内容词相同、只有这些词不同的查询可以近似匹配
+GENERIC_TERMS = re.compile(r"最新|新闻|国际|消息|报道|动态")
+GENERIC_WORDS = {"news", "latest", "today", "todays", "top", "breaking", "headlines", "world", "international",
+                 "global", "recent", "the", "a", "an", "of", "on", "in", "about", "for", "and", "s"}
+
+CONTENT_TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[^\x00-\x7f]+")
+
+
+def _count_value(text):
+    """"5"、"十"、"二十五" -> 5、10、25"""
+    if text.isdigit():
+        return int(text)
+    tens, _, ones = text.rpartition("十")
+    if "十" not in text:
+        return CHINESE_DIGITS.get(text, 0)
+    return (CHINESE_DIGITS.get(tens, 0) if tens else 1) * 10 + CHINESE_DIGITS.get(ones, 0)
+
+
+def _normalize_count(text):
+    return COUNT_PATTERN.sub(lambda match: f"{_count_value(match.group(1))}条", text)
+
+
+def normalize_query(query):
+    """
+    规范化查询，例如 "今天的国际要闻" 和 "最新重要国际新闻" 都规范化为 "最新国际新闻"，
+    "最新五条重要国际新闻" 规范化为 "最新5条国际新闻"（条数不同的查询结果不同）
+    """
+    text = normalize_text(query)
+    for words, replacement in SYNONYMS:
+        for word in words:
+            text = text.replace(word, replacement)
+    text = _normalize_count(FILLER_PATTERN.sub("", text))
+    return re.sub(r"(最新)+", "最新", text)
+
+
+def content_terms(query):
+    """
+    查询的内容词：去掉修饰词和泛化词后剩下的中日韩文字片段、英文单词和数字，以及请求的条数
+    例如 "最新亚洲新闻" -> {"亚洲"}，"最新5条亚洲新闻" -> {"亚洲", "5条"}，
+    "Fed rate decision news" -> {"fed", "rate", "decision"}
+    """
+    text = normalize_text(query)
+    for words, replacement in SYNONYMS:
+        for word in words:
+            text = text.replace(word, replacement)
+    text = _normalize_count(FILLER_PATTERN.sub(" ", text))
+    counts = set(re.findall(r"\d+条", text))
+    text = GENERIC_TERMS.sub(" ", re.sub(r"\d+条", " ", text))
+    terms = {token for token in CONTENT_TOKEN_PATTERN.findall(text) if token not in GENERIC_WORDS}
+    return frozenset(terms | counts)
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def query_similarity(a, b):
+    """两个规范化查询的字符二元组 Jaccard 相似度"""
+    grams_a, grams_b = _bigrams(a), _bigrams(b)
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+class QueryCache:
+    """两层查询结果缓存"""
+
+    def __init__(self, path=None, max_age=DEFAULT_MAX_AGE):
+        from state_dir import state_path
+
+        path = path or state_path(QUERY_CACHE_FILE)
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._stats_dirty = False
+        self._saved_at = time.monotonic()
+        self.data = {"entries": [], "stats": {"exact_hits": 0, "near_hits": 0, "misses": 0}}
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.data.update(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"⚠️  查询缓存读取失败，将重新建立: {e}")
+
+    def lookup(self, query, max_age=None, namespace="websearch", record=True):
+        """
+        查找新鲜期内的缓存结果
+        命中时返回 {"result", "query", "tier", "similarity", "age", "source"}，未命中返回 None
+        record=False 时不计入命中统计（预取检查缓存时使用）
+        """
+        max_age = self.max_age if max_age is None else max_age
+        key = normalize_query(query)
+        terms = content_terms(query)
+        now = time.time()
+        best = None
+
+        with self._lock:
+            for entry in reversed(self.data["entries"]):
+                if entry["namespace"] != namespace or now - entry["time"] > max_age:
+                    continue
+                if entry["key"] == key:
+                    best = (1.0, "exact", entry)
+                    break
+                if content_terms(entry["query"]) != terms:
+                    continue
+                similarity = query_similarity(key, entry["key"])
+                if best is None or similarity > best[0]:
+                    best = (similarity, "near", entry)
+
+            if record:
+                stats = self.data["stats"]
+                if best is None:
+                    stats["misses"] += 1
+                else:
+                    stats["exact_hits" if best[1] == "exact" else "near_hits"] += 1
+                # 缓存文件包含完整的 API 响应，不为每次查找重写
+                self._stats_dirty = True
+                if time.monotonic() - self._saved_at >= STATS_SAVE_INTERVAL:
+                    self.save()
+
+        if best is None:
+            return None
+        similarity, tier, entry = best
+        return {
+            "result": entry["result"],
+            "query": entry["query"],
+            "tier": tier,
+            "similarity": similarity,
+            "age": now - entry["time"],
+            "source": entry.get("source")
+        }
+
+    def store(self, query, result, namespace="websearch", source=None):
+        """保存查询结果，同一个规范化查询只保留最新的一条；source 标记结果来源（例如 "prefetch"）"""
+        key = normalize_query(query)
+        now = time.time()
+
+        with self._lock:
+            entries = [
+                entry for entry in self.data["entries"]
+                if not (entry["namespace"] == namespace and entry["key"] == key)
+                and now - entry["time"] <= self.max_age
+            ]
+            entries.append({"namespace": namespace, "query": query, "key": key, "time": now, "result": result,
+                            "source": source})
+            self.data["entries"] = entries[-MAX_ENTRIES:]
+            self.save()
+
+    def hit_ratio(self):
+        stats = self.data["stats"]
+        total = stats["exact_hits"] + stats["near_hits"] + stats["misses"]
+        return (stats["exact_hits"] + stats["near_hits"]) / total if total else 0.0
+
+    def clear(self):
+        with self._lock:
+            self.data["entries"] = []
+            self.data["stats"] = {"exact_hits": 0, "near_hits": 0, "misses": 0}
+            self.save()
+
+    def save(self):
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._stats_dirty = False
+            self._saved_at = time.monotonic()
+
+    def flush(self):
+        """写入尚未保存的命中统计"""
+        with self._lock:
+            if self._stats_dirty:
+                self.save()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    """进程内共享的查询缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QueryCache()
+                atexit.register(_cache.flush)
+    return _cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询结果缓存")
+    parser.add_argument("--lookup", metavar="QUERY", help="查找某个查询能否命中缓存")
+    parser.add_argument("--clear", action="store_true", help="清空缓存和统计")
+    args = parser.parse_args()
+
+    cache = get_query_cache()
+    if args.clear:
+        cache.clear()
+        print("✓ 查询缓存已清空")
+        return
+
+    if args.lookup:
+        print(f"规范化: {normalize_query(args.lookup)}")
+        print(f"内容词: {' '.join(sorted(content_terms(args.lookup))) or '（无）'}")
+        hit = cache.lookup(args.lookup)
+        if hit:
+            print(f"✓ 命中（{hit['tier']}，相似度 {hit['similarity']:.2f}）: {hit['query']}  "
+                  f"{hit['age'] / 60:.0f} 分钟前")
+        else:
+            print("未命中")
+        return
+
+    stats = cache.data["stats"]
+    print(f"精确命中: {stats['exact_hits']}  近似命中: {stats['near_hits']}  未命中: {stats['misses']}  "
+          f"命中率: {cache.hit_ratio() * 100:.1f}%")
+    print(f"新鲜期: {cache.max_age / 60:.0f} 分钟")
+    print("-" * 80)
+    now = time.time()
+    for entry in cache.data["entries"]:
+        state = "新鲜" if now - entry["time"] <= cache.max_age else "过期"
+        print(f"{datetime.fromtimestamp(entry['time']).strftime('%Y-%m-%d %H:%M')}  [{state}]  "
+              f"{entry['query']}  ->  {entry['key']}")
+
+
+if __name__ == "__main__":
+    main()
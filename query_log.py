@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+查询日志
+记录每次新闻查询的时间、规范化后的查询、等待时间、结果来源和消耗的 token，
+供预取 (prefetch.py) 学习各查询在一天中的需求分布。
+
+served 取值：
+    websearch        实时搜索（冷启动，需要等待 60-90 秒）
+    cache            命中查询缓存
+    cache:prefetch   命中预取写入的缓存
+    local            根据最近的归档和抓取的文章回答，未使用 web_search (local_retrieval.py)
+    cache:stale      截止时间内实时搜索未完成，使用过期的缓存 (get_news_with_websearch.py)
+    knowledge        截止时间内实时搜索未完成，使用知识库回答
+    error            获取失败
+
+用法：
+    python query_log.py              # 按查询汇总次数、等待时间和缓存命中
+    python query_log.py --days 7
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+QUERY_LOG = "query_log.jsonl"
+
+_lock = threading.Lock()
+
+
+def log_query(query, latency, served, tokens=0, path=None):
+    """追加一条查询记录"""
+    from query_cache import normalize_query
+    from state_dir import state_path
+
+    path = path or state_path(QUERY_LOG)
+
+    entry = {
+        "time": time.time(),
+        "query": query,
+        "key": normalize_query(query),
+        "latency": round(latency, 3),
+        "served": served,
+        "tokens": tokens
+    }
+    with _lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return entry
+
+
+def load_query_log(path=None, since=None):
+    from state_dir import state_path
+
+    path = path or state_path(QUERY_LOG)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if since is None or entry.get("time", 0) >= since:
+                entries.append(entry)
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询日志")
+    parser.add_argument("--days", type=float, default=28, help="统计最近 N 天")
+    args = parser.parse_args()
+
+    entries = load_query_log(since=time.time() - args.days * 86400)
+    if not entries:
+        print("暂无查询记录")
+        return
+
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[entry["key"]].append(entry)
+
+    print(f"最近 {args.days:g} 天: {len(entries)} 次查询，{len(groups)} 个不同的查询")
+    print("-" * 80)
+    print(f"{'查询':<24} {'次数':>5} {'实时':>5} {'缓存':>5} {'预取':>5} {'本地':>5} {'实时平均等待':>12}")
+    for key, group in sorted(groups.items(), key=lambda item: -len(item[1])):
+        counts = defaultdict(int)
+        for entry in group:
+            counts[entry["served"]] += 1
+        live = [entry["latency"] for entry in group if entry["served"] == "websearch"]
+        wait = f"{sum(live) / len(live):.1f}s" if live else "-"
+        print(f"{key:<24} {len(group):>5} {counts['websearch']:>5} {counts['cache']:>5} "
+              f"{counts['cache:prefetch']:>5} {counts['local']:>5} {wait:>12}")
+
+
+if __name__ == "__main__":
+    main()
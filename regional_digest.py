@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+分地区并行获取新闻并合并
+把一次"最新国际新闻"请求拆成多个地区 / 主题子查询（亚洲、欧洲、美洲、中东、非洲、经济、科技），
+按比例分配 web_search 的 max_uses 预算后并行发送，总耗时接近单个查询。
+全部返回后按 URL 去重搜索结果、按标题近似重复聚类新闻条目，被多个子查询同时报道的新闻排在前面。
+
+用法：
+    python regional_digest.py                    # 全部地区
+    python regional_digest.py --regions asia,europe,tech
+    python regional_digest.py --max-uses 21 --per-region 5
+    python regional_digest.py --mock             # 使用本地模拟服务
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+
+# (名称, 显示名, 子查询中的描述)
+REGIONS = [
+    ("asia", "亚洲", "亚洲重要新闻"),
+    ("europe", "欧洲", "欧洲重要新闻"),
+    ("americas", "美洲", "美洲重要新闻"),
+    ("middle_east", "中东", "中东重要新闻"),
+    ("africa", "非洲", "非洲重要新闻"),
+    ("economy", "经济", "国际经济重要新闻"),
+    ("tech", "科技", "国际科技重要新闻")
+]
+
+# 去重时忽略的跟踪参数
+TRACKING_PARAMS = ("utm_", "spm", "from", "share", "fbclid", "gclid")
+
+URL_PATTERN = re.compile(r"https?://[^\s)）>\]]+")
+
+
+def split_budget(total, count):
+    """把 max_uses 总预算分给各个子查询，每个至少 1 次，余数分给排在前面的子查询"""
+    if total < count:
+        raise ValueError(f"web_search 总预算 {total} 次不够分给 {count} 个子查询（每个至少 1 次）")
+    base, extra = divmod(total, count)
+    return [base + (1 if i < extra else 0) for i in range(count)]
+
+
+def normalize_url(url):
+    """统一 URL 用于去重：去掉协议、www、跟踪参数、锚点和末尾的 /"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = [(k, v) for k, v in parse_qsl(parts.query) if not k.lower().startswith(TRACKING_PARAMS)]
+    return urlunsplit(("", host, parts.path.rstrip("/"), urlencode(query), ""))
+
+
+def fetch_region(region, query, max_uses, headers, timeout=None):
+    """发送一个子查询，返回该地区的结果（失败时包含 error）；未指定 timeout 时按历史延迟确定"""
+    from adaptive_timeout import request_timeout
+    from config import API_BASE_URL
+    from get_news_with_websearch_final import build_web_search_payload
+    from continuation import complete_truncated
+    from http_client import get_session
+    from news_archive import extract_digest
+
+    key, label, _ = region
+    started = time.monotonic()
+    outcome = {"region": key, "label": label, "query": query, "max_uses": max_uses}
+
+    url = f"{API_BASE_URL}/v1/messages"
+    payload = build_web_search_payload(query, max_uses=max_uses)
+    timeout = timeout or request_timeout("/v1/messages", payload, default=90)
+
+    try:
+        response = get_session().post(url, headers=headers, json=payload, timeout=timeout)
+        if response.status_code != 200:
+            outcome["latency"] = time.monotonic() - started
+            outcome["error"] = f"{response.status_code}: {response.text[:200]}"
+            return outcome
+        result = complete_truncated(url, headers, payload, response.json(), timeout=timeout)
+        outcome["latency"] = time.monotonic() - started
+        outcome.update(extract_digest(result))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        outcome["latency"] = time.monotonic() - started
+        outcome["error"] = f"{type(e).__name__}: {e}"
+
+    return outcome
+
+
+def merge_results(outcomes):
+    """
+    合并各地区的结果
+    搜索结果按规范化 URL 去重，新闻条目按标题近似重复聚类（news_cluster）；
+    被越多地区报道、在各地区中排名越靠前的新闻得分越高
+    """
+    from news_archive import split_news_items
+    from news_cluster import cluster_items
+
+    sources = {}
+    items = []
+
+    for outcome in outcomes:
+        if "error" in outcome:
+            continue
+
+        for result in outcome.get("search_results", []):
+            key = normalize_url(result["url"])
+            if key in sources:
+                if outcome["region"] not in sources[key]["regions"]:
+                    sources[key]["regions"].append(outcome["region"])
+            else:
+                sources[key] = dict(result, regions=[outcome["region"]])
+
+        for rank, item in enumerate(split_news_items(outcome.get("text", ""))):
+            items.append(dict(item, region=outcome["region"], rank=rank))
+
+    stories = []
+    for cluster in cluster_items(items):
+        story = {"title": cluster[0]["title"], "summary": "", "regions": [], "urls": [], "score": 0.0}
+        seen_urls = set()
+
+        for item in cluster:
+            if len(item["summary"]) > len(story["summary"]):
+                story["summary"] = item["summary"]
+            if item["region"] not in story["regions"]:
+                story["regions"].append(item["region"])
+                story["score"] += 1.0 + 1.0 / (item["rank"] + 1)
+            for url in URL_PATTERN.findall(item["summary"]):
+                if normalize_url(url) not in seen_urls:
+                    seen_urls.add(normalize_url(url))
+                    story["urls"].append(url)
+
+        stories.append(story)
+
+    stories.sort(key=lambda story: -story["score"])
+    ranked_sources = sorted(sources.values(), key=lambda source: -len(source["regions"]))
+    return stories, ranked_sources
+
+
+def render_digest(stories, sources, labels):
+    """生成合并后的新闻文本"""
+    lines = []
+    for i, story in enumerate(stories, 1):
+        regions = "、".join(labels.get(region, region) for region in story["regions"])
+        lines.append(f"{i}. **{story['title']}**  [{regions}]")
+        if story["summary"]:
+            lines.extend(f"   {line}" for line in story["summary"].splitlines())
+        lines.append("")
+
+    if sources:
+        lines.append("搜索结果来源:")
+        for i, source in enumerate(sources, 1):
+            lines.append(f"{i}. {source['title']}")
+            lines.append(f"   {source['url']}")
+
+    return "\n".join(lines).strip()
+
+
+def get_regional_digest(regions=None, per_region=3, max_uses=14, timeout=None):
+    """并行获取各地区新闻，合并去重后保存并归档，返回合并后的新闻列表"""
+    from config import API_KEY
+    from news_archive import archive_entry
+
+    regions = regions or REGIONS
+    if max_uses < 1:
+        raise ValueError("web_search 总预算至少为 1 次")
+    if max_uses < len(regions):
+        # 每个子查询至少要 1 次 web_search，预算不够时只查询排在前面的地区，总次数不超过预算
+        skipped = [label for _, label, _ in regions[max_uses:]]
+        regions = regions[:max_uses]
+        print(f"⚠️  web_search 总预算 {max_uses} 次少于地区数，跳过: {'、'.join(skipped)}")
+    budgets = split_budget(max_uses, len(regions))
+    labels = {key: label for key, label, _ in regions}
+    headers = {
+        "x-api-key": API_KEY,
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json",
+        "Accept-Encoding": "gzip, deflate, br"
+    }
+
+    print(f"并行子查询: {len(regions)} 个，web_search 总预算 {max_uses} 次")
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        futures = [
+            executor.submit(fetch_region, region, f"最新{per_region}条{region[2]}", budget, headers, timeout)
+            for region, budget in zip(regions, budgets)
+        ]
+        outcomes = [future.result() for future in futures]
+
+    wall_time = time.monotonic() - started
+
+    for outcome in outcomes:
+        if "error" in outcome:
+            print(f"  ❌ {outcome['label']:<4} {outcome['latency']:6.1f}s  {outcome['error']}")
+        else:
+            print(f"  ✓ {outcome['label']:<4} {outcome['latency']:6.1f}s  "
+                  f"来源 {len(outcome['search_results'])} 条  (max_uses={outcome['max_uses']})")
+
+    succeeded = [outcome for outcome in outcomes if "error" not in outcome]
+    if not succeeded:
+        print("❌ 所有子查询均失败")
+        return None
+
+    stories, sources = merge_results(succeeded)
+    raw_sources = sum(len(outcome["search_results"]) for outcome in succeeded)
+    serial_time = sum(outcome["latency"] for outcome in outcomes)
+
+    print(f"\n总耗时 {wall_time:.1f}s（串行约 {serial_time:.1f}s）")
+    print(f"来源 {raw_sources} 条 -> 去重后 {len(sources)} 条，新闻 {len(stories)} 条")
+
+    text = render_digest(stories, sources, labels)
+    print(f"\n📰 合并后的新闻:\n")
+    print(text)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"news_regional_{timestamp}.txt"
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(f"国际新闻 (分地区汇总) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write("=" * 80 + "\n\n")
+        f.write(text)
+    print(f"\n✓ 已保存到 {filename}")
+
+    json_file = f"news_regional_{timestamp}.json"
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump({"stories": stories, "sources": sources, "regions": outcomes}, f, indent=2, ensure_ascii=False)
+    print(f"✓ 完整结果已保存到 {json_file}")
+
+    entry = archive_entry(
+        "分地区国际新闻", text, sources, source="regional",
+        regions=[{k: outcome.get(k) for k in ("region", "query", "latency", "error", "model", "usage")}
+                 for outcome in outcomes],
+        wall_time=round(wall_time, 3)
+    )
+    print(f"✓ 已归档 ({entry['id']})")
+
+    return stories
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分地区并行获取新闻并合并")
+    parser.add_argument("--regions", help=f"逗号分隔的地区（可选 {','.join(key for key, _, _ in REGIONS)}）")
+    parser.add_argument("--per-region", type=int, default=3, help="每个地区的新闻条数")
+    parser.add_argument("--max-uses", type=int, default=14, help="web_search 总预算，按地区平均分配")
+    parser.add_argument("--timeout", type=float, help="单个子查询的超时时间（秒，默认按历史延迟确定）")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟服务")
+    args = parser.parse_args()
+
+    if args.max_uses < 1:
+        parser.error("--max-uses 至少为 1")
+
+    regions = REGIONS
+    if args.regions:
+        wanted = [name.strip() for name in args.regions.split(",") if name.strip()]
+        unknown = [name for name in wanted if name not in {key for key, _, _ in REGIONS}]
+        if unknown:
+            parser.error(f"未知的地区: {', '.join(unknown)}")
+        regions = [region for region in REGIONS if region[0] in wanted]
+
+    if args.mock:
+        from mock_server import start_mock_server
+
+        _, base_url = start_mock_server()
+        os.environ["API_BASE_URL"] = base_url
+        os.environ.setdefault("API_KEY", "mock-key")
+
+    print("=" * 80)
+    print("分地区国际新闻")
+    print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 80 + "\n")
+
+    get_regional_digest(regions, per_region=args.per_region, max_uses=args.max_uses, timeout=args.timeout)
+
+
+if __name__ == "__main__":
+    main()
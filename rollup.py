@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+分层汇总（小时 → 天 → 周）
+要从归档生成周报，原来只能把一周的全部归档重新交给模型。这里把汇总物化为三层，保存在 archive/rollups/：
+
+    hour   同一小时内归档的新闻总结 → 该小时的要闻
+    day    当天各小时的要闻 → 当天的要闻
+    week   本周（ISO 周）每天的要闻 → 本周要闻和趋势
+
+每个节点记录它的子节点指纹（小时节点为归档记录 ID，天和周节点为下一层节点的指纹）。
+有新的归档时只重建子节点集合发生变化的小时，再沿着天 → 周向上重建受影响的节点；
+每次请求的输入不超过一层的子节点数（24 个小时或 7 天），周报的 token 成本与历史长度无关。
+汇总使用 model_router 的 summarize 任务，以 background 优先级发送。
+
+用法：
+    python rollup.py                    # 增量更新并显示本周要闻
+    python rollup.py --dry-run          # 只显示需要重建的节点
+    python rollup.py --show day         # 显示最近一天的要闻
+    python rollup.py --show week --key 2026-W42
+    python rollup.py --mock
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+from news_archive import archive_path
+
+# 归档目录下的汇总子目录
+ROLLUP_DIR = "rollups"
+
+LEVELS = ("hour", "day", "week")
+LEVEL_NAMES = {"hour": "小时", "day": "天", "week": "周"}
+
+# 每一层的汇总输出上限
+MAX_TOKENS = {"hour": 800, "day": 1000, "week": 1500}
+# 单次汇总请求的输入上限（字符），超出时按比例截断每个子节点
+MAX_INPUT_CHARS = 16000
+
+ROLLUP_SYSTEM_PROMPT = "你是一个国际新闻编辑，负责把多份新闻摘要合并为更高层的汇总。合并重复的事件，不要编造输入中没有的内容。用中文回答。"
+
+LEVEL_PROMPTS = {
+    "hour": "以下是 {label} 这一小时内获取的多份新闻摘要。请合并去重，整理为这一小时的要闻（最多 8 条），每条包括标题、一句话内容和来源。",
+    "day": "以下是 {label} 各小时的要闻。请合并去重，整理为当天最重要的 10 条新闻，每条包括标题、一句话内容和来源。",
+    "week": "以下是 {label} 每天的要闻。请整理为本周最重要的 10 条新闻，每条包括标题和一句话内容，最后用一段话概述本周趋势。"
+}
+
+
+def period_key(level, when):
+    """时间所在的节点键：小时 2026-10-19T13，天 2026-10-19，周 2026-W42"""
+    if level == "hour":
+        return when.strftime("%Y-%m-%dT%H")
+    if level == "day":
+        return when.strftime("%Y-%m-%d")
+    year, week, _ = when.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def parent_key(level, key):
+    """小时节点所属的天、天节点所属的周"""
+    if level == "hour":
+        return "day", key[:10]
+    if level == "day":
+        return "week", period_key("week", datetime.strptime(key, "%Y-%m-%d"))
+    return None, None
+
+
+def fingerprint(children):
+    """子节点指纹集合的哈希"""
+    canonical = json.dumps(sorted(children.items()), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+class RollupStore:
+    """物化的汇总节点，每个节点一个 JSON 文件"""
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(archive_path(), ROLLUP_DIR)
+        self._lock = threading.Lock()
+
+    def _path(self, level, key):
+        return os.path.join(self.root, level, f"{key}.json")
+
+    def load(self, level, key):
+        try:
+            with open(self._path(level, key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, node):
+        path = self._path(node["level"], node["key"])
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(node, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, path)
+
+    def keys(self, level):
+        directory = os.path.join(self.root, level)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(directory) if name.endswith(".json"))
+
+
+def _clip(sections, limit=MAX_INPUT_CHARS):
+    """输入超过上限时按比例截断每一段"""
+    total = sum(len(text) for _, text in sections)
+    if total <= limit:
+        return sections
+    share = max(200, limit // len(sections))
+    return [(label, text[:share]) for label, text in sections]
+
+
+def summarize_sections(level, key, sections, model=None, timeout=None):
+    """把子节点的文本交给 summarize 模型，返回 (汇总文本, 响应)"""
+    from adaptive_timeout import request_timeout
+    from config import API_KEY, API_BASE_URL
+    from http_client import get_session
+    from model_router import choose_model
+    from news_archive import extract_digest
+
+    url = f"{API_BASE_URL}/v1/messages"
+    headers = {
+        "x-api-key": API_KEY,
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json"
+    }
+    body = "\n\n---\n\n".join(f"[{label}]\n{text}" for label, text in _clip(sections))
+    data = {
+        "model": model or choose_model("summarize", max_latency=60),
+        "max_tokens": MAX_TOKENS[level],
+        "system": ROLLUP_SYSTEM_PROMPT,
+        "messages": [
+            {
+                "role": "user",
+                "content": LEVEL_PROMPTS[level].format(label=key) + "\n\n" + body
+            }
+        ]
+    }
+    timeout = timeout or request_timeout("/v1/messages", data, default=60)
+
+    response = get_session().post(url, headers=headers, json=data, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"请求失败: {response.status_code} {response.text[:300]}")
+    result = response.json()
+    text = extract_digest(result)["text"].strip()
+    if not text:
+        raise RuntimeError("汇总结果为空")
+    return text, result
+
+
+class RollupEngine:
+    """按归档索引增量重建小时 / 天 / 周汇总"""
+
+    def __init__(self, store=None, archive_dir=None, workers=4):
+        self.archive_dir = archive_path(archive_dir)
+        self.store = store or RollupStore(os.path.join(self.archive_dir, ROLLUP_DIR))
+        self.workers = workers
+
+    def plan(self, since=None):
+        """
+        计算每个节点应有的子节点，返回 (各层的 {键: 子节点指纹}, 各层需要重建的键, 小时 -> 归档索引)
+        since 为 datetime，只考虑之后的归档（从所在周的周一开始，避免重建不完整的天和周）
+        """
+        from news_archive import read_index
+
+        if since is not None:
+            since = datetime.combine(since.date() - timedelta(days=since.weekday()), datetime.min.time())
+
+        leaves = defaultdict(list)
+        for entry in read_index(self.archive_dir):
+            archived_at = datetime.fromisoformat(entry["archived_at"])
+            if since is None or archived_at >= since:
+                leaves[period_key("hour", archived_at)].append(entry)
+
+        wanted = {level: defaultdict(dict) for level in LEVELS}
+        for hour, entries in leaves.items():
+            wanted["hour"][hour] = {entry["id"]: entry["id"] for entry in entries}
+        for level in ("hour", "day"):
+            for key, children in wanted[level].items():
+                upper, upper_key = parent_key(level, key)
+                wanted[upper][upper_key][key] = fingerprint(children)
+
+        dirty = {}
+        for level in LEVELS:
+            dirty[level] = sorted(
+                key for key, children in wanted[level].items()
+                if (self.store.load(level, key) or {}).get("children") != children
+            )
+        return wanted, dirty, leaves
+
+    def _rebuild(self, level, key, wanted_children, leaves):
+        children = wanted_children
+        if level == "hour":
+            from news_archive import load_digest
+
+            sections = []
+            for entry in leaves[key]:
+                try:
+                    digest = load_digest(entry, self.archive_dir)
+                except (OSError, ValueError):
+                    continue
+                sections.append((f"{digest['archived_at'][11:16]} {digest['query']}", digest.get("text", "")))
+        else:
+            # 记录实际使用的子节点指纹：子节点重建失败时，下次更新仍会重建本节点
+            child_level = LEVELS[LEVELS.index(level) - 1]
+            sections = []
+            children = {}
+            for child_key in sorted(wanted_children):
+                child = self.store.load(child_level, child_key)
+                if child:
+                    sections.append((child_key, child["summary"]))
+                    children[child_key] = child["fingerprint"]
+
+        # 没有文本时保存空汇总，不发送请求
+        sections = [(label, text) for label, text in sections if text.strip()]
+        summary, result = summarize_sections(level, key, sections) if sections else ("", {})
+        node = {
+            "level": level,
+            "key": key,
+            "children": children,
+            "fingerprint": fingerprint(children),
+            "summary": summary,
+            "model": result.get("model"),
+            "usage": result.get("usage"),
+            "updated_at": datetime.now().isoformat()
+        }
+        self.store.save(node)
+        return node
+
+    def update(self, since=None, dry_run=False):
+        """
+        增量更新：先并行重建变化的小时，再重建受影响的天和周
+        返回 {层: {"rebuilt", "failed", "tokens"}}
+        """
+        from scheduler import request_priority
+        from usage_tracker import normalize_usage
+
+        wanted, dirty, leaves = self.plan(since)
+        stats = {level: {"rebuilt": 0, "failed": 0, "tokens": 0, "pending": len(dirty[level])} for level in LEVELS}
+        if dry_run:
+            return stats, dirty
+
+        def run(level, key):
+            # 优先级保存在 contextvar 中，线程池的线程不会继承，需要在线程内设置
+            with request_priority("background", tenant="rollup"):
+                try:
+                    return key, self._rebuild(level, key, wanted[level][key], leaves), None
+                except (RuntimeError, requests.exceptions.RequestException) as e:
+                    return key, None, e
+
+        for level in LEVELS:
+            if not dirty[level]:
+                continue
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                outcomes = list(executor.map(lambda key: run(level, key), dirty[level]))
+            for key, node, error in outcomes:
+                if error is not None:
+                    stats[level]["failed"] += 1
+                    print(f"  ❌ {LEVEL_NAMES[level]} {key}: {error}")
+                else:
+                    usage = normalize_usage(node["usage"])
+                    stats[level]["rebuilt"] += 1
+                    stats[level]["tokens"] += usage["input_tokens"] + usage["output_tokens"]
+        return stats, dirty
+
+    def latest(self, level, key=None):
+        """读取指定或最新的节点"""
+        if key is None:
+            keys = self.store.keys(level)
+            if not keys:
+                return None
+            key = keys[-1]
+        return self.store.load(level, key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分层汇总（小时 → 天 → 周）")
+    parser.add_argument("--show", choices=LEVELS, default="week", help="更新后显示哪一层的汇总")
+    parser.add_argument("--key", help="显示指定的节点（例如 2026-10-19T13、2026-10-19、2026-W42）")
+    parser.add_argument("--days", type=float, help="只汇总最近 N 天的归档（默认全部）")
+    parser.add_argument("--dry-run", action="store_true", help="只显示需要重建的节点")
+    parser.add_argument("--no-update", action="store_true", help="不更新，只显示已有的汇总")
+    parser.add_argument("--workers", type=int, default=4, help="同一层并行汇总的请求数")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟服务")
+    args = parser.parse_args()
+
+    if args.mock:
+        from mock_server import seed_mock_archive, start_mock_server
+
+        _, base_url = start_mock_server()
+        # 模拟服务使用临时的状态目录，先写入几份模拟摘要
+        seed_mock_archive()
+        os.environ["API_BASE_URL"] = base_url
+        os.environ.setdefault("API_KEY", "mock-key")
+
+    engine = RollupEngine(workers=args.workers)
+
+    if not args.no_update:
+        since = None
+        if args.days:
+            since = datetime.now() - timedelta(days=args.days)
+        stats, dirty = engine.update(since=since, dry_run=args.dry_run)
+
+        print("=" * 80)
+        print("分层汇总" + ("（dry run）" if args.dry_run else ""))
+        print("=" * 80)
+        for level in LEVELS:
+            level_stats = stats[level]
+            if args.dry_run:
+                keys = dirty[level]
+                preview = ", ".join(keys[:5]) + (" ..." if len(keys) > 5 else "")
+                print(f"{LEVEL_NAMES[level]:<2} 需要重建 {len(keys):>4} 个  {preview}")
+            else:
+                print(f"{LEVEL_NAMES[level]:<2} 重建 {level_stats['rebuilt']:>4} 个  失败 {level_stats['failed']:>3}  "
+                      f"tokens {level_stats['tokens']:>7}")
+        if args.dry_run:
+            return
+        if not any(stats[level]["pending"] for level in LEVELS):
+            print("✓ 没有新的归档，汇总已是最新")
+
+    node = engine.latest(args.show, args.key)
+    if node is None:
+        print(f"\n没有{LEVEL_NAMES[args.show]}汇总" + (f": {args.key}" if args.key else ""))
+        sys.exit(1)
+
+    print("\n" + "-" * 80)
+    print(f"📰 {LEVEL_NAMES[node['level']]}汇总 {node['key']}（{len(node['children'])} 个子节点，"
+          f"更新于 {node['updated_at'][:19]}）\n")
+    print(node["summary"])
+
+
+if __name__ == "__main__":
+    main()
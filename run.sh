@@ -36,12 +36,14 @@ show_help() {
     echo "  7, --test-api        测试 API 端点"
     echo "  8, --test-env        测试环境"
     echo "  9, --test-sdk        测试 Anthropic SDK（检测 Cloudflare 拦截）"
+    echo "  10, --load-test      API 压测（其余参数传给 load_test.py）"
+    echo "  11, --regional       分地区并行获取实时新闻并合并去重"
     echo "  -h, --help           显示此帮助信息"
     echo ""
     echo "配置选项："
     echo "  --api-key KEY        设置 API Key"
     echo "  --api-url URL        设置 API Base URL（默认：https://spai.aicoding.sh）"
-    echo "  --model MODEL        设置默认模型"
+    echo "  --model MODEL        固定使用指定模型（默认按任务和延迟自动选择）"
     echo ""
     echo "配置优先级："
     echo "  1. 命令行参数（--api-key）"
@@ -53,6 +55,8 @@ show_help() {
     echo "  ./run.sh --websearch --api-key sk-xxx"
     echo "  API_KEY=sk-xxx ./run.sh 1"
     echo "  ./run.sh --api-key sk-xxx --api-url https://api.example.com 1"
+    echo "  ./run.sh --load-test --users 10 --duration 30"
+    echo "  ./run.sh --load-test --mock --rate 20 --duration 10"
     echo ""
     echo "无参数时进入交互式菜单模式"
     echo ""
@@ -66,7 +70,7 @@ run_function() {
             echo ""
             echo "正在使用 Web Search 获取实时新闻（带真实来源链接）..."
             echo "注意：需要较长时间（60-90秒）"
-            python get_news_with_websearch_final.py
+            python get_news_with_websearch_final.py "${EXTRA_ARGS[@]}"
             ;;
         2|--openai-sources)
             echo ""
@@ -105,6 +109,15 @@ run_function() {
             echo "测试 Anthropic SDK（检测 Cloudflare 拦截）..."
             python test_anthropic_sdk.py
             ;;
+        10|--load-test)
+            echo ""
+            python load_test.py "${EXTRA_ARGS[@]}"
+            ;;
+        11|--regional)
+            echo ""
+            echo "分地区并行获取实时新闻（Web Search）..."
+            python regional_digest.py "${EXTRA_ARGS[@]}"
+            ;;
         -h|--help)
             show_help
             exit 0
@@ -119,6 +132,7 @@ run_function() {
 
 # 解析命令行参数
 COMMAND=""
+EXTRA_ARGS=()
 while [[ $# -gt 0 ]]; do
     case $1 in
         --api-key)
@@ -130,7 +144,9 @@ while [[ $# -gt 0 ]]; do
             shift 2
             ;;
         --model)
+            # 手动指定模型时不再自动选择
             export DEFAULT_MODEL="$2"
+            export MODEL_OVERRIDE="$2"
             shift 2
             ;;
         -h|--help)
@@ -138,8 +154,12 @@ while [[ $# -gt 0 ]]; do
             exit 0
             ;;
         *)
-            # 保存功能命令
-            COMMAND="$1"
+            # 保存功能命令，其后的参数原样传给对应脚本
+            if [ -z "$COMMAND" ]; then
+                COMMAND="$1"
+            else
+                EXTRA_ARGS+=("$1")
+            fi
             shift
             ;;
     esac
@@ -167,9 +187,11 @@ echo "6. 查看可用模型"
 echo "7. 测试 API 端点"
 echo "8. 测试环境"
 echo "9. 测试 Anthropic SDK（检测 Cloudflare 拦截）"
+echo "10. API 压测"
+echo "11. 分地区并行获取实时新闻"
 echo "0. 退出"
 echo ""
-read -p "请输入选项 [0-9]: " choice
+read -p "请输入选项 [0-11]: " choice
 
 case $choice in
     0)
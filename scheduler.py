@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+请求优先级调度
+定时刷新、批量汇总和交互式使用（run.sh）共用同一个速率限制和连接池。
+所有发往 API（/v1/...）的请求先在调度器排队，同时进行的请求数不超过 NEWS_MAX_CONCURRENT：
+
+1. 优先级：interactive 请求总是先于排队中的 background 请求获得名额，
+   并为 interactive 预留 NEWS_INTERACTIVE_RESERVE 个名额，后台任务占不满全部连接
+2. 同一优先级内按租户加权公平排队（WFQ），一个租户的大量请求不会饿死其他租户
+3. 记录每个优先级的排队深度和等待时间
+
+请求的优先级和租户由上下文决定（默认 interactive / NEWS_TENANT 或 "default"）：
+
+    from scheduler import request_priority
+
+    with request_priority("background", tenant="batch"):
+        run_batch()
+
+环境变量：
+    NEWS_SCHEDULER=0                    关闭调度
+    NEWS_MAX_CONCURRENT=8               同时进行的 API 请求数（配置了密钥池时默认为每个密钥 8 个）
+    NEWS_INTERACTIVE_RESERVE=2          为 interactive 预留的名额
+    NEWS_TENANT_WEIGHTS=default=2,batch=1   租户权重（默认 1）
+
+流式响应（stream=True）在收到响应头后释放名额。
+挂载了相同请求合并 (single_flight.py) 时，只有实际发往上游的领头请求占用名额，
+等待共享结果的跟随者不排队。
+
+用法：
+    python scheduler.py                          # 使用本地模拟服务对比 FIFO 和优先级调度
+    python scheduler.py --background 24 --interactive 20 --slots 4
+"""
+
+import argparse
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import requests
+
+PRIORITIES = {"interactive": 0, "background": 1}
+
+DEFAULT_MAX_CONCURRENT = 8
+DEFAULT_INTERACTIVE_RESERVE = 2
+
+# 只调度发往 API 的请求（来源文章抓取有自己的按主机限流）
+SCHEDULED_PATH_PREFIX = "/v1/"
+
+# 每个优先级保留最近的等待时间样本数
+WAIT_SAMPLES = 1000
+
+_context = contextvars.ContextVar("news_request_priority", default=None)
+# 当前线程已持有名额（重定向时 Session.send 会递归调用，不能重复排队）
+_holding = contextvars.ContextVar("news_request_slot", default=False)
+# 适配器在实际发往上游时才申请名额（相同请求合并），此时保存待使用的调度器
+_deferred = contextvars.ContextVar("news_request_deferred", default=None)
+
+
+def parse_weights(text):
+    """解析租户权重，例如 default=2,batch=1"""
+    weights = {}
+    for part in (text or "").split(","):
+        name, _, weight = part.partition("=")
+        if name.strip():
+            weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(values, p):
+    """计算分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+@contextmanager
+def request_priority(priority="interactive", tenant=None):
+    """在此上下文中发出的请求使用指定的优先级和租户"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的优先级: {priority}（可选 {', '.join(PRIORITIES)}）")
+    current = _context.get()
+    tenant = tenant or (current[1] if current else None) or os.environ.get("NEWS_TENANT", "default")
+    token = _context.set((priority, tenant))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def current_priority():
+    """当前上下文的 (优先级, 租户)"""
+    return _context.get() or ("interactive", os.environ.get("NEWS_TENANT", "default"))
+
+
+class _Waiter:
+    __slots__ = ("priority", "tenant", "start", "finish", "enqueued", "granted")
+
+    def __init__(self, priority, tenant, start, finish):
+        self.priority = priority
+        self.tenant = tenant
+        self.start = start
+        self.finish = finish
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+class RequestScheduler:
+    """
+    按优先级和租户权重分配并发名额
+    policy="priority" 为优先级 + 加权公平排队，policy="fifo" 按到达顺序（用于对比）
+    """
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT, interactive_reserve=DEFAULT_INTERACTIVE_RESERVE,
+                 weights=None, policy="priority"):
+        self.max_concurrent = max(1, max_concurrent)
+        self.interactive_reserve = max(0, min(interactive_reserve, self.max_concurrent - 1))
+        self.weights = weights or {}
+        self.policy = policy
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._queues = {priority: [] for priority in PRIORITIES}
+        self._virtual_time = defaultdict(float)
+        self._tenant_finish = {}
+        self._active = 0
+
+        self._waits = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITIES}
+        self._granted = defaultdict(int)
+        self._tenant_granted = defaultdict(int)
+        self._peak_depth = defaultdict(int)
+
+    def _enqueue(self, priority, tenant, cost):
+        # 开始时间公平排队：开始标签 = max(虚拟时间, 租户上一个请求的结束标签)
+        key = (priority, tenant)
+        start = max(self._virtual_time[priority], self._tenant_finish.get(key, 0.0))
+        finish = start + cost / self.weights.get(tenant, 1.0)
+        self._tenant_finish[key] = finish
+
+        waiter = _Waiter(priority, tenant, start, finish)
+        queue = self._queues[priority]
+        if self.policy == "fifo":
+            order = (0.0, next(self._seq))
+        else:
+            order = (finish, next(self._seq))
+        heapq.heappush(queue, (order, waiter))
+        depth = len(queue)
+        self._peak_depth[priority] = max(self._peak_depth[priority], depth)
+        return waiter
+
+    def _next_queue(self):
+        if self.policy == "fifo":
+            heads = [queue[0][0][1] for queue in self._queues.values() if queue]
+            if not heads:
+                return None
+            for queue in self._queues.values():
+                if queue and queue[0][0][1] == min(heads):
+                    return queue
+        for priority, rank in sorted(PRIORITIES.items(), key=lambda item: item[1]):
+            queue = self._queues[priority]
+            if not queue:
+                continue
+            # 低优先级请求不能占用预留给 interactive 的名额
+            if rank > 0 and self._active >= self.max_concurrent - self.interactive_reserve:
+                return None
+            return queue
+        return None
+
+    def _dispatch(self):
+        while self._active < self.max_concurrent:
+            queue = self._next_queue()
+            if queue is None:
+                break
+            _, waiter = heapq.heappop(queue)
+            waiter.granted = True
+            self._active += 1
+            self._virtual_time[waiter.priority] = max(self._virtual_time[waiter.priority], waiter.start)
+            self._waits[waiter.priority].append(time.monotonic() - waiter.enqueued)
+            self._granted[waiter.priority] += 1
+            self._tenant_granted[(waiter.priority, waiter.tenant)] += 1
+        self._cond.notify_all()
+
+    def acquire(self, priority="interactive", tenant="default", cost=1.0):
+        """排队等待一个名额，返回后必须调用 release()"""
+        with self._cond:
+            waiter = self._enqueue(priority, tenant, cost)
+            self._dispatch()
+            self._cond.wait_for(lambda: waiter.granted)
+        return waiter
+
+    def release(self, waiter):
+        with self._cond:
+            self._active -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority="interactive", tenant="default", cost=1.0):
+        waiter = self.acquire(priority, tenant, cost)
+        try:
+            yield waiter
+        finally:
+            self.release(waiter)
+
+    def snapshot(self):
+        """排队深度、等待时间和各租户获得的名额"""
+        with self._cond:
+            classes = {}
+            for priority in PRIORITIES:
+                waits = list(self._waits[priority])
+                classes[priority] = {
+                    "queued": len(self._queues[priority]),
+                    "peak_queued": self._peak_depth[priority],
+                    "granted": self._granted[priority],
+                    "wait_p50": percentile(waits, 50),
+                    "wait_p95": percentile(waits, 95),
+                    "wait_max": max(waits) if waits else 0.0
+                }
+            return {
+                "policy": self.policy,
+                "active": self._active,
+                "max_concurrent": self.max_concurrent,
+                "interactive_reserve": self.interactive_reserve,
+                "classes": classes,
+                "tenants": {f"{priority}/{tenant}": count
+                            for (priority, tenant), count in sorted(self._tenant_granted.items())}
+            }
+
+
+class ScheduledSession(requests.Session):
+    """发往 API 的请求先向调度器申请名额"""
+
+    def __init__(self, scheduler=None):
+        super().__init__()
+        self.scheduler = scheduler or get_scheduler()
+
+    def send(self, request, **kwargs):
+        path = request.path_url.split("?", 1)[0]
+        if _holding.get() or not path.startswith(SCHEDULED_PATH_PREFIX):
+            return super().send(request, **kwargs)
+
+        if getattr(self.get_adapter(request.url), "defers_scheduling", False):
+            # 由适配器在实际发往上游时调用 acquire_upstream_slot()
+            token = _deferred.set(self.scheduler)
+            try:
+                return super().send(request, **kwargs)
+            finally:
+                _deferred.reset(token)
+
+        priority, tenant = current_priority()
+        waiter = self.scheduler.acquire(priority, tenant)
+        token = _holding.set(True)
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            _holding.reset(token)
+            self.scheduler.release(waiter)
+
+
+def acquire_upstream_slot():
+    """
+    供 defers_scheduling 的适配器在实际发往上游前调用：按当前上下文的优先级排队申请名额
+    返回释放名额的函数（只生效一次）；请求不经过调度器时返回 None
+    """
+    scheduler = _deferred.get()
+    if scheduler is None or _holding.get():
+        return None
+    priority, tenant = current_priority()
+    waiter = scheduler.acquire(priority, tenant)
+    released = threading.Event()
+
+    def release():
+        if not released.is_set():
+            released.set()
+            scheduler.release(waiter)
+
+    return release
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """进程内共享的调度器（按环境变量配置）"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                from key_pool import get_key_pool
+
+                # 吞吐随密钥数增加，默认名额按密钥数放大
+                pool = get_key_pool()
+                default_slots = DEFAULT_MAX_CONCURRENT * (len(pool) if pool else 1)
+                _scheduler = RequestScheduler(
+                    max_concurrent=int(os.environ.get("NEWS_MAX_CONCURRENT", default_slots)),
+                    interactive_reserve=int(os.environ.get("NEWS_INTERACTIVE_RESERVE", DEFAULT_INTERACTIVE_RESERVE)),
+                    weights=parse_weights(os.environ.get("NEWS_TENANT_WEIGHTS"))
+                )
+    return _scheduler
+
+
+def print_snapshot(snapshot):
+    print(f"调度策略: {snapshot['policy']}  名额: {snapshot['max_concurrent']}  "
+          f"interactive 预留: {snapshot['interactive_reserve']}")
+    for priority, stats in snapshot["classes"].items():
+        print(f"  {priority:<12} 已分配 {stats['granted']:>4}  排队峰值 {stats['peak_queued']:>3}  "
+              f"等待 p50 {stats['wait_p50']:.2f}s  p95 {stats['wait_p95']:.2f}s  最长 {stats['wait_max']:.2f}s")
+    for name, count in snapshot["tenants"].items():
+        print(f"    {name:<24} {count}")
+
+
+def run_demo(base_url, policy, slots, background, interactive):
+    """后台任务持续占满名额时，测量 interactive 请求的端到端延迟"""
+    scheduler = RequestScheduler(max_concurrent=slots, interactive_reserve=max(1, slots // 4), policy=policy)
+    session = ScheduledSession(scheduler)
+    headers = {"x-api-key": "mock-key", "anthropic-version": "2023-06-01", "content-type": "application/json"}
+
+    def post(query):
+        payload = {"model": "claude-3-5-haiku-20241022", "max_tokens": 256,
+                   "messages": [{"role": "user", "content": query}]}
+        return session.post(f"{base_url}/v1/messages", headers=headers, json=payload, timeout=60)
+
+    def background_worker(tenant, count):
+        with request_priority("background", tenant=tenant):
+            for i in range(count):
+                post(f"{tenant} 后台刷新 {i}")
+
+    latencies = []
+
+    def interactive_user():
+        for i in range(interactive):
+            started = time.monotonic()
+            post(f"交互查询 {i}")
+            latencies.append(time.monotonic() - started)
+            time.sleep(0.05)
+
+    # 两个后台租户各用若干线程持续提交请求
+    threads = [threading.Thread(target=background_worker, args=(tenant, background))
+               for tenant in ("batch", "prefetch") for _ in range(slots)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    interactive_user()
+    for thread in threads:
+        thread.join()
+
+    print_snapshot(scheduler.snapshot())
+    print(f"  interactive 端到端延迟 p50 {percentile(latencies, 50):.2f}s  p95 {percentile(latencies, 95):.2f}s")
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="请求优先级调度演示")
+    parser.add_argument("--slots", type=int, default=4, help="同时进行的请求数")
+    parser.add_argument("--background", type=int, default=6, help="每个后台线程提交的请求数")
+    parser.add_argument("--interactive", type=int, default=20, help="interactive 请求数")
+    args = parser.parse_args()
+
+    from mock_server import start_mock_server
+
+    _, base_url = start_mock_server(latency=0.2)
+    print("=" * 80)
+    print("无后台任务（基准）")
+    print("=" * 80)
+    run_demo(base_url, "priority", args.slots, 0, args.interactive)
+
+    for policy in ("fifo", "priority"):
+        print("\n" + "=" * 80)
+        print(f"后台任务运行中，调度策略: {policy}")
+        print("=" * 80)
+        run_demo(base_url, policy, args.slots, args.background, args.interactive)
+
+
+if __name__ == "__main__":
+    main()
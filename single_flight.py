@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+相同请求合并 (single-flight)
+多个用户或定时任务同时请求同一份新闻时，请求体完全相同的并发请求只向上游发送一次：
+第一个请求负责实际发送，其余请求等待并共享它的响应。
+上游响应边到达边解压、广播给所有等待者，流式请求 (stream=True / SSE) 也能同时收到每个分块。
+
+合并只发生在请求进行期间；请求结束后再来的相同请求会重新发送（结果缓存见 query_cache.py）。
+合并的键是 方法 + URL + 规范化后的 JSON 请求体 + 认证头的哈希。
+
+http_client.create_session() 默认挂载，设置 NEWS_SINGLE_FLIGHT=0 可关闭。
+与调度器 (scheduler.py) 一起使用时，只有领头请求在实际发送期间占用名额，跟随者不排队；
+领头请求的 response.elapsed 只计算拿到名额之后到收到响应头的时间，不含排队时间。
+
+用法：
+    python single_flight.py --clients 8      # 使用本地模拟服务演示 8 个并发的相同请求
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3._collections import HTTPHeaderDict
+
+CHUNK_SIZE = 8192
+
+# 只合并这些端点的请求
+COALESCE_PATHS = ("/v1/messages", "/v1/chat/completions")
+
+# 共享的是解压后的数据，不再分块传输，也不再有压缩编码和原始长度
+DROPPED_HEADERS = {"transfer-encoding", "connection", "keep-alive", "content-encoding", "content-length"}
+
+
+def _canonical_body(body):
+    if body is None:
+        return b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    try:
+        # 键的顺序和空白不同但内容相同的 JSON 视为同一请求
+        return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    except (TypeError, ValueError):
+        return bytes(body)
+
+
+def flight_key(request):
+    """请求的合并键"""
+    digest = hashlib.sha256()
+    digest.update(f"{request.method.upper()} {request.url}\n".encode("utf-8"))
+    for name in ("x-api-key", "authorization", "anthropic-version", "anthropic-beta"):
+        digest.update(f"{name}:{request.headers.get(name, '')}\n".encode("utf-8"))
+    digest.update(_canonical_body(request.body))
+    return digest.hexdigest()
+
+
+class _Flight:
+    """一次上游请求：响应头和逐步到达的数据，供所有等待者读取"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.head = None
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.waiters = 1
+
+    def set_head(self, status, reason, headers):
+        with self.cond:
+            self.head = (status, reason, headers)
+            self.cond.notify_all()
+
+    def feed(self, data):
+        with self.cond:
+            self.chunks.append(data)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+
+    def wait_head(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.head is not None or self.done, timeout=timeout):
+                error = requests.exceptions.ReadTimeout(f"等待合并的请求超时 ({timeout}s)")
+                # 领头请求仍在等待上游，超时由它记录
+                error.coalesced = True
+                raise error
+            if self.head is None:
+                raise self.error or requests.exceptions.ConnectionError("上游请求失败")
+            return self.head
+
+
+class _BroadcastRaw:
+    """
+    共享响应的 raw 对象，按顺序读取 _Flight 中已解压的数据，数据未到达时等待
+    提供 requests.Response 需要的 stream() / read() / close() 接口
+    """
+
+    def __init__(self, flight, status, reason, headers):
+        self._flight = flight
+        self._index = 0
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.closed = False
+
+    def _next_chunk(self):
+        flight = self._flight
+        with flight.cond:
+            flight.cond.wait_for(lambda: self._index < len(flight.chunks) or flight.done)
+            if self._index < len(flight.chunks):
+                data = flight.chunks[self._index]
+                self._index += 1
+                return data
+            if flight.error is not None:
+                raise requests.exceptions.ChunkedEncodingError(f"上游响应中断: {flight.error}")
+            return None
+
+    def stream(self, amt=CHUNK_SIZE, decode_content=True):
+        """逐块返回到达的数据，不等待凑满 amt 字节，保持流式的到达节奏"""
+        while not self.closed:
+            data = self._next_chunk()
+            if data is None:
+                break
+            step = amt or len(data)
+            for start in range(0, len(data), step):
+                yield data[start:start + step]
+        self.closed = True
+
+    def read(self, amt=None):
+        parts = []
+        size = 0
+        for data in self.stream(amt or CHUNK_SIZE):
+            parts.append(data)
+            size += len(data)
+            if amt is not None and size >= amt:
+                break
+        return b"".join(parts)
+
+    def close(self):
+        self.closed = True
+
+    def release_conn(self):
+        pass
+
+
+class SingleFlightAdapter(HTTPAdapter):
+    """合并相同的并发请求"""
+
+    # ScheduledSession 不在合并之前排队，由领头请求在实际发送时申请名额
+    defers_scheduling = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {"upstream": 0, "coalesced": 0}
+
+    def _should_coalesce(self, request):
+        path = request.path_url.split("?", 1)[0].rstrip("/")
+        return request.method == "POST" and path.endswith(COALESCE_PATHS)
+
+    def _pump(self, key, flight, response, release_slot=None):
+        """在后台读取上游响应，解压后逐块广播；读完后释放调度名额"""
+        try:
+            for data in response.raw.stream(CHUNK_SIZE, decode_content=True):
+                flight.feed(data)
+            flight.finish()
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            response.close()
+            if release_slot is not None:
+                release_slot()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if not self._should_coalesce(request):
+            return super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+
+        key = flight_key(request)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.stats["upstream"] += 1
+            else:
+                flight.waiters += 1
+                self.stats["coalesced"] += 1
+
+        if leader:
+            from scheduler import acquire_upstream_slot
+
+            release_slot = acquire_upstream_slot()
+            sent_at = time.perf_counter()
+            try:
+                upstream = super().send(request, stream=True, timeout=timeout,
+                                        verify=verify, cert=cert, proxies=proxies)
+                upstream_elapsed = timedelta(seconds=time.perf_counter() - sent_at)
+            except Exception as e:
+                if release_slot is not None:
+                    release_slot()
+                flight.finish(e)
+                with self._lock:
+                    self._flights.pop(key, None)
+                raise
+            if stream and release_slot is not None:
+                # 与调度器的约定一致：流式响应收到响应头后释放名额
+                release_slot()
+
+            headers = HTTPHeaderDict()
+            for name, value in upstream.raw.headers.items():
+                if name.lower() not in DROPPED_HEADERS:
+                    headers.add(name, value)
+            flight.set_head(upstream.status_code, upstream.reason, headers)
+            threading.Thread(target=self._pump, args=(key, flight, upstream, release_slot), daemon=True).start()
+        else:
+            read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+            flight.wait_head(read_timeout)
+
+        status, reason, headers = flight.head
+        raw = _BroadcastRaw(flight, status, reason, HTTPHeaderDict(headers))
+        response = self.build_response(request, raw)
+        # 共享的响应不重复计入模型延迟和 token 用量
+        response.coalesced = not leader
+        if leader:
+            response.upstream_elapsed = upstream_elapsed
+        if not stream:
+            response.content
+        return response
+
+
+def use_upstream_elapsed(response, *args, **kwargs):
+    """
+    响应钩子：Session.send 把适配器内的调度排队时间也算进了 elapsed，
+    换成领头请求实际发往上游的时间，之后的钩子（模型延迟、用量记录）才不会把排队当作模型延迟
+    """
+    upstream_elapsed = getattr(response, "upstream_elapsed", None)
+    if upstream_elapsed is not None:
+        response.elapsed = upstream_elapsed
+    return response
+
+
+def mount_single_flight(session, key_pool=None):
+    """在 session 上挂载合并适配器，返回适配器（可读取 stats）；key_pool 为密钥池时合并后实际发出的请求轮换密钥"""
+    if key_pool is None:
+        adapter = SingleFlightAdapter()
+    else:
+        from key_pool import pooled_adapter
+
+        adapter = pooled_adapter(SingleFlightAdapter, key_pool)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # 放在最前面，先于其他记录延迟的钩子执行
+    session.hooks["response"].insert(0, use_upstream_elapsed)
+    return adapter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="相同请求合并演示")
+    parser.add_argument("--clients", type=int, default=8, help="同时发送相同请求的客户端数")
+    args = parser.parse_args()
+
+    from mock_server import start_mock_server
+
+    server, base_url = start_mock_server(latency=1.0)
+    session = requests.Session()
+    adapter = mount_single_flight(session)
+    payload = {"model": "claude-3-5-haiku-20241022", "max_tokens": 1024,
+               "messages": [{"role": "user", "content": "最新5条重要国际新闻"}]}
+
+    results = [None] * args.clients
+
+    def worker(i):
+        started = time.monotonic()
+        response = session.post(f"{base_url}/v1/messages", json=payload, timeout=30)
+        results[i] = (response.status_code, time.monotonic() - started, response.json()["id"])
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{args.clients} 个相同的并发请求，总耗时 {time.monotonic() - started:.2f}s")
+    print(f"上游请求: {server.state.request_count}  合并: {adapter.stats['coalesced']}  "
+          f"不同的响应: {len({r[2] for r in results})}")
+
+
+if __name__ == "__main__":
+    main()
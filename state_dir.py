@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+运行时状态文件的位置
+归档 (archive/)、来源文章缓存 (article_cache/)、用量日志、模型注册表、查询缓存等默认保存在脚本所在目录；
+设置 NEWS_STATE_DIR 后保存到该目录。
+
+--mock 运行时 mock_server.start_mock_server() 会把 NEWS_STATE_DIR 指向一个临时目录，
+模拟的新闻、延迟和用量不会写进真实的状态文件，也不会被本地检索、路由和超时统计当作真实数据。
+需要在多次 --mock 运行之间保留模拟数据时，显式设置 NEWS_STATE_DIR 即可。
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def state_path(name):
+    """状态文件（或目录）name 的完整路径；每次调用时读取 NEWS_STATE_DIR"""
+    return os.path.join(os.environ.get("NEWS_STATE_DIR") or BASE_DIR, name)
+
+
+def use_temp_state_dir():
+    """未设置 NEWS_STATE_DIR 时改用新建的临时目录（进程退出时删除），返回实际使用的目录"""
+    if not os.environ.get("NEWS_STATE_DIR"):
+        path = tempfile.mkdtemp(prefix="news-mock-")
+        atexit.register(shutil.rmtree, path, ignore_errors=True)
+        os.environ["NEWS_STATE_DIR"] = path
+    return os.environ["NEWS_STATE_DIR"]
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+结构化新闻输出
+通过 tool use 强制模型调用 record_news 工具，按 JSON Schema 返回新闻记录
+（标题、摘要、涉及国家、来源 URL、发布时间），不再用正则解析自由文本。
+返回的记录会逐条校验，校验失败时把错误作为 tool_result 发回，请模型修正一次。
+
+用法：
+    python structured_news.py                          # 基于知识库
+    python structured_news.py --web-search             # 先用 web_search 搜索再记录
+    python structured_news.py --query "最新5条欧洲重要新闻" --web-search
+    python structured_news.py --mock
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+
+RECORD_NEWS_TOOL = {
+    "name": "record_news",
+    "description": "记录整理好的新闻列表。每条新闻必须包含标题、摘要、涉及国家、来源 URL 和发布时间。",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "news": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "title": {"type": "string", "description": "新闻标题（中文）"},
+                        "summary": {"type": "string", "description": "2-3 句话的简要内容（中文）"},
+                        "countries": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "涉及的国家或地区"
+                        },
+                        "source_urls": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "uri"},
+                            "description": "新闻来源链接"
+                        },
+                        "published_at": {
+                            "type": ["string", "null"],
+                            "description": "发布时间，ISO 8601 格式，未知时为 null"
+                        }
+                    },
+                    "required": ["title", "summary", "countries", "source_urls", "published_at"]
+                }
+            }
+        },
+        "required": ["news"]
+    }
+}
+
+STRUCTURED_SYSTEM_PROMPT = "你是一个国际新闻助手。整理好新闻后必须调用 record_news 工具提交结果，不要输出其他文本。"
+
+# 校验失败后请模型修正的次数
+MAX_REPAIRS = 1
+
+
+def build_structured_payload(query, web_search=False, model=None, max_uses=5):
+    """构建强制调用 record_news 工具的 /v1/messages 请求体"""
+    from model_router import choose_model
+
+    tools = [RECORD_NEWS_TOOL]
+    if web_search:
+        tools.insert(0, {"type": "web_search_20250305", "name": "web_search", "max_uses": max_uses})
+        source_hint = "请先使用 web_search 搜索，来源 URL 使用搜索结果中的真实链接。"
+    else:
+        source_hint = "请基于你的知识库回答，没有确切来源时 source_urls 为空列表。"
+
+    return {
+        "model": model or choose_model("web_search" if web_search else "knowledge",
+                                       max_latency=90 if web_search else 60),
+        "max_tokens": 4096,
+        "system": STRUCTURED_SYSTEM_PROMPT,
+        "messages": [
+            {
+                "role": "user",
+                "content": f"请提供{query}。{source_hint}"
+            }
+        ],
+        "tools": tools,
+        # 有 web_search 时允许先搜索，最终仍必须调用工具；否则直接强制 record_news
+        "tool_choice": {"type": "any"} if web_search else {"type": "tool", "name": "record_news"}
+    }
+
+
+def _is_url(value):
+    parts = urlsplit(value)
+    return parts.scheme in ("http", "https") and bool(parts.netloc)
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def validate_record(record):
+    """校验并规范化一条新闻记录，返回 (记录, 错误列表)"""
+    errors = []
+    if not isinstance(record, dict):
+        return None, ["记录不是对象"]
+
+    cleaned = {}
+    for field in ("title", "summary"):
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            errors.append(f"{field} 必须是非空字符串")
+        else:
+            cleaned[field] = value.strip()
+
+    countries = record.get("countries", [])
+    if not isinstance(countries, list) or not all(isinstance(c, str) for c in countries):
+        errors.append("countries 必须是字符串列表")
+        countries = []
+    cleaned["countries"] = list(dict.fromkeys(c.strip() for c in countries if c.strip()))
+
+    urls = record.get("source_urls", [])
+    if not isinstance(urls, list) or not all(isinstance(u, str) for u in urls):
+        errors.append("source_urls 必须是字符串列表")
+        urls = []
+    invalid = [u for u in urls if not _is_url(u.strip())]
+    if invalid:
+        errors.append(f"source_urls 中有无效链接: {', '.join(invalid[:3])}")
+    cleaned["source_urls"] = list(dict.fromkeys(u.strip() for u in urls if _is_url(u.strip())))
+
+    # 发布时间可选，格式不对时报告错误并按未知处理，不丢弃整条记录
+    published_at = record.get("published_at")
+    cleaned["published_at"] = None
+    if published_at in (None, ""):
+        pass
+    elif not isinstance(published_at, str):
+        errors.append("published_at 必须是 ISO 8601 字符串或 null")
+    else:
+        try:
+            cleaned["published_at"] = _parse_time(published_at.strip()).isoformat()
+        except ValueError:
+            errors.append(f"published_at 不是 ISO 8601 格式: {published_at}")
+
+    return cleaned, errors
+
+
+def validate_news(records):
+    """校验新闻记录列表，返回 (有效记录, 错误列表)"""
+    if not isinstance(records, list):
+        return [], ["news 必须是列表"]
+
+    valid = []
+    errors = []
+    for i, record in enumerate(records, 1):
+        cleaned, record_errors = validate_record(record)
+        if record_errors:
+            errors.extend(f"第 {i} 条: {error}" for error in record_errors)
+        if cleaned and "title" in cleaned and "summary" in cleaned:
+            valid.append(cleaned)
+    return valid, errors
+
+
+def find_record_call(result):
+    """找到响应中的 record_news 工具调用"""
+    for item in result.get("content", []):
+        if item.get("type") == "tool_use" and item.get("name") == "record_news":
+            return item
+    return None
+
+
+# 文本输出中的字段名（翻译后的记录使用对应语言的字段名，见 multilingual_news.py）
+RENDER_LABELS = {"countries": "涉及国家: ", "separator": "、", "published_at": "发布时间: ", "source": "来源："}
+
+
+def render_records(records, labels=None):
+    """把新闻记录转换为文本，格式与其他脚本的输出一致"""
+    labels = labels or RENDER_LABELS
+    lines = []
+    for i, record in enumerate(records, 1):
+        lines.append(f"{i}. **{record['title']}**")
+        lines.append(f"   {record['summary']}")
+        if record["countries"]:
+            lines.append(f"   {labels['countries']}{labels['separator'].join(record['countries'])}")
+        if record.get("published_at"):
+            lines.append(f"   {labels['published_at']}{record['published_at']}")
+        for url in record["source_urls"]:
+            lines.append(f"   {labels['source']}{url}")
+        lines.append("")
+    return "\n".join(lines).strip()
+
+
+def request_structured_news(query, web_search=False, model=None, timeout=None):
+    """
+    请求结构化新闻，返回 (有效记录, 错误列表, 最后一次响应)
+    记录中有错误时把错误作为 tool_result 发回，请模型重新调用 record_news
+    """
+    from adaptive_timeout import request_timeout
+    from config import API_KEY, API_BASE_URL
+    from http_client import get_session
+
+    url = f"{API_BASE_URL}/v1/messages"
+    headers = {
+        "x-api-key": API_KEY,
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json"
+    }
+    data = build_structured_payload(query, web_search=web_search, model=model)
+    timeout = timeout or request_timeout("/v1/messages", data, default=90 if web_search else 60)
+    print(f"模型: {data['model']}")
+
+    records, errors, result = [], ["没有调用 record_news 工具"], {}
+    repairs = 0
+    while True:
+        response = get_session().post(url, headers=headers, json=data, timeout=timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"请求失败: {response.status_code} {response.text[:300]}")
+        result = response.json()
+
+        call = find_record_call(result)
+        if call is None:
+            records, errors = [], [f"没有调用 record_news 工具 (stop_reason={result.get('stop_reason')})"]
+            # web_search 模式下 tool_choice 为 any，模型可能只调用了 web_search 就结束；
+            # 保留已付费的搜索结果，强制调用 record_news 再请求一次（不占用修正次数）
+            if not result.get("content") or data["tool_choice"]["type"] == "tool":
+                break
+            print("⚠️  模型没有调用 record_news，要求根据已有结果记录")
+            data = dict(data)
+            data["messages"] = list(data["messages"]) + [
+                {"role": "assistant", "content": result["content"]},
+                {"role": "user", "content": "请根据上面的搜索结果调用 record_news 记录新闻。"}
+            ]
+            data["tool_choice"] = {"type": "tool", "name": "record_news"}
+            continue
+
+        records, errors = validate_news(call.get("input", {}).get("news"))
+        if not errors or repairs == MAX_REPAIRS:
+            break
+        repairs += 1
+
+        print(f"⚠️  {len(errors)} 处校验错误，请模型修正")
+        # 复用已有的搜索结果和工具调用，只要求修正记录
+        data = dict(data)
+        data["messages"] = list(data["messages"]) + [
+            {"role": "assistant", "content": result["content"]},
+            {"role": "user", "content": [{
+                "type": "tool_result",
+                "tool_use_id": call["id"],
+                "is_error": True,
+                "content": "记录校验失败，请修正后重新调用 record_news：\n" + "\n".join(errors)
+            }]}
+        ]
+        data["tool_choice"] = {"type": "tool", "name": "record_news"}
+
+    return records, errors, result
+
+
+def get_structured_news(query="最新5条重要国际新闻", web_search=False, model=None):
+    """获取结构化新闻，保存并归档，成功返回记录列表"""
+    from news_archive import archive_entry, extract_digest
+    from usage_tracker import format_usage
+
+    print("=" * 80)
+    print(f"结构化新闻: {query}（{'web_search' if web_search else '知识库'}）")
+    print("=" * 80)
+
+    try:
+        records, errors, result = request_structured_news(query, web_search=web_search, model=model)
+    except (RuntimeError, requests.exceptions.RequestException) as e:
+        print(f"❌ {e}")
+        return None
+
+    print(f"用量: {format_usage(result.get('usage'))}")
+    for error in errors:
+        print(f"⚠️  {error}")
+    if not records:
+        print("❌ 没有有效的新闻记录")
+        return None
+
+    text = render_records(records)
+    print(f"\n📰 {len(records)} 条新闻记录:\n")
+    print(text)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    json_file = f"news_structured_{timestamp}.json"
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump({"query": query, "news": records, "errors": errors}, f, indent=2, ensure_ascii=False)
+    print(f"\n✓ 已保存到 {json_file}")
+
+    digest = extract_digest(result)
+    entry = archive_entry(query, text, digest["search_results"], source="structured",
+                          records=records, model=digest["model"], usage=digest["usage"])
+    print(f"✓ 已归档 ({entry['id']})")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="结构化新闻输出")
+    parser.add_argument("--query", default="最新5条重要国际新闻", help="查询内容")
+    parser.add_argument("--web-search", action="store_true", help="先使用 web_search 搜索")
+    parser.add_argument("--model", help="指定模型（默认自动选择）")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟服务")
+    args = parser.parse_args()
+
+    if args.mock:
+        from mock_server import start_mock_server
+
+        _, base_url = start_mock_server()
+        os.environ["API_BASE_URL"] = base_url
+        os.environ.setdefault("API_KEY", "mock-key")
+
+    records = get_structured_news(args.query, web_search=args.web_search, model=args.model)
+    if not records:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Token 用量统计
+通过共享 Session 的响应钩子记录每次请求 usage 中的输入/输出 token，
+以及 prompt caching 的缓存写入 (cache_creation_input_tokens) 和缓存读取 (cache_read_input_tokens)。
+读超时和网关超时 (504 / 524) 也记录一条（error 字段），延迟按已等待的时间计，
+自适应超时 (adaptive_timeout.py) 据此知道有请求比当前超时更慢。
+
+用法：
+    python usage_tracker.py          # 按端点 / 模型汇总
+    python usage_tracker.py --last 20
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import requests
+
+USAGE_LOG = "usage_log.jsonl"
+
+_lock = threading.Lock()
+
+
+def normalize_usage(usage):
+    """统一 Messages 和 Chat Completions 两种格式的 usage 字段"""
+    usage = usage or {}
+    if "prompt_tokens" in usage:
+        details = usage.get("prompt_tokens_details") or {}
+        return {
+            "input_tokens": usage.get("prompt_tokens", 0),
+            "output_tokens": usage.get("completion_tokens", 0),
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": details.get("cached_tokens", 0) or 0
+        }
+    return {
+        "input_tokens": usage.get("input_tokens", 0) or 0,
+        "output_tokens": usage.get("output_tokens", 0) or 0,
+        "cache_creation_input_tokens": usage.get("cache_creation_input_tokens", 0) or 0,
+        "cache_read_input_tokens": usage.get("cache_read_input_tokens", 0) or 0
+    }
+
+
+def format_usage(usage):
+    """用于脚本输出的一行 usage 说明"""
+    u = normalize_usage(usage)
+    text = f"输入 {u['input_tokens']} / 输出 {u['output_tokens']} tokens"
+    if u["cache_creation_input_tokens"] or u["cache_read_input_tokens"]:
+        text += f"（缓存写入 {u['cache_creation_input_tokens']}，缓存读取 {u['cache_read_input_tokens']}）"
+    return text
+
+
+def task_key(system):
+    """
+    任务标识：system 提示词的短哈希，没有 system 时为空字符串
+    同一端点上的知识库、翻译、汇总、本地回答等请求用它区分
+    system 可以是字符串或 Messages 格式的文本块列表
+    """
+    if isinstance(system, list):
+        system = "".join(block.get("text", "") for block in system if isinstance(block, dict))
+    if not system:
+        return ""
+    return hashlib.sha256(system.encode("utf-8")).hexdigest()[:12]
+
+
+def payload_task_key(payload):
+    """请求体的任务标识（Messages 的 system 字段，或 Chat Completions 的 system 消息）"""
+    system = payload.get("system")
+    if system is None:
+        system = next((message.get("content") for message in payload.get("messages", [])
+                       if message.get("role") == "system"), None)
+    return task_key(system)
+
+
+def record_usage(endpoint, model, usage, latency=None, tools=None, stop_reason=None,
+                 continuation=False, path=None, task="", error=None):
+    """
+    追加一条用量记录，continuation 表示该请求是截断后的续写，task 见 task_key()
+    error 不为空时表示请求没有正常完成（例如 "timeout"），latency 是已等待的时间（实际延迟至少这么长）
+    """
+    from state_dir import state_path
+
+    path = path or state_path(USAGE_LOG)
+    entry = {
+        "time": time.time(),
+        "endpoint": endpoint,
+        "model": model,
+        "tools": tools or [],
+        "task": task,
+        "latency": round(latency, 3) if latency is not None else None,
+        "stop_reason": stop_reason,
+        "continuation": continuation
+    }
+    entry.update(normalize_usage(usage))
+    if error:
+        entry["error"] = error
+
+    with _lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return entry
+
+
+def load_usage(path=None):
+    from state_dir import state_path
+
+    path = path or state_path(USAGE_LOG)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    return entries
+
+
+def summarize(entries):
+    """按 (端点, 模型) 汇总用量"""
+    groups = defaultdict(lambda: defaultdict(float))
+    for entry in entries:
+        group = groups[(entry["endpoint"], entry["model"])]
+        group["requests"] += 1
+        if entry.get("error"):
+            group["timeouts"] += 1
+            continue
+        for field in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+            group[field] += entry.get(field, 0) or 0
+        if entry.get("latency") is not None:
+            group["latency_total"] += entry["latency"]
+            group["latency_count"] += 1
+    return groups
+
+
+def _request_fields(request):
+    """从请求中取出 (端点, 请求体)；不是需要记录的端点时返回 (None, None)"""
+    endpoint = request.url.rstrip("/").rsplit("/v1/", 1)[-1]
+    if request.method != "POST" or endpoint not in ("messages", "chat/completions"):
+        return None, None
+    try:
+        return f"/v1/{endpoint}", json.loads(request.body or b"{}")
+    except (TypeError, ValueError):
+        return None, None
+
+
+def _payload_tools(payload):
+    return [tool.get("type") or tool.get("name") for tool in payload.get("tools", [])]
+
+
+# 网关超时：中转服务等待上游超过自己的时限，模型的实际延迟至少是已等待的时间
+GATEWAY_TIMEOUT_STATUS = (504, 524)
+
+
+def record_timeout(request, waited):
+    """记录一次超时的请求，waited 为已等待的秒数"""
+    endpoint, payload = _request_fields(request)
+    if endpoint is None:
+        return
+    record_usage(endpoint, payload.get("model"), {}, latency=waited, tools=_payload_tools(payload),
+                 task=payload_task_key(payload), error="timeout")
+
+
+class TimeoutRecordingMixin:
+    """
+    Session 混入类：读超时不会产生响应、响应钩子看不到，在这里按读超时记录一条超时样本
+    （流式请求的读超时是空闲超时，与总延迟无关，不记录）
+    """
+
+    def send(self, request, **kwargs):
+        try:
+            return super().send(request, **kwargs)
+        except requests.exceptions.ReadTimeout as e:
+            timeout = kwargs.get("timeout")
+            read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+            # 合并的请求共享领头请求的异常，同一次超时只记录一次
+            if read_timeout and not kwargs.get("stream") and not getattr(e, "coalesced", False) \
+                    and not getattr(e, "recorded", False):
+                e.recorded = True
+                record_timeout(request, read_timeout)
+            raise
+
+
+def record_response(response, *args, **kwargs):
+    """
+    requests 响应钩子：记录 /v1/messages 和 /v1/chat/completions 成功响应中的 usage
+    流式请求不在这里读取正文
+    """
+    request = response.request
+    if getattr(response, "coalesced", False):
+        # 合并的请求共享同一次上游调用，只记录一次
+        return response
+    if response.status_code in GATEWAY_TIMEOUT_STATUS and not kwargs.get("stream"):
+        record_timeout(request, response.elapsed.total_seconds())
+        return response
+    if kwargs.get("stream") or response.status_code != 200:
+        return response
+
+    endpoint, payload = _request_fields(request)
+    if endpoint is None:
+        return response
+    try:
+        result = response.json()
+    except ValueError:
+        return response
+
+    if "usage" in result:
+        stop_reason = result.get("stop_reason")
+        if stop_reason is None and result.get("choices"):
+            stop_reason = result["choices"][0].get("finish_reason")
+        messages = payload.get("messages") or [{}]
+        record_usage(endpoint, payload.get("model"), result["usage"],
+                     latency=response.elapsed.total_seconds(), tools=_payload_tools(payload), stop_reason=stop_reason,
+                     continuation=messages[-1].get("role") == "assistant", task=payload_task_key(payload))
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token 用量统计")
+    parser.add_argument("--last", type=int, help="只统计最近 N 条记录")
+    args = parser.parse_args()
+
+    entries = load_usage()
+    if args.last:
+        entries = entries[-args.last:]
+
+    if not entries:
+        print("没有用量记录")
+        return
+
+    print(f"用量记录: {len(entries)} 条，"
+          f"{datetime.fromtimestamp(entries[0]['time']).strftime('%Y-%m-%d %H:%M')} ~ "
+          f"{datetime.fromtimestamp(entries[-1]['time']).strftime('%Y-%m-%d %H:%M')}")
+    print("=" * 80)
+
+    for (endpoint, model), group in sorted(summarize(entries).items(), key=lambda item: str(item[0])):
+        cached = group["cache_read_input_tokens"]
+        total_input = group["input_tokens"] + group["cache_creation_input_tokens"] + cached
+        hit_ratio = cached / total_input if total_input else 0
+        avg_latency = group["latency_total"] / group["latency_count"] if group["latency_count"] else 0
+
+        print(f"{endpoint}  {model}")
+        print(f"   请求: {int(group['requests'])}  超时: {int(group['timeouts'])}  平均延迟: {avg_latency:.1f}s")
+        print(f"   输入: {int(group['input_tokens'])}  输出: {int(group['output_tokens'])}  "
+              f"缓存写入: {int(group['cache_creation_input_tokens'])}  缓存读取: {int(cached)}  "
+              f"缓存命中率: {hit_ratio * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()